@@ -0,0 +1,262 @@
+"""
+Async Logger for NaviGlass
+Structured logging that stays off the hot path. Callers only filter by level,
+check a per-event rate limit and append a tuple to a bounded queue; a background
+thread formats records and writes them in batches. Per-frame numbers (inference
+time, FPS, distances) are not logged one by one but aggregated and summarised
+every few seconds as count / p50 / p95 / max.
+
+Output is one line per record, logfmt by default (readable in journalctl) or
+JSON lines. The level can be changed at runtime, e.g. from the web API.
+"""
+
+import atexit
+import json
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, TextIO, Tuple
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+
+def parse_level(level) -> int:
+    if isinstance(level, int):
+        return level
+    try:
+        return LEVELS[str(level).upper()]
+    except KeyError:
+        raise ValueError(f"Unknown log level {level!r}, expected one of {', '.join(LEVELS)}")
+
+
+class AsyncLogger:
+
+    def __init__(self, level="INFO", stream: Optional[TextIO] = None, fmt: str = "text",
+                 queue_size: int = 2048, aggregate_window: float = 5.0, default_rate_limit: float = 0.0):
+        self.level = parse_level(level)
+        self.stream = stream # None means whatever sys.stdout is at write time
+        self.fmt = fmt # "text" (logfmt) or "json"
+        self.aggregate_window = aggregate_window
+        self.default_rate_limit = default_rate_limit # Seconds between records of one event, 0 = unlimited
+
+        self._queue = deque(maxlen=queue_size) # Oldest records are dropped if the writer falls behind
+        self._wake = threading.Event()
+        self._limits: Dict[str, float] = {}
+        self._last_emit: Dict[str, float] = {}
+        self._suppressed: Dict[str, int] = {}
+        self._samples: Dict[str, List[float]] = {}
+        self._samples_lock = threading.Lock() # A sample appended during the window swap would be lost
+        self._window_start = time.monotonic()
+
+        self.written = 0
+        self.dropped = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="async-logger")
+        self._thread.start()
+        atexit.register(self.stop)
+
+
+    # --- Producer side, called from the hot paths ---
+
+    def set_level(self, level):
+        self.level = parse_level(level)
+
+
+    def level_name(self) -> str:
+        return LEVEL_NAMES.get(self.level, str(self.level))
+
+
+    def set_rate_limit(self, event: str, interval: float):
+        """At most one record of `event` per interval seconds; the rest are counted and reported."""
+        self._limits[event] = interval
+
+
+    def log(self, level: int, event: str, **fields):
+        if level < self.level:
+            return
+        interval = self._limits.get(event, self.default_rate_limit)
+        now = time.monotonic()
+        if interval:
+            if now - self._last_emit.get(event, -interval) < interval:
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return
+            self._last_emit[event] = now
+            suppressed = self._suppressed.pop(event, 0)
+            if suppressed:
+                fields["suppressed"] = suppressed
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append((time.time(), level, event, fields))
+        if level >= WARNING:
+            self._wake.set() # Problems go out promptly, the rest waits for the next batch
+
+
+    # The level is checked here too, so a filtered call returns before log() re-packs the fields
+
+    def debug(self, event: str, **fields):
+        if DEBUG >= self.level:
+            self.log(DEBUG, event, **fields)
+
+
+    def info(self, event: str, **fields):
+        if INFO >= self.level:
+            self.log(INFO, event, **fields)
+
+
+    def warning(self, event: str, **fields):
+        if WARNING >= self.level:
+            self.log(WARNING, event, **fields)
+
+
+    def error(self, event: str, **fields):
+        if ERROR >= self.level:
+            self.log(ERROR, event, **fields)
+
+
+    def observe(self, name: str, value: float):
+        """Add a sample to the current aggregation window instead of logging it."""
+        with self._samples_lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = []
+            samples.append(value)
+
+
+    # --- Writer side ---
+
+    def _summaries(self) -> List[Tuple[float, int, str, Dict]]:
+        with self._samples_lock:
+            samples, self._samples = self._samples, {} # Swap, producers start a fresh window
+        window = time.monotonic() - self._window_start
+        self._window_start = time.monotonic()
+        out = []
+        for name, values in sorted(samples.items()):
+            if not values:
+                continue
+            values = sorted(values)
+            n = len(values)
+            out.append((time.time(), INFO, f"{name}_summary", {
+                "window_s": round(window, 1),
+                "count": n,
+                "p50": round(values[n // 2], 2),
+                "p95": round(values[min(n - 1, int(n * 0.95))], 2),
+                "max": round(values[-1], 2),
+            }))
+        return out
+
+
+    def _format(self, record: Tuple[float, int, str, Dict]) -> str:
+        ts, level, event, fields = record
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(ts)) + f".{int(ts * 1000) % 1000:03d}"
+        if self.fmt == "json":
+            return json.dumps({"ts": stamp, "level": LEVEL_NAMES.get(level, level), "event": event, **fields},
+                              default=str)
+        parts = [stamp, LEVEL_NAMES.get(level, str(level)), event]
+        for key, value in fields.items():
+            if isinstance(value, float):
+                value = round(value, 3)
+            text = str(value)
+            if not text or " " in text or '"' in text or "=" in text:
+                text = json.dumps(text) # Quote so the line stays machine-parseable
+            parts.append(f"{key}={text}")
+        return " ".join(parts)
+
+
+    def flush(self):
+        records = []
+        while self._queue:
+            try:
+                records.append(self._queue.popleft())
+            except IndexError:
+                break
+        if time.monotonic() - self._window_start >= self.aggregate_window:
+            if self.level <= INFO:
+                records.extend(self._summaries())
+            else:
+                with self._samples_lock:
+                    self._samples = {}
+                self._window_start = time.monotonic()
+        if not records:
+            return
+        stream = self.stream or sys.stdout
+        try:
+            stream.write("\n".join(self._format(r) for r in records) + "\n") # One write per batch
+            stream.flush()
+            self.written += len(records)
+        except Exception:
+            pass # Logging must never take the device down
+
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(timeout=min(1.0, self.aggregate_window))
+            self._wake.clear()
+            self.flush()
+
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join(timeout=1)
+        self.flush()
+
+
+    def stats(self) -> Dict:
+        return {
+            "level": self.level_name(),
+            "format": self.fmt,
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "suppressed": dict(self._suppressed),
+            "rate_limits": dict(self._limits),
+        }
+
+
+
+LOG = AsyncLogger() # Shared by every module in this process
+
+
+if __name__ == "__main__":
+    # Cost on the calling thread: a filtered call, a queued record and an aggregated sample, versus print()
+    import io
+    import os
+
+    n = 100000
+    logger = AsyncLogger(level="INFO", stream=io.StringIO())
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        logger.debug("inference", ms=12.5, fps=9.8)
+    filtered = (time.perf_counter() - t0) / n * 1e9
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        logger.info("inference", ms=12.5, fps=9.8)
+    queued = (time.perf_counter() - t0) / n * 1e9
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        logger.observe("inference_ms", 12.5)
+    observed = (time.perf_counter() - t0) / n * 1e9
+    logger.stop()
+
+    with open(os.devnull, "w") as devnull:
+        t0 = time.perf_counter()
+        for i in range(n):
+            print(f"Inference time: {12.5:.2f} ms, FPS: {9.8:.2f}", file=devnull, flush=True)
+        printed = (time.perf_counter() - t0) / n * 1e9
+
+    print(f"filtered debug(): {filtered:6.0f} ns")
+    print(f"queued info():    {queued:6.0f} ns ({logger.dropped} dropped by the bounded queue)")
+    print(f"observe():        {observed:6.0f} ns")
+    print(f"print() + flush:  {printed:6.0f} ns to /dev/null (a terminal or journald pipe is slower)")
@@ -0,0 +1,158 @@
+"""
+Audio Output for NaviGlass
+Speech behind one interface with a queue and a worker thread, so speak() never
+blocks the main loop. An urgent sentence interrupts: the queue is cleared and
+whatever is playing is cut off. EspeakAudio speaks through espeak-ng on the
+glasses (over the Bluetooth sink once connected); SimulatedAudio only holds
+each sentence for as long as it would take to say and keeps a log of what was
+said, for runs without a sound card.
+
+Both record into the naviglass_tts_queue_wait_seconds and
+naviglass_tts_playback_seconds histograms. A sentence caused by a frame records
+its frame_to_speech reaction when playback starts, queue wait included.
+"""
+
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from typing import List, Optional, Tuple
+from MetricsRegistry import METRICS
+from LatencyTracer import TRACER
+
+
+TTS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+
+class AudioOutput:
+
+    def __init__(self):
+        self._queue: "queue.Queue[Tuple[float, Optional[str], bool, int, int]]" = queue.Queue()
+        self._thread = None
+        self._running = False
+        self.speaking = False
+        self.interrupted = 0
+        self._m_queue_wait = METRICS.histogram("naviglass_tts_queue_wait_seconds",
+                                               "Time a sentence waited before playback", buckets=TTS_BUCKETS)
+        self._m_playback = METRICS.histogram("naviglass_tts_playback_seconds", "Time spent speaking one sentence",
+                                             buckets=TTS_BUCKETS)
+
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="audio-output")
+        self._thread.start()
+
+
+    def speak(self, text: str, interrupt: bool = False, frame_id: int = -1, capture_ns: int = 0):
+        """Queue text. frame_id / capture_ns tie it to the frame that caused it, for the latency trace."""
+        if interrupt:
+            self._clear()
+            if self.speaking:
+                self.interrupted += 1
+                self._cancel()
+        self._queue.put((time.monotonic(), text, interrupt, frame_id, capture_ns))
+
+
+    def _clear(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+    def _run(self):
+        while self._running:
+            try:
+                queued, text, urgent, frame_id, capture_ns = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if text is None:
+                break
+            started = time.monotonic()
+            self._m_queue_wait.observe(started - queued)
+            TRACER.reaction("speech", frame_id, capture_ns, {"urgent": urgent}) # Speech starts now
+            self.speaking = True
+            try:
+                self._play(text)
+            except Exception as e:
+                print(f"Speech failed: {e}")
+            finally:
+                self.speaking = False
+            self._m_playback.observe(time.monotonic() - started)
+
+
+    def _play(self, text: str):
+        """Say text, blocking until done or cancelled."""
+        raise NotImplementedError
+
+
+    def _cancel(self):
+        pass
+
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._clear()
+        self._cancel()
+        self._queue.put((time.monotonic(), None, False, -1, 0))
+        self._thread.join(timeout=2)
+
+
+
+class EspeakAudio(AudioOutput):
+
+    def __init__(self, volume: float = 0.5, rate: int = 170, voice: str = "en"):
+        super().__init__()
+        self.volume = volume
+        self.rate = rate
+        self.voice = voice
+        self.command = shutil.which("espeak-ng") or shutil.which("espeak") or "espeak-ng"
+        self._proc: Optional[subprocess.Popen] = None
+
+
+    def _play(self, text: str):
+        amplitude = str(int(max(0.0, min(1.0, self.volume)) * 200)) # espeak amplitude runs 0-200
+        self._proc = subprocess.Popen([self.command, "-v", self.voice, "-s", str(self.rate), "-a", amplitude, text],
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._proc.wait()
+        self._proc = None
+
+
+    def _cancel(self):
+        proc = self._proc
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+
+
+
+class SimulatedAudio(AudioOutput):
+
+    def __init__(self, words_per_minute: float = 170, realtime: bool = True):
+        super().__init__()
+        self.words_per_minute = words_per_minute
+        self.realtime = realtime # False returns at once, for replays that run faster than speech
+        self.spoken: List[Tuple[float, str, float]] = [] # (time.monotonic(), text, seconds it would take)
+        self._cancelled = threading.Event()
+
+
+    def duration(self, text: str) -> float:
+        return 0.3 + len(text.split()) * 60.0 / self.words_per_minute
+
+
+    def _play(self, text: str):
+        seconds = self.duration(text)
+        self.spoken.append((time.monotonic(), text, seconds))
+        self._cancelled.clear()
+        if self.realtime:
+            self._cancelled.wait(seconds)
+
+
+    def _cancel(self):
+        self._cancelled.set()
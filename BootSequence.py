@@ -0,0 +1,201 @@
+"""
+Boot Sequence for NaviGlass
+Times every startup phase from the moment the process was created, tracks
+which subsystems are ready, and runs the slow ones (camera, model load and
+warm-up, Bluetooth) on background threads so the web server, ranging and
+motors come up first. Phases go to the log as a boot timeline, to /api/trace on
+a "boot" track and to /api/metrics; /api/ready reports per-subsystem state.
+
+Milestones such as the first haptic output are recorded once, as seconds since
+process start, so time-to-first-haptic can be compared across releases.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+from MetricsRegistry import METRICS
+from LatencyTracer import TRACER
+from AsyncLogger import LOG
+
+
+PENDING = "pending"
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def process_start_ns() -> int:
+    """time.monotonic_ns() at which this process was created, so imports count towards boot time."""
+    now = time.monotonic_ns()
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split() # Command name may contain spaces
+        started_ticks = int(fields[19]) # starttime, clock ticks since boot
+        since_boot = time.clock_gettime_ns(time.CLOCK_BOOTTIME) - started_ticks * 1_000_000_000 // os.sysconf("SC_CLK_TCK")
+        if 0 <= since_boot < 3600 * 1_000_000_000:
+            return now - since_boot
+    except Exception:
+        pass
+    return now # Not Linux: count from the first import of this module instead
+
+
+
+class BootSequence:
+
+    def __init__(self, subsystems: Iterable[str] = (), optional: Iterable[str] = (),
+                 start_ns: Optional[int] = None):
+        self.start_ns = start_ns if start_ns is not None else process_start_ns()
+        self.optional = set(optional) # Not waited for by ready(), e.g. Bluetooth
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict] = {}
+        self._phases: List[Dict] = []
+        self._milestones: Dict[str, float] = {}
+        self._completed = False
+        for name in subsystems:
+            self.register(name)
+
+
+    def since_start(self, t_ns: Optional[int] = None) -> float:
+        return ((t_ns if t_ns is not None else time.monotonic_ns()) - self.start_ns) / 1e9
+
+
+    def register(self, name: str, optional: bool = False):
+        with self._lock:
+            self._state.setdefault(name, {"state": PENDING})
+        if optional:
+            self.optional.add(name)
+
+
+    def _set(self, name: str, state: str, **fields):
+        with self._lock:
+            entry = self._state.setdefault(name, {})
+            entry.update(state=state, **fields)
+
+
+    # --- Phases ---
+
+    @contextmanager
+    def phase(self, name: str, subsystem: Optional[str] = None):
+        """Time a block. With subsystem, it is marked ready when the block succeeds and failed if it raises."""
+        if subsystem:
+            self._set(subsystem, STARTING)
+        started = time.monotonic_ns()
+        try:
+            yield
+        except Exception as e:
+            self.record(name, started, time.monotonic_ns(), subsystem, e)
+            raise
+        self.record(name, started, time.monotonic_ns(), subsystem)
+
+
+    def record(self, name: str, started: int, finished: int, subsystem: Optional[str] = None,
+               error: Optional[Exception] = None):
+        """Add a phase that was timed elsewhere, e.g. interpreter start and imports."""
+        seconds = (finished - started) / 1e9
+        record = {"phase": name, "start_s": round(self.since_start(started), 3), "seconds": round(seconds, 3),
+                  "thread": threading.current_thread().name, "ok": error is None}
+        with self._lock:
+            self._phases.append(record)
+        METRICS.gauge("naviglass_boot_phase_seconds", "Duration of each boot phase", {"phase": name}).set(seconds)
+        TRACER.span(name, started, finished, track="boot", args={"ok": error is None})
+        if error is None:
+            LOG.info("boot_phase", phase=name, ms=round(seconds * 1000, 1), at_s=record["start_s"])
+        else:
+            LOG.error("boot_phase_failed", phase=name, ms=round(seconds * 1000, 1), error=repr(error))
+        if subsystem:
+            if error is None:
+                self.ready(subsystem)
+            else:
+                self.fail(subsystem, error)
+
+
+    def ready(self, name: str):
+        at = self.since_start()
+        self._set(name, READY, at_s=round(at, 3))
+        METRICS.gauge("naviglass_boot_ready_seconds", "Seconds from process start until a subsystem was ready",
+                      {"subsystem": name}).set(at)
+        self._check_complete()
+
+
+    def fail(self, name: str, error):
+        self._set(name, FAILED, at_s=round(self.since_start(), 3), error=str(error))
+        self._check_complete()
+
+
+    def skip(self, name: str, reason: str = ""):
+        self._set(name, SKIPPED, reason=reason)
+        self._check_complete()
+
+
+    def run_background(self, name: str, fn: Callable[[], None]) -> threading.Thread:
+        """Run a boot step on its own thread; fn marks its subsystems itself via phase()."""
+        def target():
+            try:
+                fn()
+            except Exception as e:
+                LOG.error("boot_step_failed", step=name, error=repr(e))
+        thread = threading.Thread(target=target, daemon=True, name=f"boot-{name}")
+        thread.start()
+        return thread
+
+
+    # --- Milestones ---
+
+    def milestone(self, name: str) -> Optional[float]:
+        """Record the first time something happened (e.g. "first_haptic"). Later calls are ignored."""
+        if name in self._milestones:
+            return None
+        at = self.since_start()
+        with self._lock:
+            if name in self._milestones:
+                return None
+            self._milestones[name] = at
+        METRICS.gauge(f"naviglass_boot_{name}_seconds", f"Seconds from process start to {name.replace('_', ' ')}").set(at)
+        LOG.info("boot_milestone", milestone=name, at_s=round(at, 3))
+        return at
+
+
+    # --- Readiness ---
+
+    def is_ready(self, name: str) -> bool:
+        return self._state.get(name, {}).get("state") == READY
+
+
+    def all_ready(self) -> bool:
+        return all(entry.get("state") == READY for name, entry in list(self._state.items())
+                   if name not in self.optional)
+
+
+    def _check_complete(self):
+        with self._lock:
+            if self._completed:
+                return
+            settled = all(entry.get("state") in (READY, FAILED, SKIPPED) for entry in self._state.values())
+            if not settled:
+                return
+            self._completed = True
+        total = self.since_start()
+        METRICS.gauge("naviglass_boot_seconds", "Seconds from process start until every subsystem settled").set(total)
+        LOG.info("boot_complete", seconds=round(total, 3),
+                 timeline=" ".join(f"{p['phase']}@{p['start_s']}+{p['seconds']}" for p in self.timeline()))
+
+
+    def timeline(self) -> List[Dict]:
+        with self._lock:
+            return sorted(self._phases, key=lambda p: p["start_s"])
+
+
+    def status(self) -> Dict:
+        with self._lock:
+            subsystems = {name: dict(entry) for name, entry in self._state.items()}
+            milestones = {name: round(at, 3) for name, at in self._milestones.items()}
+        return {
+            "ready": self.all_ready(),
+            "uptime_s": round(self.since_start(), 3),
+            "subsystems": subsystems,
+            "milestones": milestones,
+            "timeline": self.timeline(),
+        }
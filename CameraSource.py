@@ -0,0 +1,202 @@
+"""
+Camera Source for NaviGlass
+Camera abstraction that hands the detector two streams: a low-resolution
+"lores" image at the model's input size for inference, scaled by the ISP rather
+than by ultralytics on the CPU, and an optional full-size "main" image used only
+for the MJPEG view. With hardware_jpeg the display stream is also encoded by
+the Pi's MJPEG encoder, so the stream can be passed to viewers without a CPU
+encode. SimulatedCamera produces the same frames off-device.
+"""
+
+import time
+import cv2
+import numpy as np
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class CameraFrame(NamedTuple):
+    lores: np.ndarray            # BGR image at the inference size
+    main: Optional[np.ndarray]   # BGR display image, None in headless mode or when not requested
+    timestamp: float             # time.time() when the frame was captured
+    metadata: Dict
+    jpeg: Optional[bytes] = None # Camera-encoded display frame, when a hardware encoder is running
+    capture_ns: int = 0          # time.monotonic_ns() the sensor captured it (SensorTimestamp when available)
+
+
+class CameraSource:
+
+    def start(self):
+        pass
+
+
+    def stop(self):
+        pass
+
+
+    def capture(self, want_main: bool = True) -> CameraFrame:
+        raise NotImplementedError
+
+
+    def capture_array(self) -> np.ndarray:
+        """Inference image only, same call shape as Picamera2.capture_array()."""
+        return self.capture(want_main=False).lores
+
+
+
+def fit_size(imgsz: int, aspect: float = 4 / 3) -> Tuple[int, int]:
+    """Largest even (w, h) inside a square imgsz model input that keeps the sensor aspect ratio."""
+    return (imgsz & ~1, int(round(imgsz / aspect)) & ~1)
+
+
+class LatestJpegOutput:
+    """picamera2 Output stand-in that only keeps the newest encoded frame."""
+
+    def __init__(self):
+        self.frame = None
+        self.recording = False
+
+
+    def start(self):
+        self.recording = True
+
+
+    def stop(self):
+        self.recording = False
+
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, *args, **kwargs):
+        self.frame = bytes(frame) # Reference swap, capture() reads whatever is newest
+
+
+class PicameraSource(CameraSource):
+
+    def __init__(self, inference_size: Tuple[int, int] = (640, 480), display_size: Tuple[int, int] = (640, 480),
+                 headless: bool = False, hardware_jpeg: bool = False, jpeg_quality: int = 80):
+        from picamera2 import Picamera2
+
+        self.inference_size = tuple(inference_size)
+        self.display_size = tuple(display_size)
+        # A second stream only pays off when display and inference sizes differ
+        self.dual = not headless and self.display_size != self.inference_size
+        self.lores_yuv = False
+        self.hardware_jpeg = hardware_jpeg and not headless
+        self.jpeg_quality = jpeg_quality
+        self._jpeg_output = LatestJpegOutput() if self.hardware_jpeg else None
+
+        self.picam = Picamera2()
+        print("Camera initialized.")
+        if self.dual:
+            self._configure_dual()
+        else: # One stream at the inference size, nothing full-size is ever produced
+            config = self.picam.create_preview_configuration(main={'size': self.inference_size, 'format': 'RGB888'})
+            self.picam.configure(config)
+
+
+    def _configure_dual(self):
+        main = {'size': self.display_size, 'format': 'RGB888'}
+        try: # Pi 5 ISP can output RGB on the lores stream
+            config = self.picam.create_preview_configuration(main=main, lores={'size': self.inference_size, 'format': 'RGB888'})
+            self.picam.configure(config)
+        except Exception: # Pi 4 and earlier only do YUV420 on lores
+            config = self.picam.create_preview_configuration(main=main, lores={'size': self.inference_size, 'format': 'YUV420'})
+            self.picam.configure(config)
+            self.lores_yuv = True
+
+
+    def start(self):
+        if self._jpeg_output is not None:
+            try: # V4L2 MJPEG encoder on the main stream, no CPU encode
+                from picamera2.encoders import MJPEGEncoder
+                self.picam.start_encoder(MJPEGEncoder(), self._jpeg_output, quality=self._quality_preset())
+            except Exception as e:
+                print(f"Hardware JPEG encoder unavailable, falling back to CPU encode: {e}")
+                self._jpeg_output = None
+        self.picam.start()
+
+
+    def _quality_preset(self):
+        from picamera2.encoders import Quality
+        if self.jpeg_quality >= 90:
+            return Quality.VERY_HIGH
+        if self.jpeg_quality >= 75:
+            return Quality.HIGH
+        if self.jpeg_quality >= 50:
+            return Quality.MEDIUM
+        return Quality.LOW
+
+
+    def stop(self):
+        if self._jpeg_output is not None:
+            self.picam.stop_encoder()
+        self.picam.stop()
+
+
+    def capture(self, want_main: bool = True) -> CameraFrame:
+        # Newest encoded frame; it can trail the captured one by a frame since the encoder runs on its own
+        jpeg = self._jpeg_output.frame if want_main and self._jpeg_output is not None else None
+        request = self.picam.capture_request()
+        try:
+            timestamp = time.time()
+            metadata = request.get_metadata()
+            # Kernel timestamp of the frame on CLOCK_MONOTONIC, earlier than anything Python could take
+            capture_ns = metadata.get("SensorTimestamp") or time.monotonic_ns()
+            if not self.dual:
+                lores = request.make_array("main")
+                return CameraFrame(lores, lores if want_main else None, timestamp, metadata, jpeg, capture_ns)
+            lores = request.make_array("lores")
+            main = request.make_array("main") if want_main else None # Skip the big copy when nobody watches
+        finally:
+            request.release()
+        if self.lores_yuv:
+            lores = cv2.cvtColor(lores, cv2.COLOR_YUV2BGR_I420)
+        return CameraFrame(lores, main, timestamp, metadata, jpeg, capture_ns)
+
+
+
+class SimulatedCamera(CameraSource):
+
+    def __init__(self, inference_size: Tuple[int, int] = (640, 480), display_size: Tuple[int, int] = (640, 480),
+                 headless: bool = False, fps: float = 30.0, images: Optional[List[np.ndarray]] = None):
+        self.inference_size = tuple(inference_size)
+        self.display_size = tuple(display_size)
+        self.headless = headless
+        self.fps = fps
+        self.images = images # Recorded frames to loop over; synthetic scene when None
+        self.frame_index = 0
+        self._next = 0.0
+        self._rng = np.random.default_rng(0)
+
+
+    def _synthetic(self) -> np.ndarray:
+        w, h = self.display_size
+        img = np.full((h, w, 3), 90, np.uint8)
+        t = self.frame_index / self.fps
+        x = int((np.sin(t * 0.8) * 0.35 + 0.5) * w) # A box sliding left and right
+        cv2.rectangle(img, (x - w // 8, h // 3), (x + w // 8, h - h // 6), (40, 60, 200), -1)
+        noise = self._rng.integers(0, 6, (h, w, 1), dtype=np.uint8) # Sensor noise so frames are never identical
+        return cv2.add(img, noise.repeat(3, axis=2))
+
+
+    def capture(self, want_main: bool = True) -> CameraFrame:
+        now = time.monotonic() # Pace like a real sensor
+        if now < self._next:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + 1.0 / self.fps
+        capture_ns = time.monotonic_ns()
+
+        if self.images:
+            full = self.images[self.frame_index % len(self.images)]
+            if (full.shape[1], full.shape[0]) != self.display_size:
+                full = cv2.resize(full, self.display_size)
+            else:
+                full = full.copy() # Consumers draw overlays in place, keep the recording intact
+        else:
+            full = self._synthetic()
+        self.frame_index += 1
+
+        if self.display_size == self.inference_size:
+            lores = full
+        else: # Stands in for the ISP scaler
+            lores = cv2.resize(full, self.inference_size, interpolation=cv2.INTER_AREA)
+        main = full if want_main and not self.headless else None
+        return CameraFrame(lores, main, time.time(), {"FrameIndex": self.frame_index}, None, capture_ns)
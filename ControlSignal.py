@@ -0,0 +1,140 @@
+"""
+Control Signal for NaviGlass
+Wakes main_loop when there is something to react to: a new detection snapshot
+or a new ultrasonic sample. Publishers bump a sequence number under a
+Condition. The loop blocks until either number moves past what it has seen,
+or until the timeout so it can notice that detections went stale. A snapshot
+published while the loop is busy is not lost; the next wait returns at once.
+
+Reaction time, from publish to the loop picking it up, is exported as
+naviglass_main_loop_reaction_seconds.
+
+    python ControlSignal.py   # reaction latency against the old poll with time.sleep(0.1)
+"""
+
+import statistics
+import threading
+import time
+from typing import Dict, List, Tuple
+from MetricsRegistry import METRICS
+
+
+DETECTION = "detection"
+RANGE = "range"
+TIMEOUT = "timeout"
+
+REACTION_BUCKETS = (0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class ControlSignal:
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.detections = 0 # Sequence numbers, only ever increase
+        self.ranges = 0
+        self.detection_ns = 0 # time.monotonic_ns() of the latest publish of each kind
+        self.range_ns = 0
+        self._m_wakeups = {reason: METRICS.counter("naviglass_main_loop_wakeups_total",
+                                                   "main_loop wake-ups by cause", {"reason": reason})
+                           for reason in (DETECTION, RANGE, TIMEOUT)}
+        self._m_reaction = METRICS.histogram("naviglass_main_loop_reaction_seconds",
+                                             "From a new snapshot being published to main_loop acting on it",
+                                             buckets=REACTION_BUCKETS)
+
+
+    def notify_detection(self):
+        with self._cond:
+            self.detections += 1
+            self.detection_ns = time.monotonic_ns()
+            self._cond.notify_all()
+
+
+    def notify_range(self, *_):
+        with self._cond:
+            self.ranges += 1
+            self.range_ns = time.monotonic_ns()
+            self._cond.notify_all()
+
+
+    def wait(self, seen: Tuple[int, int], timeout: float) -> Tuple[Tuple[int, int], str]:
+        """Block until a detection or range sample newer than seen (detections, ranges), or timeout.
+        Returns the new sequence numbers and why it woke; detections win when both moved."""
+        with self._cond:
+            self._cond.wait_for(lambda: (self.detections, self.ranges) != seen, timeout)
+            current = (self.detections, self.ranges)
+            published_ns = self.detection_ns
+        if current[0] != seen[0]:
+            reason = DETECTION
+            self._m_reaction.observe((time.monotonic_ns() - published_ns) / 1e9)
+        elif current[1] != seen[1]:
+            reason = RANGE
+        else:
+            reason = TIMEOUT
+        self._m_wakeups[reason].inc()
+        return current, reason
+
+
+
+# --- Benchmark ---
+
+def _reaction(control: ControlSignal, loop, publishes: int, period: float) -> Dict:
+    """Publish snapshots at camera pace with jitter; measure publish -> loop reaction and idle loop passes."""
+    import random
+    published: List[int] = []
+    reacted: List[Tuple[int, int]] = [] # (snapshots published so far, time the loop picked them up)
+    passes = [0]
+    stop = threading.Event()
+    thread = threading.Thread(target=loop, args=(control, published, reacted, passes, stop), daemon=True)
+    thread.start()
+    time.sleep(0.05)
+    for _ in range(publishes):
+        time.sleep(period * random.uniform(0.8, 1.2))
+        published.append(time.monotonic_ns())
+        control.notify_detection()
+    time.sleep(0.25)
+    stop.set()
+    control.notify_range()
+    thread.join()
+    latencies = []
+    for i, t in enumerate(published): # A loop pass picks up every snapshot published before it
+        picked = next((r for count, r in reacted if count > i), None)
+        if picked is not None:
+            latencies.append((picked - t) / 1e6)
+    latencies.sort()
+    return {"p50_ms": round(statistics.median(latencies), 3),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95)], 3),
+            "max_ms": round(latencies[-1], 3),
+            "idle_passes": passes[0] - len(reacted)}
+
+
+def _polling(control, published, reacted, passes, stop): # The old main_loop: check, then sleep 100 ms
+    last = 0
+    while not stop.is_set():
+        passes[0] += 1
+        if len(published) != last:
+            last = len(published)
+            reacted.append((last, time.monotonic_ns()))
+        time.sleep(0.1)
+
+
+def _signalled(control, published, reacted, passes, stop):
+    seen = (control.detections, control.ranges)
+    while not stop.is_set():
+        seen, reason = control.wait(seen, timeout=0.25)
+        passes[0] += 1
+        if reason == DETECTION:
+            reacted.append((len(published), time.monotonic_ns()))
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="main_loop reaction latency: sleep(0.1) polling vs ControlSignal.")
+    parser.add_argument("--fps", type=float, default=10.0, help="Snapshot publish rate")
+    parser.add_argument("--publishes", type=int, default=100)
+    args = parser.parse_args()
+
+    control = ControlSignal()
+    report = {"polling_sleep_100ms": _reaction(control, _polling, args.publishes, 1 / args.fps),
+              "control_signal": _reaction(control, _signalled, args.publishes, 1 / args.fps)}
+    print(json.dumps(report, indent=2))
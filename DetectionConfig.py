@@ -0,0 +1,20 @@
+"""
+Detection Config for NaviGlass
+What the detector looks for and where its calibrated backend is saved. Kept
+apart from objectDetectionWithLocalWeb.py so offline tools (calibration,
+export, benchmarks) can use them without importing GPIO, Flask and the app.
+"""
+
+DETECTOR_CONFIG_FILE = "detector_backend.json" # Written by calibrate_backend.py
+DETECT_CLASSES = [
+    0,   # person
+    1,   # bicycle
+    2,   # car
+    3,   # motorcycle
+    5,   # bus
+    7,   # truck
+    9,   # traffic light
+    10,  # fire hydrant
+    11,  # stop sign
+    13,  # bench
+]
@@ -0,0 +1,140 @@
+"""
+Detection Pipeline for NaviGlass
+Runs each detection stage (capture, inference, postprocess, encode) in its own
+thread, connected by small bounded queues that drop the oldest frame when full.
+Throughput approaches the slowest stage instead of the sum of all of them, and
+stale frames are discarded rather than piling up. Every stage reports its queue
+depth and service time so the bottleneck on a given Pi is easy to spot.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from AsyncLogger import LOG
+
+
+LOG.set_rate_limit("pipeline_error", 1.0)
+
+
+class DropOldestQueue:
+
+    def __init__(self, maxsize: int = 1):
+        self._items = deque()
+        self._maxsize = maxsize
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self._maxsize:
+                self._items.popleft() # Newer frame wins, the stale one is discarded
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+
+    def get(self, timeout: float = 0.5) -> Optional[Any]:
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class PipelineStage:
+
+    def __init__(self, name: str, fn: Callable, inbox: Optional[DropOldestQueue], outbox: Optional[DropOldestQueue],
+                 period: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.fn = fn # item -> item for the next stage, or None to end the frame here
+        self.inbox = inbox # None for the source stage
+        self.outbox = outbox
+        self.period = period # Source pacing in seconds, not counted as service time
+        self.service_ms = 0.0
+        self.processed = 0
+        self.errors = 0
+        self.thread = None
+
+
+    def run(self, running: Callable[[], bool]):
+        while running():
+            if self.inbox is not None:
+                item = self.inbox.get()
+                if item is None:
+                    continue
+                args = (item,)
+            else:
+                args = ()
+
+            t0 = time.perf_counter()
+            try:
+                out = self.fn(*args)
+            except Exception as e:
+                self.errors += 1
+                LOG.error("pipeline_error", stage=self.name, error=repr(e))
+                time.sleep(0.1)
+                continue
+            elapsed = (time.perf_counter() - t0) * 1000
+            self.service_ms = 0.9 * self.service_ms + 0.1 * elapsed if self.processed else elapsed
+            self.processed += 1
+
+            if out is not None and self.outbox is not None:
+                self.outbox.put(out)
+
+            if self.period is not None:
+                remaining = self.period() - (time.perf_counter() - t0)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+
+    def stats(self) -> Dict:
+        return {
+            "stage": self.name,
+            "queue_depth": len(self.inbox) if self.inbox is not None else 0,
+            "dropped": self.inbox.dropped if self.inbox is not None else 0,
+            "service_ms": round(self.service_ms, 2),
+            "processed": self.processed,
+            "errors": self.errors,
+        }
+
+
+class DetectionPipeline:
+
+    def __init__(self, stages: List[Tuple[str, Callable]], queue_size: int = 1,
+                 source_period: Optional[Callable[[], float]] = None):
+        """stages[0] is the source and takes no argument; each later stage takes the previous one's output."""
+        self.stages: List[PipelineStage] = []
+        inbox = None
+        for i, (name, fn) in enumerate(stages):
+            outbox = DropOldestQueue(queue_size) if i < len(stages) - 1 else None
+            self.stages.append(PipelineStage(name, fn, inbox, outbox, source_period if i == 0 else None))
+            inbox = outbox
+        self._running = False
+
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for stage in self.stages:
+            stage.thread = threading.Thread(target=stage.run, args=(lambda: self._running,), daemon=True,
+                                            name=f"pipeline-{stage.name}")
+            stage.thread.start()
+
+
+    def stop(self):
+        self._running = False
+        for stage in self.stages:
+            if stage.thread:
+                stage.thread.join(timeout=2)
+
+
+    def stats(self) -> Dict:
+        stages = [s.stats() for s in self.stages]
+        bottleneck = max(stages, key=lambda s: s["service_ms"])["stage"] if stages else None
+        return {"stages": stages, "bottleneck": bottleneck}
@@ -0,0 +1,318 @@
+"""
+Detection Service for NaviGlass
+Runs capture + inference at a target rate, whether or not anyone is watching
+the stream. Plotting and JPEG encoding only happen while at least one MJPEG
+viewer is subscribed. Every processed frame also publishes its detections as
+metadata; in "client" overlay mode the video goes out un-annotated (camera JPEG
+passed straight through when available) and the browser draws the boxes. The
+stages run back to back in one thread, or each in its own thread through
+DetectionPipeline when pipelined is set. With an InferencePool, inference runs
+in worker processes: capture hands frames to the pool and a second pipeline
+picks the results up again in frame order.
+"""
+
+import threading
+import time
+import cv2
+from typing import Callable, Optional, List, Dict
+from DetectionPipeline import DetectionPipeline
+from OverlayRenderer import OverlayRenderer
+from MetricsRegistry import METRICS
+from LatencyTracer import TRACER
+from AsyncLogger import LOG
+
+
+LOG.set_rate_limit("detection_error", 1.0)
+LOG.set_rate_limit("frame_dropped", 5.0)
+
+
+class FrameJob:
+
+    __slots__ = ("frame_id", "frame", "viewers", "skipped", "result", "annotated")
+
+    def __init__(self, frame_id: int, frame, viewers: bool):
+        self.frame_id = frame_id
+        self.frame = frame # CameraFrame
+        self.viewers = viewers
+        self.skipped = False
+        self.result = None
+        self.annotated = None
+
+
+class DetectionService:
+
+    def __init__(self, camera, model, broadcaster, label_fn: Callable, on_labels: Callable,
+                 classes: Optional[List[int]] = None, conf_min: float = 0.70, target_fps: float = 10.0,
+                 scheduler=None, on_skip: Optional[Callable] = None, distance_fn: Optional[Callable] = None,
+                 pipelined: bool = False, overlay_mode: str = "server", recorder=None, pool=None):
+        self.camera = camera
+        self.model = model
+        self.broadcaster = broadcaster
+        self.label_fn = label_fn # Turns a Results object into the label dicts main_loop uses
+        self.on_labels = on_labels
+        self.classes = classes
+        self.conf_min = conf_min
+        self.target_fps = target_fps
+        self.scheduler = scheduler # Optional MotionScheduler gating inference on static frames
+        self.on_skip = on_skip # Publishes carried-forward detections when inference is skipped
+        self.distance_fn = distance_fn
+        self.pipelined = pipelined
+        self.overlay_mode = overlay_mode # "server" burns boxes into the JPEG, "client" leaves them to the browser
+        self.recorder = recorder # Optional SessionRecorder for offline replay
+        self.pool = pool # Optional InferencePool; model is then unused and the stages always run pipelined
+        self.renderer = OverlayRenderer()
+
+        stage_help = "Time spent in each detection stage"
+        self._m_capture = METRICS.histogram("naviglass_stage_seconds", stage_help, {"stage": "capture"})
+        self._m_inference = METRICS.histogram("naviglass_stage_seconds", stage_help, {"stage": "inference"})
+        self._m_postprocess = METRICS.histogram("naviglass_stage_seconds", stage_help, {"stage": "postprocess"})
+        self._m_plot = METRICS.histogram("naviglass_stage_seconds", stage_help, {"stage": "plot"})
+        self._m_encode = METRICS.histogram("naviglass_stage_seconds", stage_help, {"stage": "encode"})
+        self._m_frames = METRICS.counter("naviglass_frames_captured_total", "Frames captured by the detection service")
+        self._m_skipped = METRICS.counter("naviglass_inferences_skipped_total", "Frames the motion scheduler skipped")
+        self._m_no_viewers = METRICS.counter("naviglass_encodes_skipped_total", "Frames not encoded because nobody watched")
+        self._m_dropped = METRICS.counter("naviglass_frames_dropped_total",
+                                          "Frames dropped before inference because every pool slot stayed busy")
+        METRICS.gauge("naviglass_detection_fps", "Achieved detection loop rate").set_function(lambda: self.fps)
+
+        self.frames = 0
+        self.encodes_skipped = 0
+        self.frames_dropped = 0
+        self.last_inference_ms = 0.0
+        self.fps = 0.0
+        self._running = False
+        self._thread = None
+        self._pipeline = None
+        self._collector = None
+        self._last_start = None
+
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        if self.pool is not None: # Replicas infer in parallel, results are re-sequenced by the pool
+            self._pipeline = DetectionPipeline([
+                ("capture", self.capture_stage),
+                ("dispatch", self.dispatch_stage),
+            ], source_period=self._period)
+            self._collector = DetectionPipeline([
+                ("collect", self.collect_stage),
+                ("postprocess", self.postprocess_stage),
+                ("encode", self.encode_stage),
+            ])
+            self._collector.start()
+            self._pipeline.start()
+        elif self.pipelined: # One thread per stage, throughput set by the slowest one
+            self._pipeline = DetectionPipeline([
+                ("capture", self.capture_stage),
+                ("inference", self.inference_stage),
+                ("postprocess", self.postprocess_stage),
+                ("encode", self.encode_stage),
+            ], source_period=self._period)
+            self._pipeline.start()
+        else:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        mode = f" ({self.pool.workers} inference workers)" if self.pool else " (pipelined)" if self.pipelined else ""
+        print(f"Detection service started at {self.target_fps} FPS target{mode}.")
+
+
+    def stop(self):
+        self._running = False
+        if self._pipeline:
+            self._pipeline.stop()
+        if self._collector:
+            self._collector.stop()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+
+    # --- Stages. Run back to back by step(), or each in its own thread by DetectionPipeline ---
+
+    def capture_stage(self) -> Optional[FrameJob]:
+        self._update_fps()
+        viewers = self.broadcaster.has_viewers()
+        t0 = time.monotonic_ns()
+        frame = self.camera.capture(want_main=viewers) # Display stream only when someone is watching
+        t1 = time.monotonic_ns()
+        self._m_capture.observe((t1 - t0) / 1e9)
+        self.frames += 1
+        self._m_frames.inc()
+        job = FrameJob(self.frames, frame, viewers)
+        # From the sensor timestamp, so exposure, ISP and buffer wait are all in the trace
+        TRACER.span("capture", min(frame.capture_ns or t0, t0), t1, job.frame_id, "capture")
+        if self.recorder and self.recorder.record_frames:
+            self.recorder.record_frame(job.frame_id, frame.capture_ns, frame.jpeg or frame.lores)
+
+        if self.scheduler:
+            distance = self.distance_fn() if self.distance_fn else 999
+            # Skipped frames still flow downstream so detections are published in frame order
+            job.skipped = not self.scheduler.should_infer(frame.lores, distance_cm=distance)
+            if job.skipped:
+                self._m_skipped.inc()
+        return job
+
+
+    def inference_stage(self, job: FrameJob) -> FrameJob:
+        if job.skipped:
+            return job
+        t0 = time.monotonic_ns()
+        results = self.model(job.frame.lores, verbose=False, classes=self.classes) # Inference on the ISP-scaled stream
+        job.result = results[0]
+        t1 = time.monotonic_ns()
+        self._m_inference.observe((t1 - t0) / 1e9)
+        TRACER.span("inference", t0, t1, job.frame_id, "inference")
+        self.last_inference_ms = (t1 - t0) / 1e6
+        if self.scheduler:
+            self.scheduler.record_inference(self.last_inference_ms)
+        LOG.observe("inference_ms", self.last_inference_ms) # Summarised every few seconds, not printed per frame
+        LOG.debug("inference", frame_id=job.frame_id, ms=self.last_inference_ms, fps=self.fps)
+        return job
+
+
+    def dispatch_stage(self, job: FrameJob) -> None:
+        # Skipped frames pass through the pool too, so they come back in order with the inferred ones
+        if not self.pool.submit(None if job.skipped else job.frame.lores, job):
+            self.frames_dropped += 1 # Only this thread dispatches
+            self._m_dropped.inc()
+            LOG.warning("frame_dropped", frame_id=job.frame_id, reason="pool_busy")
+            job.frame = None # Let the camera buffers go now, nothing downstream will see this job
+        return None
+
+
+    def collect_stage(self) -> Optional[FrameJob]:
+        item = self.pool.get(timeout=0.5)
+        if item is None:
+            return None
+        job, result, worker_ns = item
+        if job.skipped:
+            return job
+        job.result = result # None if the worker failed, postprocess then publishes no detections
+        t1 = time.monotonic_ns()
+        t0 = t1 - worker_ns
+        self._m_inference.observe(worker_ns / 1e9)
+        TRACER.span("inference", t0, t1, job.frame_id, "inference") # Worker time, placed at the release
+        self.last_inference_ms = worker_ns / 1e6
+        if self.scheduler:
+            self.scheduler.record_inference(self.last_inference_ms)
+        LOG.observe("inference_ms", self.last_inference_ms)
+        return job
+
+
+    def postprocess_stage(self, job: FrameJob) -> Optional[FrameJob]:
+        t0 = time.monotonic_ns()
+        try:
+            return self._postprocess(job)
+        finally:
+            t1 = time.monotonic_ns()
+            self._m_postprocess.observe((t1 - t0) / 1e9)
+            TRACER.span("postprocess", t0, t1, job.frame_id, "postprocess")
+
+
+    def _postprocess(self, job: FrameJob) -> Optional[FrameJob]:
+        capture_ts, capture_ns = job.frame.timestamp, job.frame.capture_ns
+        client_overlay = self.overlay_mode == "client"
+        if self.recorder: # Before publishing, so the log always has a frame ahead of decisions about it
+            self.recorder.record_detections(job.frame_id, capture_ts, capture_ns, job.result, job.skipped)
+        if job.skipped:
+            # Tracker prediction stands in for this frame
+            labels = (self.on_skip(job.frame_id, capture_ts, capture_ns) if self.on_skip else None) or []
+        else:
+            labels = self.label_fn(job.result, conf_min=self.conf_min)
+            self.on_labels(labels, job.frame_id, capture_ts, capture_ns) # frame id, capture time
+        self.broadcaster.publish_metadata(self.metadata(job, labels))
+
+        if not job.viewers: # Nobody is watching, give the CPU back to inference
+            self.encodes_skipped += 1
+            self._m_no_viewers.inc()
+            return None
+        frame = job.frame # Skipped frames are drawn with the tracker's predicted boxes, so the stream keeps its rate
+        if client_overlay and frame.jpeg is not None:
+            return job # Camera-encoded frame goes out untouched
+        image = frame.main if frame.main is not None else frame.lores # Inference is done, safe to draw on
+        if client_overlay:
+            job.annotated = image
+        else:
+            t1 = time.perf_counter()
+            job.annotated = self.renderer.draw(image, labels) # Only the filtered, tracked objects, in place
+            self._m_plot.observe(time.perf_counter() - t1)
+        return job
+
+
+    def encode_stage(self, job: FrameJob) -> None:
+        t0 = time.monotonic_ns()
+        if job.annotated is None:
+            self.broadcaster.publish_jpeg(job.frame.jpeg, job.frame_id)
+        else:
+            self.broadcaster.publish_image(job.annotated, job.frame_id) # Encoded once for all viewers
+        t1 = time.monotonic_ns()
+        self._m_encode.observe((t1 - t0) / 1e9)
+        TRACER.span("encode", t0, t1, job.frame_id, "encode")
+
+
+    def metadata(self, job: FrameJob, labels: List[Dict]) -> Dict:
+        """Overlay payload for one frame. Boxes are normalized so any display size can draw them."""
+        return {
+            "frame_id": job.frame_id,
+            "timestamp": job.frame.timestamp,
+            "predicted": job.skipped,
+            "overlay": self.overlay_mode,
+            "objects": [{"label": l['label'], "class_id": l.get('class_id', -1), "track_id": l.get('track_id', -1),
+                         "confidence": round(l['confidence'], 3), "box": [round(v, 4) for v in l['box']]}
+                        for l in labels],
+        }
+
+
+    def step(self):
+        job = self.capture_stage()
+        if job is not None:
+            job = self.postprocess_stage(self.inference_stage(job))
+        if job is not None:
+            self.encode_stage(job)
+
+
+    def _period(self) -> float:
+        return 1.0 / self.target_fps if self.target_fps > 0 else 0.0
+
+
+    def _update_fps(self):
+        now = time.perf_counter()
+        if self._last_start is not None: # Smoothed achieved rate, including the pacing sleep
+            rate = 1.0 / max(now - self._last_start, 1e-6)
+            self.fps = 0.9 * self.fps + 0.1 * rate if self.fps else rate
+            LOG.observe("detection_fps", rate)
+        self._last_start = now
+
+
+    def _run(self):
+        while self._running:
+            started = time.perf_counter()
+            try:
+                self.step()
+            except Exception as e:
+                LOG.error("detection_error", error=repr(e))
+                time.sleep(0.5)
+
+            remaining = self._period() - (time.perf_counter() - started)
+            if remaining > 0: # Hold the target rate; if inference is slower we just run flat out
+                time.sleep(remaining)
+
+
+    def stats(self) -> Dict:
+        return {
+            "target_fps": self.target_fps,
+            "fps": round(self.fps, 2),
+            "frames": self.frames,
+            "inference_ms": round(self.last_inference_ms, 2),
+            "encodes_skipped": self.encodes_skipped,
+            "frames_dropped": self.frames_dropped,
+            "subscribers": self.broadcaster.subscribers,
+            "overlay_mode": self.overlay_mode,
+            "viewers": self.broadcaster.has_viewers(),
+            "scheduler": self.scheduler.stats() if self.scheduler else None,
+            "pipeline": self._pipeline.stats() if self._pipeline else None,
+            "collector": self._collector.stats() if self._collector else None,
+            "pool": self.pool.stats() if self.pool else None,
+        }
+
@@ -0,0 +1,81 @@
+"""
+Detection Snapshot for NaviGlass
+One immutable, versioned record of everything detected in a frame. Columns are
+stored in compact arrays and a snapshot is never modified after it is built, so
+the detector can publish it by swapping a single reference and readers can use
+it without a lock or a copy.
+"""
+
+import time
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class DetectionSnapshot(NamedTuple):
+    frame_id: int
+    timestamp: float            # Capture time, time.time()
+    labels: Tuple[str, ...]     # Class name per detection
+    class_ids: array            # 'h'
+    confidence: array           # 'f'
+    center_x: array             # 'f', normalized 0-1
+    center_y: array             # 'f', normalized 0-1
+    area: array                 # 'f', fraction of the frame
+    width: array                # 'f', normalized box width
+    height: array               # 'f', normalized box height
+    track_ids: array            # 'i', ObjectTracker id, -1 if untracked
+    capture_ns: int = 0         # Sensor capture time, time.monotonic_ns(), for latency tracing
+
+
+    @classmethod
+    def empty(cls, frame_id: int = 0, timestamp: float = 0.0) -> "DetectionSnapshot":
+        return cls(frame_id, timestamp, (), array('h'), array('f'), array('f'), array('f'), array('f'),
+                   array('f'), array('f'), array('i'))
+
+
+    @classmethod
+    def from_labels(cls, labels: List[Dict], frame_id: int, timestamp: Optional[float] = None,
+                    class_ids: Optional[List[int]] = None, capture_ns: int = 0) -> "DetectionSnapshot":
+        """Build from labels_from_result() output."""
+        return cls(
+            frame_id,
+            timestamp if timestamp is not None else time.time(),
+            tuple(l['label'] for l in labels),
+            array('h', class_ids if class_ids is not None else [l.get('class_id', -1) for l in labels]),
+            array('f', [l['confidence'] for l in labels]),
+            array('f', [l['coordinates'][0] for l in labels]),
+            array('f', [l['coordinates'][1] for l in labels]),
+            array('f', [l['area'] for l in labels]),
+            array('f', [l['box'][2] - l['box'][0] if 'box' in l else 0.0 for l in labels]),
+            array('f', [l['box'][3] - l['box'][1] if 'box' in l else 0.0 for l in labels]),
+            array('i', [l.get('track_id', -1) for l in labels]),
+            capture_ns,
+        )
+
+
+    @property
+    def size(self) -> int:
+        return len(self.labels)
+
+
+    def biggest(self) -> Optional[int]:
+        """Index of the detection with the largest area, None if empty."""
+        if not self.labels:
+            return None
+        area = self.area
+        return max(range(len(area)), key=area.__getitem__)
+
+
+    def box(self, i: int) -> Tuple[float, float, float, float]:
+        cx, cy, hw, hh = self.center_x[i], self.center_y[i], self.width[i] / 2, self.height[i] / 2
+        return (cx - hw, cy - hh, cx + hw, cy + hh)
+
+
+    def item(self, i: int) -> Dict:
+        """One detection in the label-dict shape used by narration."""
+        return {'label': self.labels[i], 'class_id': self.class_ids[i], 'confidence': self.confidence[i],
+                'coordinates': (self.center_x[i], self.center_y[i]), 'area': self.area[i],
+                'box': self.box(i), 'track_id': self.track_ids[i]}
+
+
+    def to_labels(self) -> List[Dict]:
+        return [self.item(i) for i in range(len(self.labels))]
@@ -0,0 +1,433 @@
+"""
+Detector Backend for NaviGlass
+One call shape for every inference runtime: backend(image, verbose=False,
+classes=[...]) returns a list with one result exposing .boxes (cls, conf,
+xyxyn) and .names, the same as an ultralytics YOLO model, so DetectionService
+and labels_from_result do not care which runtime ran.
+
+  ultralytics   YOLO() on any exported model (the original path)
+  ncnn          ncnn Net with an explicit thread count
+  onnxruntime   ONNX Runtime CPU session with an explicit thread count
+  openvino      OpenVINO CPU compiled model with an explicit thread count
+  synthetic     finds the box SimulatedCamera draws, for the sim backend
+
+The raw runtimes share letterboxing and YOLO output decoding. calibrate_backend.py
+benchmarks them on this CPU and saves the fastest accurate configuration to
+detector_backend.json, which load_backend() uses at startup.
+"""
+
+import json
+import os
+import platform
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+COCO_NAMES = [
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
+    "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow",
+    "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
+    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard",
+    "tennis racket", "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
+    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch",
+    "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
+    "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors", "teddy bear",
+    "hair drier", "toothbrush",
+]
+DEFAULT_MODELS = {
+    "ultralytics": "yolo11n_ncnn_model",
+    "ncnn": "yolo11n_ncnn_model",
+    "onnxruntime": "yolo11n.onnx",
+    "openvino": "yolo11n_openvino_model",
+    "synthetic": "",
+}
+
+
+class DetectionBoxes:
+    """Just enough of ultralytics' Boxes for labels_from_result: numpy scalars and rows have .item() / .tolist()."""
+
+    def __init__(self, rows: np.ndarray):
+        self.cls = rows[:, 0]
+        self.conf = rows[:, 1]
+        self.xyxyn = rows[:, 2:6]
+
+
+    def __len__(self) -> int:
+        return len(self.cls)
+
+
+
+class DetectionResult:
+    """Columnar detections: rows of cls, conf, x1, y1, x2, y2 with the box normalized to the input image."""
+
+    def __init__(self, rows: np.ndarray, names: Dict[int, str]):
+        self.rows = rows # Lets labels_from_result take the columnar path
+        self.boxes = DetectionBoxes(rows)
+        self.names = names
+
+
+
+class DetectorBackend:
+
+    name = "base"
+
+    def __init__(self, model: str = "", threads: Optional[int] = None, imgsz: int = 640,
+                 conf: float = 0.25, iou: float = 0.7):
+        self.model = model
+        self.threads = threads # None leaves the runtime's own default
+        self.imgsz = imgsz
+        self.conf = conf # Candidate threshold before NMS, as ultralytics; the app filters again at 0.70
+        self.iou = iou
+        self.names: Dict[int, str] = dict(enumerate(COCO_NAMES))
+
+
+    def load(self) -> "DetectorBackend":
+        return self
+
+
+    def __call__(self, image: np.ndarray, verbose: bool = False, classes: Optional[Sequence[int]] = None, **kwargs):
+        raise NotImplementedError
+
+
+    def config(self) -> Dict:
+        return {"backend": self.name, "model": self.model, "threads": self.threads, "imgsz": self.imgsz}
+
+
+    def describe(self) -> str:
+        return f"{self.name} {self.model or '-'} threads={self.threads or 'default'} imgsz={self.imgsz}"
+
+
+
+class UltralyticsBackend(DetectorBackend):
+
+    name = "ultralytics"
+
+    def load(self):
+        from ultralytics import YOLO
+        self._yolo = YOLO(self.model, task="detect")
+        return self
+
+
+    def __call__(self, image, verbose=False, classes=None, **kwargs):
+        return self._yolo(image, verbose=verbose, classes=classes, imgsz=self.imgsz, conf=self.conf, iou=self.iou)
+
+
+
+class RawYoloBackend(DetectorBackend):
+    """Letterbox, run the raw network, decode the (4 + classes, anchors) YOLO head and run NMS in numpy/OpenCV."""
+
+    rect = False # True when the runtime accepts non-square inputs, which saves the padding rows
+
+    def __init__(self, model: str = "", threads: Optional[int] = None, imgsz: int = 640,
+                 conf: float = 0.25, iou: float = 0.7, class_map: Optional[Sequence[int]] = None):
+        super().__init__(model, threads, imgsz, conf, iou)
+        # Class-pruned exports (ModelExport.py): head row i is COCO class class_map[i], results use COCO ids
+        self.class_map = np.asarray(class_map, dtype=np.int64) if class_map else None
+
+
+    def _use_names(self, names: Optional[Dict[int, str]]):
+        if names and self.class_map is None: # A pruned model's own names are by head row, keep the COCO ones
+            self.names = names
+
+
+    def head_rows(self, classes: Optional[Sequence[int]]) -> Optional[List[int]]:
+        """Head rows to decode for COCO class ids."""
+        if self.class_map is None:
+            return None if classes is None else list(classes)
+        return [i for i, c in enumerate(self.class_map.tolist()) if classes is None or c in classes]
+
+
+    def _input_shape(self, h: int, w: int) -> Tuple[int, int]:
+        if not self.rect:
+            return self.imgsz, self.imgsz
+        r = self.imgsz / max(h, w)
+        return int(np.ceil(h * r / 32) * 32), int(np.ceil(w * r / 32) * 32)
+
+
+    def preprocess(self, image: np.ndarray) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+        h, w = image.shape[:2]
+        th, tw = self._input_shape(h, w)
+        r = min(th / h, tw / w)
+        nh, nw = int(round(h * r)), int(round(w * r))
+        top, left = (th - nh) // 2, (tw - nw) // 2
+        canvas = np.full((th, tw, 3), 114, np.uint8)
+        canvas[top:top + nh, left:left + nw] = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        blob = cv2.dnn.blobFromImage(canvas, 1 / 255.0, swapRB=True) # BGR -> RGB, HWC -> 1CHW float32
+        return blob, r, (left, top)
+
+
+    def infer(self, blob: np.ndarray) -> np.ndarray:
+        """Raw head output, (4 + classes, anchors) or with a leading batch axis."""
+        raise NotImplementedError
+
+
+    def decode(self, out: np.ndarray, image_shape: Tuple[int, int], r: float, pad: Tuple[float, float],
+               classes: Optional[Sequence[int]] = None) -> np.ndarray:
+        pred = out.reshape(out.shape[-2], out.shape[-1]).T # (anchors, 4 + classes)
+        scores = pred[:, 4:]
+        best = scores.argmax(1) # Over every class, as ultralytics: a box whose best class is filtered out is dropped
+        conf = scores[np.arange(len(scores)), best]
+        mask = conf >= self.conf
+        if classes is not None:
+            mask &= np.isin(best, np.asarray(classes, dtype=np.int64))
+        if not mask.any():
+            return np.empty((0, 6), np.float32)
+        pred, conf, cls = pred[mask], conf[mask], best[mask]
+
+        h, w = image_shape
+        cx = (pred[:, 0] - pad[0]) / r
+        cy = (pred[:, 1] - pad[1]) / r
+        bw = pred[:, 2] / r
+        bh = pred[:, 3] / r
+        boxes = np.stack([cx - bw / 2, cy - bh / 2, bw, bh], axis=1)
+        keep = cv2.dnn.NMSBoxesBatched(boxes.tolist(), conf.tolist(), cls.tolist(), self.conf, self.iou)
+        keep = np.asarray(keep, dtype=np.int64).reshape(-1)[:300]
+        if len(keep) == 0:
+            return np.empty((0, 6), np.float32)
+        x1 = np.clip(boxes[keep, 0] / w, 0, 1)
+        y1 = np.clip(boxes[keep, 1] / h, 0, 1)
+        x2 = np.clip((boxes[keep, 0] + boxes[keep, 2]) / w, 0, 1)
+        y2 = np.clip((boxes[keep, 1] + boxes[keep, 3]) / h, 0, 1)
+        return np.stack([cls[keep], conf[keep], x1, y1, x2, y2], axis=1).astype(np.float32)
+
+
+    def __call__(self, image, verbose=False, classes=None, **kwargs):
+        blob, r, pad = self.preprocess(image)
+        out = self.infer(blob)
+        rows = self.decode(out, image.shape[:2], r, pad, self.head_rows(classes))
+        if self.class_map is not None:
+            rows[:, 0] = self.class_map[rows[:, 0].astype(np.int64)]
+        return [DetectionResult(rows, self.names)]
+
+
+
+def _read_names(path: str) -> Optional[Dict[int, str]]:
+    """Class names from the metadata.yaml ultralytics writes next to exported models."""
+    meta = os.path.join(path if os.path.isdir(path) else os.path.dirname(path), "metadata.yaml")
+    if not os.path.exists(meta):
+        return None
+    try:
+        import yaml
+        with open(meta) as f:
+            names = yaml.safe_load(f).get("names")
+        return {int(k): v for k, v in names.items()} if names else None
+    except Exception:
+        return None
+
+
+class NcnnBackend(RawYoloBackend):
+
+    name = "ncnn"
+    rect = True # ncnn reshapes per call
+
+    def load(self):
+        import ncnn
+        self._ncnn = ncnn
+        self._net = ncnn.Net()
+        self._net.opt.use_vulkan_compute = False
+        if self.threads:
+            self._net.opt.num_threads = self.threads
+        self._net.load_param(os.path.join(self.model, "model.ncnn.param"))
+        self._net.load_model(os.path.join(self.model, "model.ncnn.bin"))
+        self._use_names(_read_names(self.model))
+        return self
+
+
+    def infer(self, blob):
+        ex = self._net.create_extractor()
+        ex.input("in0", self._ncnn.Mat(blob[0]))
+        _, out = ex.extract("out0")
+        return np.asarray(out)
+
+
+
+class OnnxRuntimeBackend(RawYoloBackend):
+
+    name = "onnxruntime"
+
+    def load(self):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(self.model, options, providers=["CPUExecutionProvider"])
+        self._input = self._session.get_inputs()[0]
+        shape = self._input.shape
+        self.rect = not all(isinstance(d, int) for d in shape[2:]) # Exported with dynamic=True
+        if not self.rect and shape[2] != self.imgsz:
+            raise ValueError(f"{self.model} is fixed at {shape[2]}x{shape[3]}, cannot run at {self.imgsz}")
+        try:
+            names = self._session.get_modelmeta().custom_metadata_map.get("names")
+            if names:
+                import ast
+                self._use_names({int(k): v for k, v in ast.literal_eval(names).items()})
+        except Exception:
+            pass
+        return self
+
+
+    def infer(self, blob):
+        return self._session.run(None, {self._input.name: blob})[0]
+
+
+
+class OpenVinoBackend(RawYoloBackend):
+
+    name = "openvino"
+
+    def load(self):
+        import openvino as ov
+        core = ov.Core()
+        xml = self.model
+        if os.path.isdir(xml):
+            xml = next(os.path.join(xml, f) for f in sorted(os.listdir(xml)) if f.endswith(".xml"))
+        network = core.read_model(xml)
+        network.reshape([1, 3, self.imgsz, self.imgsz])
+        config = {"INFERENCE_NUM_THREADS": self.threads} if self.threads else {}
+        self._compiled = core.compile_model(network, "CPU", config)
+        self._output = self._compiled.output(0)
+        self._use_names(_read_names(self.model))
+        return self
+
+
+    def infer(self, blob):
+        return self._compiled([blob])[self._output]
+
+
+
+class SyntheticBackend(DetectorBackend):
+    """Model stand-in for the sim backend: finds the red box SimulatedCamera draws."""
+
+    name = "synthetic"
+
+    def __init__(self, model: str = "", threads: Optional[int] = None, imgsz: int = 640,
+                 conf: float = 0.9, iou: float = 0.7, inference_ms: float = 0.0):
+        super().__init__(model, threads, imgsz, conf, iou)
+        self.inference_ms = inference_ms # Sleep per call to mimic the Pi's inference time
+        self.names = {0: "person"}
+
+
+    def __call__(self, image, verbose=False, classes=None, **kwargs):
+        started = time.perf_counter()
+        rows = np.empty((0, 6), np.float32)
+        if classes is None or 0 in classes:
+            mask = cv2.inRange(image, (0, 0, 150), (100, 120, 255))
+            points = cv2.findNonZero(mask)
+            if points is not None and len(points) > 64:
+                x, y, w, h = cv2.boundingRect(points)
+                ih, iw = image.shape[:2]
+                rows = np.array([[0, self.conf, x / iw, y / ih, (x + w) / iw, (y + h) / ih]], np.float32)
+        remaining = self.inference_ms / 1000 - (time.perf_counter() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+        return [DetectionResult(rows, self.names)]
+
+
+
+BACKENDS = {cls.name: cls for cls in (UltralyticsBackend, NcnnBackend, OnnxRuntimeBackend, OpenVinoBackend,
+                                      SyntheticBackend)}
+RUNTIME_MODULES = {"ultralytics": "ultralytics", "ncnn": "ncnn", "onnxruntime": "onnxruntime",
+                   "openvino": "openvino", "synthetic": None}
+
+
+def available_backends(model_dir: str = ".") -> Dict[str, str]:
+    """Backend name -> model path for every runtime that imports here and has its model on disk."""
+    import importlib.util
+    out = {}
+    for name, module in RUNTIME_MODULES.items():
+        if name == "synthetic":
+            continue
+        if importlib.util.find_spec(module) is None:
+            continue
+        path = os.path.join(model_dir, DEFAULT_MODELS[name])
+        if os.path.exists(path):
+            out[name] = path
+    return out
+
+
+def create_backend(backend: str, model: str = "", threads: Optional[int] = None, imgsz: int = 640,
+                   **kwargs) -> DetectorBackend:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend](model or DEFAULT_MODELS[backend], threads, imgsz, **kwargs).load()
+
+
+def cpu_fingerprint() -> str:
+    """What the calibration is only valid for: architecture, CPU model and core count."""
+    model = ""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key.strip() in ("Model", "model name"): # Pi board name on ARM, CPU name on x86
+                    model = value.strip()
+                    if key.strip() == "Model":
+                        break
+    except OSError:
+        pass
+    return f"{platform.machine()} | {model} | {os.cpu_count()} cores"
+
+
+def load_backend_config(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            config = json.load(f)
+    except Exception as e:
+        print(f"Failed to read detector config: {e}")
+        return None
+    if config.get("cpu") and config["cpu"] != cpu_fingerprint():
+        print(f"Detector config was calibrated on {config['cpu']}, this is {cpu_fingerprint()}; "
+              f"run calibrate_backend.py again for the best choice")
+    return config
+
+
+def save_backend_config(path: str, config: Dict):
+    with open(path, "w") as f:
+        json.dump({**config, "cpu": cpu_fingerprint(), "calibrated": time.strftime("%Y-%m-%dT%H:%M:%S")}, f, indent=2)
+
+
+def resolve_artifact(path: str) -> str:
+    """A model artifact directory, or the newest version under a directory of them."""
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        return path
+    versions = [os.path.join(path, d) for d in os.listdir(path) if os.path.exists(os.path.join(path, d, "manifest.json"))]
+    if not versions:
+        raise FileNotFoundError(f"No model artifact (manifest.json) in {path}")
+    def version(d):
+        with open(os.path.join(d, "manifest.json")) as f:
+            return json.load(f).get("version", 0)
+    return max(versions, key=version)
+
+
+def load_artifact(path: str, variant: Optional[str] = None) -> Dict:
+    """Detector spec for a versioned model directory written by ModelExport.py, its default variant unless named."""
+    path = resolve_artifact(path)
+    with open(os.path.join(path, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+    name = variant or manifest["default"]
+    if name not in manifest["variants"]:
+        raise ValueError(f"{path} has no variant {name!r}, only {', '.join(manifest['variants'])}")
+    entry = manifest["variants"][name]
+    if manifest.get("cpu") and manifest["cpu"] != cpu_fingerprint():
+        print(f"Model artifact was measured on {manifest['cpu']}, this is {cpu_fingerprint()}")
+    return {"backend": entry["backend"], "model": os.path.join(path, entry["file"]), "imgsz": manifest["imgsz"],
+            "options": {"class_map": manifest["classes"]}, "artifact": f"{os.path.basename(path)}:{name}"}
+
+
+def load_backend(config: Optional[Dict], default_model: str = "yolo11n_ncnn_model") -> DetectorBackend:
+    """The persisted choice, or the original ultralytics ncnn model when nothing has been calibrated.
+    config is plain data (backend, model, threads, imgsz, options, fast) so it can be handed to another process."""
+    if config:
+        backend = create_backend(config["backend"], config.get("model", ""), config.get("threads"),
+                                 config.get("imgsz", 640), **config.get("options", {}))
+        if config.get("fast") and isinstance(backend, RawYoloBackend): # Lean decode, see FastDetector.py
+            from FastDetector import FastDetector
+            return FastDetector(backend, **config["fast"])
+        return backend
+    return create_backend("ultralytics", default_model)
@@ -0,0 +1,138 @@
+"""
+Fake GPIO for NaviGlass
+Drop-in stand-in for the parts of RPi.GPIO we use, so ranging and haptics can
+run and be benchmarked on a normal Linux box. Ultrasonic echoes are simulated:
+when a trigger pin falls, the paired echo pin rises after a short sensor delay
+and falls again after the round-trip time for the scripted distance.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class FakePWM:
+
+    def __init__(self, gpio, pin: int, frequency: float):
+        self.gpio = gpio
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0.0
+        self.running = False
+
+
+    def start(self, duty_cycle: float):
+        self.running = True
+        self.ChangeDutyCycle(duty_cycle)
+
+
+    def ChangeDutyCycle(self, duty_cycle: float):
+        self.duty_cycle = duty_cycle
+        self.gpio.pwm_log.append((time.monotonic(), self.pin, duty_cycle))
+
+
+    def ChangeFrequency(self, frequency: float):
+        self.frequency = frequency
+
+
+    def stop(self):
+        self.running = False
+        self.ChangeDutyCycle(0)
+
+
+class FakeGPIO:
+
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+
+    SENSOR_DELAY = 0.0004 # Time between trigger and echo rising on an HC-SR04
+    SPEED_OF_SOUND_CM_S = 34300
+
+    def __init__(self):
+        self.mode = None
+        self.levels: Dict[int, int] = {}
+        self.directions: Dict[int, int] = {}
+        self.callbacks: Dict[int, Tuple[int, Callable]] = {}
+        self.echo_pins: Dict[int, int] = {} # trigger pin -> echo pin
+        self.distances: Dict[int, Callable[[float], Optional[float]]] = {} # echo pin -> distance profile
+        self.pwm_log: List[Tuple[float, int, float]] = []
+        self.PWM = lambda pin, frequency: FakePWM(self, pin, frequency)
+
+
+    # --- RPi.GPIO API ---
+
+    def setmode(self, mode):
+        self.mode = mode
+
+
+    def setwarnings(self, flag):
+        pass
+
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        self.directions[pin] = direction
+        self.levels.setdefault(pin, initial if initial is not None else self.LOW)
+
+
+    def output(self, pin, value):
+        previous = self.levels.get(pin, self.LOW)
+        self.levels[pin] = value
+        if previous == self.HIGH and value == self.LOW and pin in self.echo_pins:
+            self._schedule_echo(self.echo_pins[pin])
+
+
+    def input(self, pin):
+        return self.levels.get(pin, self.LOW)
+
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = (edge, callback)
+
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+
+    def cleanup(self, pins=None):
+        self.callbacks.clear()
+        self.levels.clear()
+
+
+    # --- Simulation controls ---
+
+    def attach_sensor(self, trig: int, echo: int, distance_cm=400.0):
+        """Pair a trigger/echo pin and give it a fixed distance or a profile f(t) -> cm (None = no echo)."""
+        self.echo_pins[trig] = echo
+        self.set_distance(echo, distance_cm)
+
+
+    def set_distance(self, echo: int, distance_cm):
+        self.distances[echo] = distance_cm if callable(distance_cm) else (lambda t, d=distance_cm: d)
+
+
+    def _schedule_echo(self, echo: int):
+        distance = self.distances.get(echo, lambda t: None)(time.monotonic())
+        if distance is None: # Nothing in range, the echo line never goes high
+            return
+        pulse = 2 * distance / self.SPEED_OF_SOUND_CM_S
+        threading.Timer(self.SENSOR_DELAY, self._set_edge, (echo, self.HIGH)).start()
+        threading.Timer(self.SENSOR_DELAY + pulse, self._set_edge, (echo, self.LOW)).start()
+
+
+    def _set_edge(self, pin: int, value: int):
+        self.levels[pin] = value
+        edge, callback = self.callbacks.get(pin, (None, None))
+        if callback is None:
+            return
+        if edge == self.BOTH or (edge == self.RISING and value) or (edge == self.FALLING and not value):
+            callback(pin)
@@ -0,0 +1,287 @@
+"""
+Fast Detector for NaviGlass
+Direct runner for the exported ncnn / ONNX / OpenVINO model that only does the
+work the app needs. The YOLO head is decoded in NumPy without transposing it,
+looking only at the score rows of DETECT_CLASSES. The 0.70 confidence
+threshold is applied as a mask before NMS, so only a handful of candidates are
+left. NMS is a greedy NumPy pass with per-class box offsets. The 1/16-area
+filter is a mask on the normalized boxes. The result is a columnar (N, 6)
+float32 array of cls, conf, x1, y1, x2, y2, which labels_from_rows turns into
+label dicts without a per-box .item().
+
+Class assignment follows ultralytics: a candidate whose best class over all 80
+is not in DETECT_CLASSES is dropped, not relabelled. That check only reads the
+scores of the few candidates left after the threshold.
+
+It wraps a RawYoloBackend and keeps the backend call shape, so DetectionService,
+InferencePool and calibrate_backend.py use it unchanged. load_backend() adds it
+when the spec has a "fast" entry.
+
+    python FastDetector.py                                  # decode + NMS + labels on a simulated YOLO head
+    python FastDetector.py --config detector_backend.json   # end to end on frames, against model() + labels_from_result
+"""
+
+import argparse
+import statistics
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from DetectorBackend import DetectionResult, RawYoloBackend
+from NavigationController import MIN_AREA, labels_from_boxes, labels_from_rows
+
+
+MAX_DETECTIONS = 300 # Same cap as ultralytics' max_det
+CLASS_OFFSET = 7680.0 # Shifts each class's boxes apart so one NMS pass never suppresses across classes
+EMPTY = np.empty((0, 6), np.float32)
+
+
+def fast_nms(boxes: np.ndarray, scores: np.ndarray, iou: float) -> np.ndarray:
+    """Greedy NMS over (N, 4) xyxy boxes: indices kept, highest score first."""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        if not rest.size:
+            break
+        w = np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])
+        h = np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])
+        inter = np.maximum(w, 0) * np.maximum(h, 0)
+        overlap = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[overlap <= iou]
+    return np.asarray(keep, dtype=np.int64)
+
+
+
+class FastDetector:
+
+    name = "fast"
+
+    def __init__(self, backend: RawYoloBackend, classes: Sequence[int], conf_min: float = 0.70,
+                 min_area: float = MIN_AREA, iou: Optional[float] = None):
+        if not isinstance(backend, RawYoloBackend):
+            raise TypeError(f"FastDetector needs a raw runtime (ncnn, onnxruntime, openvino), not {backend.name}")
+        self.backend = backend
+        head = backend.class_map.tolist() if backend.class_map is not None else None # Class-pruned export
+        self.classes = np.asarray(sorted(c for c in set(classes) if head is None or c in head), dtype=np.int64)
+        self.conf_min = conf_min
+        self.min_area = min_area
+        self.iou = backend.iou if iou is None else iou
+        # Rows of the (4 + classes, anchors) head holding our scores, in the order of self.classes
+        self._score_rows = 4 + (np.asarray([head.index(c) for c in self.classes], dtype=np.int64) if head
+                                else self.classes)
+
+
+    @property
+    def names(self) -> Dict[int, str]:
+        return self.backend.names
+
+
+    @property
+    def imgsz(self) -> int:
+        return self.backend.imgsz
+
+
+    def decode(self, out: np.ndarray, image_shape: Tuple[int, int], r: float,
+               pad: Tuple[float, float]) -> np.ndarray:
+        pred = out.reshape(out.shape[-2], out.shape[-1]) # (4 + classes, anchors), no transpose
+        candidates = np.flatnonzero(pred[self._score_rows].max(0) >= np.float32(self.conf_min))
+        if not candidates.size:
+            return EMPTY
+        cand = pred[:, candidates] # Everything below works on the few candidate columns
+        scores = cand[self._score_rows]
+        best = scores.argmax(0)
+        conf = scores[best, np.arange(len(candidates))]
+        # ultralytics takes the best of all classes first; drop candidates another class wins
+        mine = conf >= cand[4:].max(0)
+        if not mine.all():
+            cand, best, conf = cand[:, mine], best[mine], conf[mine]
+            if not len(conf):
+                return EMPTY
+
+        boxes = np.empty((len(conf), 4), np.float32) # xyxy in image pixels
+        half = cand[2:4] / 2
+        boxes[:, 0:2] = ((cand[0:2] - half).T - pad) / r
+        boxes[:, 2:4] = ((cand[0:2] + half).T - pad) / r
+        cls = self.classes[best]
+        keep = fast_nms(boxes + (cls * CLASS_OFFSET)[:, None].astype(np.float32), conf, self.iou)[:MAX_DETECTIONS]
+
+        h, w = image_shape
+        rows = np.empty((len(keep), 6), np.float32)
+        rows[:, 0] = cls[keep]
+        rows[:, 1] = conf[keep]
+        rows[:, 2:] = np.clip(boxes[keep] / np.array([w, h, w, h], np.float32), 0, 1)
+        # Thresholds again in double on the final float32 values, exactly as labels_from_rows applies them
+        final = rows.astype(np.float64)
+        area = (final[:, 4] - final[:, 2]) * (final[:, 5] - final[:, 3])
+        return rows[(final[:, 1] >= self.conf_min) & (area >= self.min_area)]
+
+
+    def detect(self, image: np.ndarray) -> np.ndarray:
+        """Columnar detections for one BGR image."""
+        blob, r, pad = self.backend.preprocess(image)
+        return self.decode(self.backend.infer(blob), image.shape[:2], r, pad)
+
+
+    def __call__(self, image, verbose=False, classes=None, **kwargs):
+        return [DetectionResult(self.detect(image), self.names)]
+
+
+    def config(self) -> Dict:
+        return {**self.backend.config(), "fast": {"classes": self.classes.tolist(), "conf_min": self.conf_min,
+                                                  "min_area": self.min_area}}
+
+
+    def describe(self) -> str:
+        return f"{self.backend.describe()} fast decode ({len(self.classes)} classes, conf>={self.conf_min})"
+
+
+
+# --- Benchmarks ---
+
+def simulated_head(imgsz: int = 640, objects: int = 6, seed: int = 0, num_classes: int = 80) -> np.ndarray:
+    """(1, 4 + classes, anchors) output shaped like YOLO11's, with clusters of confident anchors per object."""
+    rng = np.random.default_rng(seed)
+    anchors = sum((imgsz // s) ** 2 for s in (8, 16, 32))
+    out = np.empty((4 + num_classes, anchors), np.float32)
+    out[0:2] = rng.uniform(0, imgsz, (2, anchors))
+    out[2:4] = rng.uniform(4, imgsz / 4, (2, anchors))
+    out[4:] = rng.uniform(0, 0.02, (num_classes, anchors)) # Background anchors score near zero
+    for _ in range(objects):
+        cls = rng.integers(0, num_classes) if rng.random() < 0.3 else rng.choice([0, 1, 2, 3, 5, 7, 9, 10, 11, 13])
+        size = rng.uniform(imgsz / 8, imgsz / 2, 2)
+        center = rng.uniform(size / 2, imgsz - size / 2)
+        idx = rng.choice(anchors, 24, replace=False)
+        out[0:2, idx] = (center[:, None] + rng.normal(0, 4, (2, 24))).astype(np.float32)
+        out[2:4, idx] = (size[:, None] * rng.uniform(0.9, 1.1, (2, 24))).astype(np.float32)
+        out[4 + cls, idx] = rng.uniform(0.3, 0.95, 24)
+    return out[None]
+
+
+def _stats(samples: List[float]) -> Dict:
+    samples = sorted(samples)
+    return {"p50_us": round(statistics.median(samples), 1),
+            "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1)}
+
+
+def _time(fn, inputs: List, runs: int) -> List[float]:
+    out = []
+    for i in range(runs):
+        item = inputs[i % len(inputs)]
+        t0 = time.perf_counter()
+        fn(item)
+        out.append((time.perf_counter() - t0) * 1e6)
+    return out
+
+
+def _same_labels(a: List[Dict], b: List[Dict]) -> bool:
+    key = lambda l: (l['class_id'], round(l['confidence'], 4), tuple(round(v, 3) for v in l['box']))
+    return sorted(map(key, a)) == sorted(map(key, b))
+
+
+def benchmark_decode(classes: Sequence[int], imgsz: int = 640, frames: int = 50, runs: int = 500,
+                     conf_min: float = 0.70) -> Dict:
+    """Raw head -> labels: the current decode + labels_from_result against FastDetector + labels_from_rows.
+    No runtime is needed, the head output is simulated."""
+
+    class _Head(RawYoloBackend): # Decode only, infer() is never called
+        name = "head"
+
+    from SessionReplay import RecordedResult
+    backend = _Head("", None, imgsz)
+    fast = FastDetector(backend, classes, conf_min)
+    heads = [simulated_head(imgsz, seed=i) for i in range(frames)]
+    shape, r, pad = (imgsz, imgsz), 1.0, (0.0, 0.0)
+
+    def current(out): # RawYoloBackend.decode at conf 0.25 over the requested classes, then the per-box loop
+        rows = backend.decode(out, shape, r, pad, classes)
+        return labels_from_boxes(RecordedResult(rows, backend.names), conf_min)
+
+    def lean(out):
+        return labels_from_rows(fast.decode(out, shape, r, pad), backend.names, conf_min)
+
+    agree = sum(_same_labels(current(h), lean(h)) for h in heads)
+    report = {"anchors": heads[0].shape[-1], "frames": frames, "runs": runs,
+              "objects_per_frame": round(sum(len(lean(h)) for h in heads) / frames, 2),
+              "identical_labels": f"{agree}/{frames}",
+              "current": _stats(_time(current, heads, runs)),
+              "fast": _stats(_time(lean, heads, runs))}
+
+    try: # The ultralytics path the app runs by default: torch NMS, Results, then per-box .item()
+        import torch
+        from ultralytics.engine.results import Results
+        from ultralytics.utils import ops
+        blank = np.zeros((imgsz, imgsz, 3), np.uint8)
+
+        def ultralytics_path(out):
+            det = ops.non_max_suppression(torch.from_numpy(out), 0.25, 0.7, classes=list(classes))[0]
+            return labels_from_boxes(Results(blank, path="", names=backend.names, boxes=det), conf_min)
+        report["ultralytics"] = _stats(_time(ultralytics_path, heads, runs))
+    except ImportError:
+        report["ultralytics"] = "not installed"
+    return report
+
+
+def benchmark_model(spec: Dict, classes: Sequence[int], images: List[np.ndarray], runs: int = 100,
+                    conf_min: float = 0.70) -> Dict:
+    """End to end per frame: backend(image) + labels_from_result against FastDetector.detect + labels_from_rows."""
+    from DetectorBackend import create_backend
+    backend = create_backend(spec["backend"], spec.get("model", ""), spec.get("threads"), spec.get("imgsz", 640))
+    fast = FastDetector(backend, classes, conf_min)
+    for image in images[:3]: # Warm-up
+        backend(image, classes=classes)
+
+    def current(image):
+        return labels_from_boxes(backend(image, verbose=False, classes=classes)[0], conf_min)
+
+    def lean(image):
+        return labels_from_rows(fast.detect(image), fast.names, conf_min)
+
+    agree = sum(_same_labels(current(img), lean(img)) for img in images)
+    report = {"backend": backend.describe(), "frames": len(images), "identical_labels": f"{agree}/{len(images)}",
+              "current": _stats(_time(current, images, runs)), "fast": _stats(_time(lean, images, runs))}
+    try:
+        from DetectorBackend import UltralyticsBackend
+        yolo = UltralyticsBackend(spec.get("model", ""), None, spec.get("imgsz", 640)).load()
+        report["ultralytics"] = _stats(_time(lambda img: labels_from_boxes(
+            yolo(img, verbose=False, classes=classes)[0], conf_min), images, runs))
+    except Exception as e:
+        report["ultralytics"] = f"unavailable ({e.__class__.__name__})"
+    return report
+
+
+
+if __name__ == "__main__":
+    import json
+    from DetectionConfig import DETECT_CLASSES
+
+    parser = argparse.ArgumentParser(description="Benchmark the direct decode path against model() + labels_from_result.")
+    parser.add_argument("--config", default="", help="Detector spec (e.g. detector_backend.json) for an end-to-end run")
+    parser.add_argument("--frames", default="", help="Image directory or session log for the end-to-end run")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--runs", type=int, default=500)
+    args = parser.parse_args()
+
+    report = benchmark_decode(DETECT_CLASSES, args.imgsz, runs=args.runs)
+    saved = report["current"]["p50_us"] - report["fast"]["p50_us"]
+    print(json.dumps(report, indent=2))
+    print(f"Decode + labels: {saved:.0f} us saved per frame (p50)")
+
+    if args.config:
+        from CameraSource import SimulatedCamera, fit_size
+        from DetectorBackend import load_backend_config
+        from Hardware import load_frames
+        spec = load_backend_config(args.config)
+        if spec is None:
+            raise SystemExit(f"No detector spec at {args.config}")
+        images = load_frames(args.frames, limit=50) if args.frames else []
+        if not images:
+            size = fit_size(spec.get("imgsz", args.imgsz))
+            camera = SimulatedCamera(size, size, fps=1000)
+            images = [camera.capture(want_main=False).lores for _ in range(20)]
+        print(json.dumps(benchmark_model(spec, DETECT_CLASSES, images, runs=min(args.runs, 100)), indent=2))
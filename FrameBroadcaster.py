@@ -0,0 +1,218 @@
+"""
+Frame Broadcaster for NaviGlass
+Holds the newest annotated JPEG in a single versioned slot so that any number
+of MJPEG viewers can stream it without running their own capture or inference.
+Each frame is encoded once, at a configurable quality and scale, and only while
+someone is watching. A slow viewer always gets the newest frame and silently
+skips the ones in between; it never holds up the producer. Detection
+metadata for browser-side overlays goes through a second slot as Server-Sent
+Events.
+"""
+
+import json
+import threading
+import time
+import cv2
+from typing import Optional, Tuple, Dict
+
+
+class FrameBroadcaster:
+
+    def __init__(self, channel=None, quality: int = 80, scale: float = 1.0):
+        self.channel = channel # Optional SharedStateChannel mirroring frames to web_server.py
+        self.quality = quality
+        self.scale = scale
+        self.encode_ms = 0.0
+        self.encodes_skipped = 0
+        self._cond = threading.Condition()
+        self._version = 0
+        self._frame = None
+        self._published_at = 0.0
+        self.subscribers = 0
+        self.frames_published = 0
+        self.frames_served = 0
+        self.frames_dropped = 0 # Versions viewers skipped because they were still sending an older one
+        self._serve_time = 0.0 # Total thread CPU time spent handing frames to viewers
+        self._meta_version = 0
+        self._meta_event = None # Pre-formatted SSE event shared by every metadata subscriber
+        self.meta_subscribers = 0
+        self.passthrough_frames = 0 # Camera-encoded JPEGs published without a CPU encode
+
+
+    def publish(self, frame_bytes: bytes, frame_id: Optional[int] = None) -> int:
+        with self._cond:
+            self._frame = frame_bytes
+            self._version += 1
+            self._published_at = time.time()
+            self.frames_published += 1
+            self._cond.notify_all() # Wake every viewer waiting for a new version
+            version = self._version
+        if self.channel:
+            self.channel.publish_frame(frame_bytes, frame_id=version if frame_id is None else frame_id)
+        return version
+
+
+    def publish_jpeg(self, jpeg: bytes, frame_id: Optional[int] = None) -> Optional[int]:
+        """Pass an already encoded frame (camera / hardware encoder) through untouched."""
+        if not self.has_viewers():
+            self.encodes_skipped += 1
+            return None
+        self.passthrough_frames += 1
+        return self.publish(jpeg, frame_id)
+
+
+    def publish_metadata(self, meta: Dict) -> int:
+        """Latest per-frame detections for browser overlays. Serialized once for every subscriber."""
+        data = json.dumps(meta, separators=(",", ":"))
+        with self._cond:
+            self._meta_event = f"data: {data}\n\n"
+            self._meta_version += 1
+            self._cond.notify_all()
+            version = self._meta_version
+        if self.channel:
+            self.channel.publish_metadata(data.encode("utf-8"), frame_id=meta.get("frame_id", version))
+        return version
+
+
+    def publish_image(self, image, frame_id: Optional[int] = None) -> Optional[int]:
+        """Encode once for every viewer. Returns the new version, or None if nobody is watching."""
+        if not self.has_viewers():
+            self.encodes_skipped += 1
+            return None
+        t0 = time.perf_counter()
+        if self.scale != 1.0:
+            image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+        elapsed = (time.perf_counter() - t0) * 1000
+        self.encode_ms = 0.9 * self.encode_ms + 0.1 * elapsed if self.encode_ms else elapsed
+        if not ret:
+            return None
+        return self.publish(buffer.tobytes(), frame_id)
+
+
+    def has_viewers(self) -> bool:
+        return self.subscribers > 0 or bool(self.channel and self.channel.has_remote_viewers())
+
+
+    def latest(self) -> Tuple[int, Optional[bytes]]:
+        with self._cond:
+            return self._version, self._frame
+
+
+    def wait_for_frame(self, last_version: int, timeout: float = 1.0) -> Tuple[int, Optional[bytes]]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != last_version, timeout)
+            return self._version, self._frame
+
+
+    def stream(self):
+        """MJPEG generator for one viewer. Yields each new version exactly once."""
+        with self._cond:
+            self.subscribers += 1
+        try:
+            version = 0
+            while True:
+                new_version, frame = self.wait_for_frame(version)
+                if frame is None or new_version == version:
+                    continue
+                t0 = time.thread_time()
+                chunk = (b'--frame\r\n'
+                         b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+                with self._cond: # Every viewer thread updates the same counters
+                    if version:
+                        self.frames_dropped += new_version - version - 1
+                    self.frames_served += 1
+                    self._serve_time += time.thread_time() - t0
+                version = new_version
+                yield chunk
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+    def metadata_stream(self, keepalive: float = 15.0):
+        """SSE generator for one overlay client. Yields each metadata version at most once."""
+        with self._cond:
+            self.meta_subscribers += 1
+        try:
+            version = 0
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._meta_version != version, keepalive)
+                    new_version, event = self._meta_version, self._meta_event
+                if event is None or new_version == version:
+                    yield ": keepalive\n\n" # Comment line keeps proxies from closing an idle stream
+                    continue
+                version = new_version
+                yield event
+        finally:
+            with self._cond:
+                self.meta_subscribers -= 1
+
+
+    def stats(self) -> Dict:
+        served = self.frames_served
+        return {
+            "version": self._version,
+            "subscribers": self.subscribers,
+            "frames_published": self.frames_published,
+            "frames_served": served,
+            "frames_dropped": self.frames_dropped,
+            "encode_ms": round(self.encode_ms, 2),
+            "encodes_skipped": self.encodes_skipped,
+            "passthrough_frames": self.passthrough_frames,
+            "meta_subscribers": self.meta_subscribers,
+            "quality": self.quality,
+            "scale": self.scale,
+            "serve_cost_us": (self._serve_time / served * 1e6) if served else 0.0,
+            "frame_age": (time.time() - self._published_at) if self._published_at else None,
+        }
+
+
+
+def _benchmark(viewers: int, seconds: float = 2.0, fps: float = 15.0, frame_size: int = 40000) -> Dict:
+    """Publish fake JPEGs at `fps` and measure the CPU each viewer spends per frame."""
+    broadcaster = FrameBroadcaster()
+    stop = threading.Event()
+    cpu = []
+
+    def viewer():
+        t0 = time.thread_time()
+        frames = 0
+        gen = broadcaster.stream()
+        while not stop.is_set():
+            next(gen)
+            frames += 1
+        gen.close()
+        cpu.append(((time.thread_time() - t0), frames))
+
+    threads = [threading.Thread(target=viewer, daemon=True) for _ in range(viewers)]
+    for t in threads:
+        t.start()
+
+    payload = b"\xff" * frame_size
+    end = time.time() + seconds
+    while time.time() < end:
+        broadcaster.publish(payload)
+        time.sleep(1 / fps)
+    stop.set()
+    broadcaster.publish(payload) # Release viewers blocked in wait_for_frame
+    for t in threads:
+        t.join(timeout=2)
+
+    total_cpu = sum(c for c, _ in cpu)
+    total_frames = sum(f for _, f in cpu)
+    return {
+        "viewers": viewers,
+        "published": broadcaster.frames_published,
+        "served": total_frames,
+        "cpu_per_frame_us": (total_cpu / total_frames * 1e6) if total_frames else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    # Per-viewer cost of the shared slot: no inference, only a wake-up and a byte concat
+    for n in (1, 2, 4, 8):
+        r = _benchmark(n)
+        print(f"{r['viewers']} viewer(s): {r['served']} frames served from {r['published']} published, "
+              f"{r['cpu_per_frame_us']:.1f} us CPU per viewer-frame")
@@ -0,0 +1,240 @@
+"""
+Haptic Engine for NaviGlass
+Owns the vibration motors on its own thread. main_loop submits an intent, i.e.
+a pattern, and the engine plays it. It sleeps until the pattern's next change,
+a new intent or the intent's expiry, and writes to the HapticOutput only when
+the duty cycles actually change.
+
+Patterns are plain values, so resubmitting the same one every frame costs
+nothing and does not restart it:
+
+  Steady(left, right)                       on at a duty, the original behaviour
+  Pulses(left, right, on_s, off_s, count)   pulse train, endless without count
+  Ramp((l0, r0), (l1, r1), seconds)         linear fade, then holds the end duty
+  distance_pulses(left, right, cm)          pulse rate rises as the object gets closer
+
+A new pulse train replacing another keeps its place in the cycle, so a rate
+that follows the distance changes smoothly instead of restarting every frame.
+Each intent has a time to live. If main_loop stops submitting, the motors
+stop after it runs out.
+
+    python HapticEngine.py   # GPIO writes per second: direct set_motor_speed vs the engine
+"""
+
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+from MetricsRegistry import METRICS
+from AsyncLogger import LOG
+
+
+DEFAULT_TTL = 1.0 # Seconds an intent stays valid without being resubmitted
+
+
+class Steady(NamedTuple):
+    left: float
+    right: float
+
+    def duty(self, t: float) -> Tuple[float, float]:
+        return self.left, self.right
+
+    def next_change(self, t: float) -> Optional[float]:
+        return None
+
+
+class Pulses(NamedTuple):
+    left: float
+    right: float
+    on_s: float
+    off_s: float
+    count: Optional[int] = None
+
+    @property
+    def period(self) -> float:
+        return self.on_s + self.off_s
+
+    def duty(self, t: float) -> Tuple[float, float]:
+        if self.count is not None and t >= self.count * self.period:
+            return 0.0, 0.0
+        return (self.left, self.right) if t % self.period < self.on_s else (0.0, 0.0)
+
+    def next_change(self, t: float) -> Optional[float]:
+        if self.count is not None and t >= self.count * self.period:
+            return None
+        phase = t % self.period
+        return t + (self.on_s - phase if phase < self.on_s else self.period - phase)
+
+
+class Ramp(NamedTuple):
+    start: Tuple[float, float]
+    end: Tuple[float, float]
+    seconds: float
+    step_s: float = 0.02 # Duty updates at 50 Hz while ramping, no faster than the motors can follow
+
+    def duty(self, t: float) -> Tuple[float, float]:
+        f = min(1.0, int(t / self.step_s) * self.step_s / self.seconds) if self.seconds > 0 else 1.0
+        return (self.start[0] + (self.end[0] - self.start[0]) * f,
+                self.start[1] + (self.end[1] - self.start[1]) * f)
+
+    def next_change(self, t: float) -> Optional[float]:
+        return None if t >= self.seconds else (int(t / self.step_s) + 1) * self.step_s
+
+
+OFF = Steady(0.0, 0.0)
+
+
+def distance_pulses(left: float, right: float, distance_cm: float, near_cm: float = 30, far_cm: float = 400,
+                    fastest_s: float = 0.12, slowest_s: float = 1.0) -> NamedTuple:
+    """Parking-sensor style: the pulse period shrinks linearly from slowest_s at far_cm to fastest_s at near_cm.
+    Steady when touching distance, no pulses at all without a reading."""
+    if distance_cm >= 999 or distance_cm <= near_cm:
+        return Steady(left, right)
+    f = min(1.0, (distance_cm - near_cm) / (far_cm - near_cm))
+    period = round(fastest_s + (slowest_s - fastest_s) * f, 3) # Rounded so small distance jitter is the same pattern
+    return Pulses(left, right, period / 2, period / 2)
+
+
+def _phase(new, old, t_old: float) -> float:
+    """Pattern time to start new at when it replaces old: pulse trains keep their place in the cycle."""
+    if isinstance(new, Pulses) and isinstance(old, Pulses) and new.count is None and old.count is None:
+        return (t_old % old.period) / old.period * new.period
+    return 0.0
+
+
+
+class HapticEngine:
+
+    def __init__(self, output, ttl: float = DEFAULT_TTL):
+        self.output = output # HapticOutput
+        self.ttl = ttl
+        self._cond = threading.Condition()
+        self._pattern = OFF
+        self._t0 = time.monotonic()
+        self._expires = float("inf")
+        self._seq = 0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.duty = (0.0, 0.0)
+        self.intents = self.writes = 0
+        self._m_intents = METRICS.counter("naviglass_haptic_intents_total", "Patterns submitted to the haptic engine")
+        self._m_writes = METRICS.counter("naviglass_haptic_writes_total", "Duty cycle changes written to the motors")
+        self._m_expired = METRICS.counter("naviglass_haptic_expired_total",
+                                          "Intents that ran out without being renewed, motors stopped")
+
+
+    def start(self):
+        if self._running:
+            return
+        self.output.start()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="haptics")
+        self._thread.start()
+
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        with self._cond:
+            self._seq += 1
+            self._cond.notify()
+        self._thread.join(timeout=1)
+        self._write(0.0, 0.0)
+
+
+    def submit(self, pattern, ttl: Optional[float] = None):
+        """Play pattern until replaced or until ttl seconds without a resubmission."""
+        now = time.monotonic()
+        expires = now + (self.ttl if ttl is None else ttl)
+        with self._cond:
+            if pattern != self._pattern or expires < self._expires: # The thread may be sleeping until later
+                if pattern != self._pattern:
+                    self._t0 = now - _phase(pattern, self._pattern, now - self._t0)
+                    self._pattern = pattern
+                self._seq += 1
+                self._cond.notify()
+            self._expires = expires
+        self.intents += 1
+        self._m_intents.inc()
+
+
+    def _write(self, left: float, right: float):
+        if (left, right) == self.duty:
+            return
+        self.output.set(left, right)
+        self.duty = (left, right)
+        self.writes += 1
+        self._m_writes.inc()
+
+
+    def _run(self):
+        seen = -1
+        while self._running:
+            with self._cond:
+                now = time.monotonic()
+                if now >= self._expires and self._pattern != OFF: # main_loop went quiet: never leave the motors on
+                    LOG.warning("haptic_intent_expired", pattern=type(self._pattern).__name__)
+                    self._m_expired.inc()
+                    self._pattern, self._t0, self._expires = OFF, now, float("inf")
+                pattern, t = self._pattern, now - self._t0
+                seen = self._seq
+                change = pattern.next_change(t)
+                wake = min(self._expires, self._t0 + change if change is not None else float("inf"))
+            try:
+                self._write(*pattern.duty(t))
+            except Exception as e:
+                LOG.error("haptic_write_failed", error=repr(e))
+            with self._cond:
+                if self._seq == seen and self._running:
+                    timeout = wake - time.monotonic()
+                    if timeout > 0:
+                        self._cond.wait_for(lambda: self._seq != seen or not self._running,
+                                            None if timeout == float("inf") else timeout)
+
+
+    def stats(self):
+        return {"pattern": type(self._pattern).__name__, "params": list(self._pattern), "duty": list(self.duty),
+                "intents": self.intents, "writes": self.writes}
+
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from FakeGPIO import FakeGPIO
+    from HapticOutput import PwmHaptics
+
+    parser = argparse.ArgumentParser(description="GPIO writes for a scripted walk: per-tick set_motor_speed vs the engine.")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--fps", type=float, default=10.0, help="Decisions per second, as main_loop takes them")
+    parser.add_argument("--pulse", action="store_true", help="Submit distance_pulses instead of Steady")
+    args = parser.parse_args()
+
+    def decisions(): # Approach from 300 cm to 40 cm and hold: duty only changes every 20 cm
+        ticks = int(args.seconds * args.fps)
+        for i in range(ticks):
+            cm = max(40, 300 - int(i / ticks * 2 * 260) // 20 * 20)
+            duty = 45 - cm / 400 * 25
+            yield cm, duty * 0.8, duty * 1.2
+
+    # Before: every decision wrote both channels, changed or not
+    direct = FakeGPIO()
+    motors = PwmHaptics(direct, 32, 33)
+    motors.start()
+    before = len(direct.pwm_log)
+    for cm, left, right in decisions():
+        motors._left.ChangeDutyCycle(left)
+        motors._right.ChangeDutyCycle(right)
+        time.sleep(1 / args.fps)
+    direct_writes = len(direct.pwm_log) - before
+
+    gpio = FakeGPIO()
+    engine = HapticEngine(PwmHaptics(gpio, 32, 33))
+    engine.start()
+    before = len(gpio.pwm_log)
+    for cm, left, right in decisions():
+        engine.submit(distance_pulses(left, right, cm) if args.pulse else Steady(left, right))
+        time.sleep(1 / args.fps)
+    engine.stop()
+    print(json.dumps({"decisions": int(args.seconds * args.fps), "direct_gpio_writes": direct_writes,
+                      "engine_gpio_writes": len(gpio.pwm_log) - before, "engine": engine.stats()}, indent=2))
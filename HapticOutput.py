@@ -0,0 +1,137 @@
+"""
+Haptic Output for NaviGlass
+The two vibration motors behind one interface. PwmHaptics drives them through
+software PWM on whatever GPIO module it is given: RPi.GPIO on the glasses, or
+FakeGPIO off-device, where every duty cycle written is kept in gpio.pwm_log so
+a run can be checked or replayed afterwards. SysfsPwmHaptics uses the Pi's
+hardware PWM through the kernel instead. Board pins 32 and 33 are GPIO12/13,
+PWM channels 0 and 1 with dtoverlay=pwm-2chan. Timing then costs no CPU and
+does not jitter under load.
+
+Both only write a channel whose duty cycle actually changed.
+"""
+
+import os
+import time
+from typing import List, Optional, Tuple
+
+
+class HapticOutput:
+
+    def start(self):
+        pass
+
+
+    def set(self, left_dc: float, right_dc: float):
+        raise NotImplementedError
+
+
+    def stop(self):
+        pass
+
+
+
+class PwmHaptics(HapticOutput):
+
+    def __init__(self, gpio, left_pin: int, right_pin: int, frequency: float = 100):
+        self.gpio = gpio
+        self.left_pin = left_pin
+        self.right_pin = right_pin
+        self.frequency = frequency
+        self._left = None
+        self._right = None
+        self.duty = (0.0, 0.0)
+
+
+    def start(self):
+        self.gpio.setmode(self.gpio.BOARD)
+        self.gpio.setup(self.left_pin, self.gpio.OUT)
+        self.gpio.setup(self.right_pin, self.gpio.OUT)
+        self._left = self.gpio.PWM(self.left_pin, self.frequency)
+        self._right = self.gpio.PWM(self.right_pin, self.frequency)
+        self._left.start(0)
+        self._right.start(0)
+
+
+    def set(self, left_dc: float, right_dc: float):
+        if self._left is None:
+            return
+        if left_dc != self.duty[0]:
+            self._left.ChangeDutyCycle(left_dc)
+        if right_dc != self.duty[1]:
+            self._right.ChangeDutyCycle(right_dc)
+        self.duty = (left_dc, right_dc)
+
+
+    def stop(self):
+        if self._left is None:
+            return
+        self._left.stop()
+        self._right.stop()
+        self._left = self._right = None
+        self.duty = (0.0, 0.0)
+
+
+    def commands(self) -> List[Tuple[float, int, float]]:
+        """(time.monotonic(), pin, duty cycle) written so far; only FakeGPIO keeps a log."""
+        return list(getattr(self.gpio, "pwm_log", []))
+
+
+
+class SysfsPwmHaptics(HapticOutput):
+
+    def __init__(self, chip: int = 0, channels: Tuple[int, int] = (0, 1), frequency: float = 100,
+                 root: str = "/sys/class/pwm"):
+        self.chip_path = os.path.join(root, f"pwmchip{chip}")
+        self.channels = channels
+        self.period_ns = int(1e9 / frequency)
+        self._duty_fds: List[Optional[int]] = [None, None] # Kept open, a duty change is one pwrite
+        self.duty = (0.0, 0.0)
+
+
+    def _write(self, path: str, value):
+        with open(path, "w") as f:
+            f.write(str(value))
+
+
+    def start(self):
+        if not os.path.isdir(self.chip_path):
+            raise FileNotFoundError(f"{self.chip_path} missing; add dtoverlay=pwm-2chan to /boot/config.txt")
+        for i, channel in enumerate(self.channels):
+            path = os.path.join(self.chip_path, f"pwm{channel}")
+            if not os.path.isdir(path):
+                self._write(os.path.join(self.chip_path, "export"), channel)
+                deadline = time.monotonic() + 1.0
+                while not os.access(os.path.join(path, "period"), os.W_OK): # udev fixes permissions shortly after export
+                    if time.monotonic() > deadline:
+                        raise PermissionError(f"{path}/period is not writable")
+                    time.sleep(0.01)
+            self._write(os.path.join(path, "duty_cycle"), 0) # Must not exceed the period while it changes
+            self._write(os.path.join(path, "period"), self.period_ns)
+            self._write(os.path.join(path, "enable"), 1)
+            self._duty_fds[i] = os.open(os.path.join(path, "duty_cycle"), os.O_WRONLY)
+
+
+    def set(self, left_dc: float, right_dc: float):
+        for i, dc in enumerate((left_dc, right_dc)):
+            fd = self._duty_fds[i]
+            if fd is None or dc == self.duty[i]:
+                continue
+            os.pwrite(fd, str(int(self.period_ns * max(0.0, min(100.0, dc)) / 100)).encode(), 0)
+        self.duty = (left_dc, right_dc)
+
+
+    def stop(self):
+        for i, channel in enumerate(self.channels):
+            fd = self._duty_fds[i]
+            if fd is None:
+                continue
+            os.pwrite(fd, b"0", 0)
+            os.close(fd)
+            self._duty_fds[i] = None
+            try:
+                self._write(os.path.join(self.chip_path, f"pwm{channel}", "enable"), 0)
+                self._write(os.path.join(self.chip_path, "unexport"), channel)
+            except OSError:
+                pass
+        self.duty = (0.0, 0.0)
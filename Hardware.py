@@ -0,0 +1,186 @@
+"""
+Hardware for NaviGlass
+Picks the camera, GPIO (ranging), haptic and audio backends in one place so
+nothing touches a device at import time. The "pi" backend is the glasses:
+Picamera2, RPi.GPIO, software PWM motors, espeak-ng and the YOLO model. The
+"sim" backend runs the same stack on any Linux box: SimulatedCamera with a
+synthetic scene or recorded frames, FakeGPIO sensors following a scripted
+distance profile, motors that only log their PWM commands, silent speech and
+a detector that finds the synthetic object (or a real model, see sim_model).
+
+The backend comes from NAVIGLASS_HARDWARE, else the "hardware" setting;
+"auto" uses the Pi when picamera2 and RPi.GPIO can be imported.
+"""
+
+import glob
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from AudioOutput import AudioOutput, EspeakAudio, SimulatedAudio
+from CameraSource import CameraSource, PicameraSource, SimulatedCamera
+from DetectorBackend import load_backend
+from FakeGPIO import FakeGPIO
+from HapticOutput import HapticOutput, PwmHaptics, SysfsPwmHaptics
+from UltrasonicRanger import UltrasonicRanger
+
+
+BACKENDS = ("pi", "sim")
+DEFAULT_DISTANCE_PROFILE = [[0, 350], [6, 350], [12, 60], [16, 60], [22, 350]] # Walk up to an object and away again
+
+
+def choose_backend(setting: str = "auto") -> str:
+    backend = (os.environ.get("NAVIGLASS_HARDWARE") or setting or "auto").lower()
+    if backend == "auto":
+        try:
+            import picamera2  # noqa: F401
+            import RPi.GPIO  # noqa: F401
+            return "pi"
+        except Exception:
+            return "sim"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown hardware backend {backend!r}, expected auto or one of {', '.join(BACKENDS)}")
+    return backend
+
+
+def distance_profile(keyframes: Sequence[Sequence[float]], loop: bool = True) -> Callable[[float], Optional[float]]:
+    """f(seconds since start) -> cm, linear between [t, cm] keyframes. A cm of None means no echo."""
+    points = sorted((float(t), cm) for t, cm in keyframes)
+    if not points:
+        return lambda t: None
+    period = points[-1][0]
+    start = time.monotonic()
+
+    def at(now: float) -> Optional[float]:
+        t = now - start
+        if loop and period > 0:
+            t %= period
+        if t <= points[0][0]:
+            return points[0][1]
+        for (t0, d0), (t1, d1) in zip(points, points[1:]):
+            if t <= t1:
+                if d0 is None or d1 is None:
+                    return d0
+                return d0 + (d1 - d0) * (t - t0) / (t1 - t0) if t1 > t0 else d1
+        return points[-1][1]
+    return at
+
+
+def load_frames(path: str, limit: int = 1000) -> List[np.ndarray]:
+    """BGR frames from a directory of images or from the JPEG frames of a session log."""
+    if os.path.isdir(path):
+        files = sorted(f for ext in ("jpg", "jpeg", "png") for f in glob.glob(os.path.join(path, f"*.{ext}")))
+        frames = [cv2.imread(f) for f in files[:limit]]
+        return [f for f in frames if f is not None]
+    from SessionLog import SessionLog, KIND_FRAME
+    log = SessionLog(path)
+    try:
+        frames = []
+        for rec in log:
+            if rec.kind == KIND_FRAME:
+                frame = cv2.imdecode(np.frombuffer(rec.payload, np.uint8), cv2.IMREAD_COLOR)
+                if frame is not None:
+                    frames.append(frame)
+                if len(frames) >= limit:
+                    break
+        return frames
+    finally:
+        log.close()
+
+
+class Hardware:
+
+    def __init__(self, backend: str, gpio, camera_factory: Callable[[], CameraSource], haptics: HapticOutput,
+                 audio: AudioOutput, detector: Optional[Dict] = None, distance_fn: Optional[Callable] = None):
+        self.backend = backend
+        self.gpio = gpio
+        self.camera_factory = camera_factory
+        self.camera: Optional[CameraSource] = None # Opened by open_camera(), which can take a while on the Pi
+        self.haptics = haptics
+        self.audio = audio
+        self.detector = detector # load_backend() spec, plain data so worker processes can build the same model
+        self.distance_fn = distance_fn # Scripted profile for the sim sensors
+        self.rangers: Dict[Tuple[int, int], UltrasonicRanger] = {}
+
+
+    @property
+    def simulated(self) -> bool:
+        return self.backend == "sim"
+
+
+    def open_camera(self) -> CameraSource:
+        if self.camera is None:
+            self.camera = self.camera_factory()
+        return self.camera
+
+
+    def load_model(self):
+        """Imports the model runtime on first use, so nothing heavy is loaded at startup."""
+        return load_backend(self.detector)
+
+
+    def attach_rangers(self, pins: Sequence[Tuple[int, int]]) -> Dict[Tuple[int, int], UltrasonicRanger]:
+        self.gpio.setmode(self.gpio.BOARD)
+        for trig, echo in pins:
+            if self.distance_fn is not None:
+                self.gpio.attach_sensor(trig, echo, self.distance_fn)
+            self.rangers[(trig, echo)] = UltrasonicRanger(trig, echo, gpio=self.gpio) # Edge callbacks on the echo pin
+        return self.rangers
+
+
+    def close(self):
+        if self.camera is not None:
+            self.camera.stop()
+        self.haptics.stop()
+        for ranger in self.rangers.values():
+            ranger.close()
+        self.gpio.cleanup() # Cleans up all GPIO ports upon exit
+
+
+
+def create_hardware(backend: str, settings: Dict, inference_size: Tuple[int, int],
+                    motor_pins: Tuple[int, int], detector_config: Optional[Dict] = None) -> Hardware:
+    display_size = tuple(settings.get("display_size", (640, 480)))
+    headless = settings.get("headless", False)
+    overlay_client = settings.get("overlay_mode", "server") == "client"
+
+    if backend == "pi":
+        import RPi.GPIO as gpio
+        # hardware_jpeg only helps when the browser draws the overlay, server-side boxes need a CPU encode anyway
+        def camera_factory():
+            return PicameraSource(inference_size=inference_size, display_size=display_size, headless=headless,
+                                  hardware_jpeg=settings.get("hardware_jpeg", False) and overlay_client,
+                                  jpeg_quality=settings.get("jpeg_quality", 80))
+        audio = EspeakAudio(volume=0.5)
+        distance_fn = None
+
+        detector = detector_config # Calibrated runtime from calibrate_backend.py, else YOLO on the ncnn export
+
+    elif backend == "sim":
+        gpio = FakeGPIO()
+        def camera_factory():
+            frames = load_frames(settings["sim_frames"]) if settings.get("sim_frames") else None
+            return SimulatedCamera(inference_size=inference_size, display_size=display_size, headless=headless,
+                                   fps=float(settings.get("sim_fps", 15.0)), images=frames)
+        audio = SimulatedAudio()
+        distance_fn = distance_profile(settings.get("sim_distance_profile") or DEFAULT_DISTANCE_PROFILE)
+        sim_model = settings.get("sim_model", "synthetic")
+
+        if sim_model == "synthetic":
+            detector = {"backend": "synthetic", "options": {"inference_ms": float(settings.get("sim_inference_ms", 0.0))}}
+        elif sim_model == "calibrated": # Whatever calibrate_backend.py chose on this machine
+            detector = detector_config
+        else: # A real model on the build machine, e.g. for recorded frames
+            detector = {"backend": "ultralytics", "model": sim_model}
+
+    else:
+        raise ValueError(f"Unknown hardware backend {backend!r}")
+
+    if backend == "pi" and settings.get("haptic_pwm", "software") == "hardware": # Kernel PWM on GPIO12/13
+        haptics = SysfsPwmHaptics(chip=int(settings.get("haptic_pwm_chip", 0)))
+    else:
+        haptics = PwmHaptics(gpio, motor_pins[0], motor_pins[1])
+    return Hardware(backend, gpio, camera_factory, haptics, audio, detector, distance_fn)
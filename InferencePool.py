@@ -0,0 +1,496 @@
+"""
+Inference Pool for NaviGlass
+Runs N detector replicas in worker processes so inference, with its Python
+pre/post-processing, can use every core instead of one GIL. Frames go to the
+workers through slots in one shared-memory block; only a (slot, frame id)
+tuple crosses the process boundary, and the workers write their detection rows
+back into the same slot. A collector thread frees the slots and re-sequences the
+results, so get() hands them out in submission order whichever worker
+finished first.
+
+A frame whose worker takes longer than stall_timeout from picking it up is
+given up on, but its slot is only reused once that worker answers. A worker
+that is still stuck on it is killed, and dead workers are replaced, so a crash
+costs one frame and not a replica. A replica that keeps dying before it is
+ready is respawned with a growing backoff and given up after MAX_RESPAWNS.
+
+Each replica is built from a load_backend() spec, the same plain-data config
+the in-process detector uses. With threads unset, the cores are split evenly
+between the replicas.
+
+    python InferencePool.py [--workers 1 2 3 4] [--inference-ms 80]   # throughput / latency per worker count
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import statistics
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from DetectorBackend import DetectionResult, load_backend
+from MetricsRegistry import METRICS
+from AsyncLogger import LOG
+
+
+MAX_DETECTIONS = 300
+ROW_FLOATS = 6 # cls, conf, x1, y1, x2, y2
+_RESULT_BYTES = 8 + MAX_DETECTIONS * ROW_FLOATS * 4 # int32 count, padding, float32 rows
+
+MAX_RESPAWNS = 5 # Respawns in a row without the replica becoming ready before it is given up
+RESPAWN_BACKOFF = 1.0 # Seconds before the second respawn in a row, doubling up to RESPAWN_BACKOFF_MAX
+RESPAWN_BACKOFF_MAX = 30.0
+
+LOG.set_rate_limit("inference_worker_error", 1.0)
+
+
+def _slot_layout(frame_size: Tuple[int, int]) -> Tuple[int, int]:
+    """(frame bytes, slot stride) for BGR frames of up to frame_size (w, h), slots 64-byte aligned."""
+    w, h = frame_size
+    frame_bytes = w * h * 3
+    return frame_bytes, (frame_bytes + _RESULT_BYTES + 63) & ~63
+
+
+def _views(buf, slot: int, frame_bytes: int, stride: int, shape: Tuple[int, int]):
+    """(frame, count, rows) numpy views into one slot, no copies."""
+    base = slot * stride
+    h, w = shape
+    frame = np.ndarray((h, w, 3), np.uint8, buf, base)
+    count = np.ndarray((1,), np.int32, buf, base + frame_bytes)
+    rows = np.ndarray((MAX_DETECTIONS, ROW_FLOATS), np.float32, buf, base + frame_bytes + 8)
+    return frame, count, rows
+
+
+def _worker(index: int, shm_name: str, frame_bytes: int, stride: int, config: Optional[Dict],
+            classes: Optional[List[int]], warmup_shape: Tuple[int, int], tasks, done):
+    from SessionLog import detection_rows
+    shm = shared_memory.SharedMemory(name=shm_name) # Spawned workers share the parent's resource tracker
+    try:
+        backend = load_backend(config)
+        blank = np.zeros((*warmup_shape, 3), np.uint8)
+        backend(blank, verbose=False, classes=classes) # Pay the first-inference cost before reporting ready
+        done.put(("ready", index, backend.names))
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slot, seq, h, w = task
+            done.put(("start", index, slot, seq)) # The stall clock runs from here, not from the queue
+            frame, count, rows = _views(shm.buf, slot, frame_bytes, stride, (h, w))
+            t0 = time.perf_counter_ns()
+            try:
+                result = backend(frame, verbose=False, classes=classes)[0]
+                out = result.rows if isinstance(result, DetectionResult) else detection_rows(result)
+            except Exception as e:
+                done.put(("error", index, slot, seq, repr(e)))
+                continue
+            n = min(len(out), MAX_DETECTIONS)
+            rows[:n] = out[:n]
+            count[0] = n
+            del frame, count, rows # Release the buffer exports before the next task
+            done.put(("done", index, slot, seq, time.perf_counter_ns() - t0))
+    except Exception as e:
+        done.put(("failed", index, repr(e)))
+    finally:
+        shm.close()
+
+
+
+class _Pending:
+
+    __slots__ = ("seq", "payload", "submitted_ns", "slot", "result", "worker_ns", "done", "worker", "started_ns")
+
+    def __init__(self, seq: int, payload: Any, submitted_ns: int, slot: Optional[int]):
+        self.seq = seq
+        self.payload = payload
+        self.submitted_ns = submitted_ns
+        self.slot = slot # None for pass-through items that need no inference
+        self.result = None
+        self.worker_ns = 0
+        self.done = slot is None
+        self.worker: Optional[int] = None # Replica that picked it up, and when
+        self.started_ns = 0
+
+
+class InferencePool:
+
+    def __init__(self, config: Optional[Dict], workers: int = 2, frame_size: Tuple[int, int] = (640, 480),
+                 classes: Optional[List[int]] = None, slots: Optional[int] = None,
+                 stall_timeout: float = 2.0, start_method: str = "spawn"):
+        self.workers = max(1, workers)
+        self.frame_size = tuple(frame_size) # Largest (w, h) frame that will be submitted
+        self.classes = list(classes) if classes is not None else None
+        self.slots = slots or self.workers * 2 # One in flight and one queued per worker
+        self.stall_timeout = stall_timeout # A result this late (e.g. a crashed worker) is given up on
+        self.config = dict(config or {"backend": "ultralytics", "model": "yolo11n_ncnn_model"})
+        if self.config.get("backend") != "ultralytics":
+            # Split the cores between the replicas instead of every replica spinning up one thread per core
+            per_worker = max(1, (self.config.get("threads") or os.cpu_count() or 1) // self.workers)
+            self.config["threads"] = per_worker
+        self._ctx = mp.get_context(start_method) # spawn: workers never inherit camera or logger threads
+        self._frame_bytes, self._stride = _slot_layout(self.frame_size)
+
+        self._shm = None
+        self._procs: List = []
+        self._tasks = None
+        self._done = None
+        self._cond = threading.Condition()
+        self._free: deque = deque(range(self.slots))
+        self._order: deque = deque() # Pending items in submission order
+        self._by_seq: Dict[int, _Pending] = {}
+        self._stalled: Dict[int, _Pending] = {} # Released as stalled, slot held until its worker answers or dies
+        self._seq = 0
+        self._running = False
+        self._collector = None
+        self.names: Dict[int, str] = {}
+
+        self.submitted = 0
+        self.completed = 0
+        self.errors = 0
+        self.stalled = 0
+        self.respawned = 0
+        self._failures: Dict[int, int] = {} # Worker -> respawns since it was last ready
+        self._respawn_at: Dict[int, float] = {}
+        self.given_up: List[int] = [] # Replicas that kept dying before becoming ready
+        self.reordered = 0 # Results that finished before an earlier frame and had to wait
+        self._m_queue = METRICS.histogram("naviglass_pool_wait_seconds", "Submit to in-order release per frame")
+        self._m_worker = METRICS.histogram("naviglass_pool_inference_seconds", "Inference time inside a worker")
+        METRICS.gauge("naviglass_pool_in_flight", "Frames submitted and not yet released").set_function(
+            lambda: len(self._order))
+
+
+    # --- Lifecycle ---
+
+    def start(self, timeout: float = 120.0):
+        """Start the workers and wait until every replica has loaded and warmed up its model."""
+        if self._running:
+            return
+        self._shm = shared_memory.SharedMemory(create=True, size=self._stride * self.slots)
+        self._tasks = self._ctx.Queue()
+        self._done = self._ctx.Queue()
+        self._procs = [self._spawn(i) for i in range(self.workers)]
+
+        ready = 0
+        deadline = time.monotonic() + timeout
+        while ready < self.workers:
+            try:
+                msg = self._done.get(timeout=max(0.1, deadline - time.monotonic()))
+            except queue.Empty:
+                self.stop()
+                raise TimeoutError(f"Inference workers not ready after {timeout:.0f} s")
+            if msg[0] == "ready":
+                ready += 1
+                self.names = msg[2]
+            elif msg[0] == "failed":
+                self.stop()
+                raise RuntimeError(f"Inference worker {msg[1]} failed to start: {msg[2]}")
+
+        self._running = True
+        self._collector = threading.Thread(target=self._collect, daemon=True, name="inference-collector")
+        self._collector.start()
+        print(f"Inference pool started with {self.workers} worker(s), {self.config.get('threads') or 'default'} "
+              f"thread(s) each.")
+
+
+    def _spawn(self, index: int):
+        w, h = self.frame_size
+        proc = self._ctx.Process(target=_worker, name=f"inference-{index}", daemon=True,
+                                 args=(index, self._shm.name, self._frame_bytes, self._stride, self.config,
+                                       self.classes, (h, w), self._tasks, self._done))
+        proc.start()
+        return proc
+
+
+    def stop(self):
+        self._running = False
+        if self._tasks is not None:
+            for _ in self._procs:
+                self._tasks.put(None)
+        for proc in self._procs:
+            proc.join(timeout=2)
+            if proc.is_alive():
+                proc.terminate()
+        self._procs = []
+        if self._collector:
+            self._collector.join(timeout=2)
+        with self._cond:
+            self._cond.notify_all()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+    # --- Producer side ---
+
+    def submit(self, image: Optional[np.ndarray], payload: Any = None, timeout: float = 1.0) -> bool:
+        """Queue a frame for inference. image None passes payload through in order without inference.
+        Blocks while every slot is busy; returns False if none freed up within timeout."""
+        submitted_ns = time.monotonic_ns()
+        with self._cond:
+            slot = None
+            if image is not None:
+                deadline = time.monotonic() + timeout
+                while not self._free and self._running:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                if not self._running:
+                    return False
+                slot = self._free.popleft()
+            seq = self._seq
+            self._seq += 1
+            pending = _Pending(seq, payload, submitted_ns, slot)
+            self._order.append(pending)
+            self._by_seq[seq] = pending
+            self.submitted += 1
+            if slot is None:
+                self._cond.notify_all()
+                return True
+
+        h, w = image.shape[:2]
+        if w * h * 3 > self._frame_bytes:
+            raise ValueError(f"Frame {w}x{h} is larger than the pool's {self.frame_size[0]}x{self.frame_size[1]} slots")
+        frame, _, _ = _views(self._shm.buf, slot, self._frame_bytes, self._stride, (h, w))
+        np.copyto(frame, image) # The only copy: camera buffer into shared memory
+        del frame
+        self._tasks.put((slot, seq, h, w))
+        return True
+
+
+    # --- Collector thread ---
+
+    def _collect(self):
+        while self._running:
+            try:
+                msg = self._done.get(timeout=0.5)
+            except (queue.Empty, OSError, EOFError):
+                self._supervise()
+                continue
+            kind = msg[0]
+            if kind == "failed":
+                LOG.error("inference_worker_error", worker=msg[1], error=msg[2])
+            elif kind == "ready":
+                self._failures[msg[1]] = 0 # A respawn that loaded its model resets the backoff
+            if kind not in ("start", "done", "error"):
+                continue
+            _, worker, slot, seq = msg[:4]
+            with self._cond:
+                if kind == "start":
+                    pending = self._by_seq.get(seq) or self._stalled.get(seq)
+                    if pending is not None:
+                        pending.worker, pending.started_ns = worker, time.monotonic_ns()
+                    continue
+                stalled = self._stalled.pop(seq, None)
+                if stalled is not None: # Released long ago; only now is the worker done with the slot
+                    self._free.append(slot)
+                    self._cond.notify_all()
+                    continue
+                pending = self._by_seq.get(seq)
+                if pending is None or pending.done:
+                    continue
+                if kind == "done":
+                    _, count, rows = _views(self._shm.buf, slot, self._frame_bytes, self._stride, (1, 1))
+                    pending.result = DetectionResult(rows[:int(count[0])].copy(), self.names)
+                    del count, rows
+                    pending.worker_ns = msg[4]
+                    self._m_worker.observe(msg[4] / 1e9)
+                else:
+                    self.errors += 1
+                    LOG.error("inference_worker_error", worker=worker, error=msg[4])
+                pending.done = True
+                if self._order and self._order[0] is not pending:
+                    self.reordered += 1
+                self._free.append(slot)
+                self._cond.notify_all()
+            self._supervise()
+
+
+    def _supervise(self):
+        """Kill workers stuck past stall_timeout, replace dead ones and free the slots they held."""
+        now = time.monotonic_ns()
+        with self._cond:
+            hung = {p.worker for p in self._stalled.values()
+                    if p.worker is not None and now - p.started_ns > 2 * self.stall_timeout * 1e9}
+        dead = []
+        for i, proc in enumerate(self._procs):
+            if i in hung and proc.is_alive():
+                proc.kill() # Stuck in native code, SIGTERM may never be handled
+                proc.join(timeout=1)
+            if not proc.is_alive() and self._running:
+                dead.append(i)
+        if not dead:
+            return
+        now_s = time.monotonic()
+        for i in dead:
+            if i in self.given_up or now_s < self._respawn_at.get(i, 0.0):
+                continue
+            failures = self._failures.get(i, 0)
+            if failures >= MAX_RESPAWNS: # e.g. the model no longer loads or fits in memory; stop reloading it
+                self.given_up.append(i)
+                LOG.error("inference_worker_given_up", worker=i, respawns=failures,
+                          exitcode=self._procs[i].exitcode, workers_left=self.workers - len(self.given_up))
+                continue
+            LOG.warning("inference_worker_respawned", worker=i, exitcode=self._procs[i].exitcode)
+            self._failures[i] = failures + 1
+            self._respawn_at[i] = now_s + min(RESPAWN_BACKOFF_MAX, RESPAWN_BACKOFF * 2 ** failures)
+            self._procs[i] = self._spawn(i)
+            self.respawned += 1
+        with self._cond:
+            for seq, pending in list(self._stalled.items()):
+                if pending.worker in dead:
+                    del self._stalled[seq]
+                    self._free.append(pending.slot)
+            for pending in self._by_seq.values():
+                if not pending.done and pending.slot is not None and pending.worker in dead:
+                    pending.done = True # Its worker died mid-inference: release it without a result
+                    self.errors += 1
+                    self._free.append(pending.slot)
+            self._cond.notify_all()
+
+
+    # --- Consumer side ---
+
+    def get(self, timeout: float = 0.5) -> Optional[Tuple[Any, Optional[DetectionResult], int]]:
+        """Next (payload, result, worker_ns) in submission order, or None on timeout.
+        result is None for pass-through items and for frames whose inference failed."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._order:
+                    head = self._order[0]
+                    now = time.monotonic_ns()
+                    if not head.done and (head.started_ns and now - head.started_ns > self.stall_timeout * 1e9
+                                          or now - head.submitted_ns > self.stall_timeout * self.slots * 1e9):
+                        head.done = True # Worker hung, don't hold every later frame back
+                        self.stalled += 1
+                        self._stalled[head.seq] = head # The worker may still write to the slot; keep it reserved
+                    if head.done:
+                        self._order.popleft()
+                        self._by_seq.pop(head.seq, None)
+                        self.completed += 1
+                        self._m_queue.observe((time.monotonic_ns() - head.submitted_ns) / 1e9)
+                        return head.payload, head.result, head.worker_ns
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    return None
+                self._cond.wait(min(remaining, self.stall_timeout))
+
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for p in self._procs if p.is_alive()),
+            "threads_per_worker": self.config.get("threads"),
+            "slots": self.slots,
+            "free_slots": len(self._free),
+            "in_flight": len(self._order),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "reordered": self.reordered,
+            "errors": self.errors,
+            "stalled": self.stalled,
+            "respawned": self.respawned,
+            "given_up": list(self.given_up),
+        }
+
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def _measure(pool: InferencePool, frames: List[np.ndarray], duration: float, fps: float) -> Dict:
+    """Submit for duration seconds, flat out (fps 0) or paced like the camera; release order is checked."""
+    latencies: List[float] = []
+    stop_at = time.monotonic() + duration
+
+    def feed():
+        i = 0
+        next_at = time.monotonic()
+        while time.monotonic() < stop_at:
+            if fps > 0:
+                time.sleep(max(0.0, next_at - time.monotonic()))
+                next_at += 1.0 / fps
+            if pool.submit(frames[i % len(frames)], (i, time.monotonic_ns())):
+                i += 1
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    started = time.monotonic()
+    feeder.start()
+    expected = 0
+    in_order = True
+    while feeder.is_alive() or pool.stats()["in_flight"]:
+        item = pool.get(timeout=0.5)
+        if item is None:
+            continue
+        (index, submitted_ns), _, _ = item
+        in_order = in_order and index == expected
+        expected = index + 1
+        latencies.append((time.monotonic_ns() - submitted_ns) / 1e6)
+    elapsed = time.monotonic() - started
+    return {"fps": round(len(latencies) / elapsed, 2),
+            "latency_p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+            "latency_p95_ms": round(_percentile(latencies, 0.95), 1) if latencies else None,
+            "in_order": in_order}
+
+
+def benchmark(config: Optional[Dict], workers: Sequence[int], frames: List[np.ndarray], duration: float,
+              camera_fps: float = 10.0, classes: Optional[List[int]] = None) -> List[Dict]:
+    """Per worker count: saturated throughput and its latency, then latency at the camera's pace."""
+    h, w = frames[0].shape[:2]
+    out = []
+    for n in workers:
+        pool = InferencePool(config, n, (w, h), classes)
+        pool.start()
+        saturated = _measure(pool, frames, duration, 0)
+        paced = _measure(pool, frames, duration, camera_fps)
+        stats = pool.stats()
+        pool.stop()
+        out.append({"workers": n, "threads_per_worker": stats["threads_per_worker"],
+                    "max_fps": saturated["fps"], "saturated_p50_ms": saturated["latency_p50_ms"],
+                    "saturated_p95_ms": saturated["latency_p95_ms"],
+                    f"at_{camera_fps:g}fps": paced["fps"], "paced_p50_ms": paced["latency_p50_ms"],
+                    "paced_p95_ms": paced["latency_p95_ms"], "reordered": stats["reordered"],
+                    "in_order": saturated["in_order"] and paced["in_order"]})
+    return out
+
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from CameraSource import SimulatedCamera, fit_size
+    from DetectorBackend import load_backend_config
+
+    parser = argparse.ArgumentParser(description="Throughput versus latency of the inference pool per worker count.")
+    parser.add_argument("--workers", nargs="*", type=int, default=[1, 2, 3, 4])
+    parser.add_argument("--config", default="detector_backend.json", help="Detector spec from calibrate_backend.py")
+    parser.add_argument("--inference-ms", type=float, default=80.0,
+                        help="Per-frame cost of the synthetic detector when no calibrated config exists")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per pass")
+    parser.add_argument("--camera-fps", type=float, default=10.0, help="Pace of the latency pass")
+    args = parser.parse_args()
+
+    config = load_backend_config(args.config)
+    if config is None:
+        print(f"No {args.config}, using the synthetic detector at {args.inference_ms:.0f} ms per frame")
+        config = {"backend": "synthetic", "options": {"inference_ms": args.inference_ms}}
+    size = fit_size(config.get("imgsz", 640))
+    camera = SimulatedCamera(size, size, fps=1000)
+    frames = [camera.capture(want_main=False).lores for _ in range(16)]
+
+    t0 = time.perf_counter()
+    backend = load_backend(config)
+    for f in frames:
+        backend(f, verbose=False)
+    print(f"in-process baseline: {len(frames) / (time.perf_counter() - t0):.2f} FPS")
+    for row in benchmark(config, args.workers, frames, args.duration, args.camera_fps):
+        print(json.dumps(row))
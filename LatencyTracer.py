@@ -0,0 +1,145 @@
+"""
+Latency Tracer for NaviGlass
+Follows each frame from the moment the sensor captured it to the moment the
+user feels or hears something. Stages record spans on the monotonic clock,
+keyed by frame id, into a fixed-size ring buffer; the buffer can be exported as
+Chrome trace-event JSON (chrome://tracing or ui.perfetto.dev) to see where the
+milliseconds go.
+
+Timestamps are time.monotonic_ns(), the same clock (CLOCK_MONOTONIC) as the
+Picamera2 "SensorTimestamp" metadata, so capture times from the camera driver
+can be compared directly with times taken in Python.
+"""
+
+import itertools
+import json
+import os
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional
+from MetricsRegistry import METRICS
+
+
+REACTION_BUCKETS = (0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0)
+
+
+class LatencyTracer:
+
+    def __init__(self, capacity: int = 4096, enabled: bool = True):
+        self.capacity = capacity
+        self.enabled = enabled
+        self._spans: List[Optional[tuple]] = [None] * capacity
+        self._counter = itertools.count() # next() is atomic under the GIL, so writers need no lock
+        self._tracks: Dict[str, int] = {}
+        self._tracks_lock = threading.Lock()
+        self._m_reaction = {
+            kind: METRICS.histogram(f"naviglass_frame_to_{kind}_seconds",
+                                    f"Sensor capture to {kind} output", buckets=REACTION_BUCKETS)
+            for kind in ("haptic", "speech")
+        }
+
+
+    def _track_id(self, track: str) -> int:
+        tid = self._tracks.get(track)
+        if tid is None:
+            with self._tracks_lock:
+                tid = self._tracks.setdefault(track, len(self._tracks) + 1)
+        return tid
+
+
+    def span(self, name: str, start_ns: int, end_ns: Optional[int] = None, frame_id: int = -1,
+             track: str = "detector", args: Optional[Dict] = None):
+        """Record [start_ns, end_ns] for one frame. end_ns defaults to now."""
+        if not self.enabled:
+            return
+        if end_ns is None:
+            end_ns = time.monotonic_ns()
+        seq = next(self._counter)
+        self._spans[seq % self.capacity] = (seq, name, start_ns, end_ns, frame_id, self._track_id(track), args)
+
+
+    def instant(self, name: str, frame_id: int = -1, track: str = "detector", args: Optional[Dict] = None):
+        now = time.monotonic_ns()
+        self.span(name, now, now, frame_id, track, args)
+
+
+    def reaction(self, kind: str, frame_id: int, capture_ns: int, args: Optional[Dict] = None) -> Optional[float]:
+        """User-visible output ("haptic" / "speech") caused by a frame. Returns seconds since capture."""
+        if not capture_ns:
+            return None
+        now = time.monotonic_ns()
+        seconds = (now - capture_ns) / 1e9
+        hist = self._m_reaction.get(kind)
+        if hist is not None:
+            hist.observe(seconds)
+        self.span(f"frame_to_{kind}", capture_ns, now, frame_id, "reaction", args)
+        return seconds
+
+
+    def spans(self) -> List[tuple]:
+        """(name, start_ns, end_ns, frame_id, tid, args), oldest to newest."""
+        recorded = sorted(s for s in list(self._spans) if s is not None)
+        return [s[1:] for s in recorded]
+
+
+    def chrome_trace(self) -> Dict:
+        """Chrome trace-event JSON object, one complete ("X") event per span."""
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": track}}
+                  for track, tid in list(self._tracks.items())]
+        for name, start_ns, end_ns, frame_id, tid, args in self.spans():
+            event_args = {"frame_id": frame_id}
+            if args:
+                event_args.update(args)
+            events.append({"name": name, "ph": "X", "pid": pid, "tid": tid, "ts": start_ns / 1000,
+                           "dur": max(end_ns - start_ns, 0) / 1000, "args": event_args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+    def summary(self) -> Dict:
+        """p50 / p95 / max in ms per span name over what is still in the ring buffer."""
+        durations: Dict[str, List[float]] = {}
+        for name, start_ns, end_ns, _, _, _ in self.spans():
+            durations.setdefault(name, []).append((end_ns - start_ns) / 1e6)
+        out = {}
+        for name, values in sorted(durations.items()):
+            values.sort()
+            out[name] = {
+                "count": len(values),
+                "p50_ms": round(statistics.median(values), 2),
+                "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+                "max_ms": round(values[-1], 2),
+            }
+        return out
+
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+
+TRACER = LatencyTracer() # Shared by every module in this process
+
+
+if __name__ == "__main__":
+    # Cost of recording a span, and a small synthetic frame flow to check the export
+    tracer = LatencyTracer()
+    n = 200000
+    t0 = time.perf_counter()
+    for i in range(n):
+        tracer.span("bench", 0, 1, i)
+    print(f"span(): {(time.perf_counter() - t0) / n * 1e9:.0f} ns per call")
+
+    tracer = LatencyTracer()
+    for frame_id in range(5):
+        capture = time.monotonic_ns()
+        time.sleep(0.004)
+        tracer.span("capture", capture, frame_id=frame_id, track="capture")
+        start = time.monotonic_ns()
+        time.sleep(0.02)
+        tracer.span("inference", start, frame_id=frame_id, track="inference")
+        tracer.reaction("haptic", frame_id, capture)
+    print(json.dumps(tracer.summary(), indent=2))
+    print(f"{len(tracer.chrome_trace()['traceEvents'])} trace events")
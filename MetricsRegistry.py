@@ -0,0 +1,239 @@
+"""
+Metrics Registry for NaviGlass
+Counters, gauges and fixed-bucket histograms cheap enough to leave on in
+production: recording a sample is an attribute add or a bisect into a short
+bucket list, with no lock and no allocation. Everything is rendered on demand
+in the Prometheus text format for /api/metrics.
+
+Each process has its own METRICS registry. Series are get-or-create by name and
+labels, so any module can look up the same histogram without passing it around.
+Updates are not locked; with several writers on one series a sample may very
+rarely be lost, which is fine for monitoring.
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Seconds, from a fast GPIO edge up to a slow TTS utterance
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+    def samples(self, name: str, labels: LabelKey) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+
+class Gauge:
+
+    __slots__ = ("value", "fn")
+
+    def __init__(self):
+        self.value = 0.0
+        self.fn = None # Optional callback evaluated at scrape time instead of value
+
+
+    def set(self, value: float):
+        self.value = value
+
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+    def set_function(self, fn: Callable[[], float]):
+        self.fn = fn
+
+
+    def get(self) -> float:
+        if self.fn is not None:
+            try:
+                return float(self.fn())
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+    def samples(self, name: str, labels: LabelKey) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {_format_value(self.get())}"]
+
+
+class Histogram:
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1) # Per bucket, not cumulative; the last one is +Inf
+        self.sum = 0.0
+
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th sample, a rough percentile for /api/stream_stats."""
+        total = self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+    def samples(self, name: str, labels: LabelKey) -> List[str]:
+        counts = list(self.counts) # Snapshot so buckets, sum and count agree with each other
+        out = []
+        cumulative = 0
+        for bound, n in zip(self.bounds, counts):
+            cumulative += n
+            out.append(f"{name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {cumulative}")
+        cumulative += counts[-1]
+        out.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {cumulative}")
+        out.append(f"{name}_sum{_format_labels(labels)} {_format_value(self.sum)}")
+        out.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return out
+
+
+
+def _format_labels(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock() # Only taken to create a series or render, never to record
+        self._families: Dict[str, Tuple[str, str, Dict[LabelKey, object]]] = {} # name -> (type, help, series)
+
+
+    def _get(self, kind: str, cls, name: str, help_text: str, labels: Optional[Dict[str, str]], *args):
+        key: LabelKey = tuple(sorted((labels or {}).items()))
+        family = self._families.get(name)
+        if family is not None:
+            series = family[2].get(key)
+            if series is not None:
+                return series
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help_text, {}))
+            if family[0] != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family[0]}")
+            series = family[2].get(key)
+            if series is None:
+                series = family[2][key] = cls(*args)
+            return series
+
+
+    def counter(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get("counter", Counter, name, help_text, labels)
+
+
+    def gauge(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._get("gauge", Gauge, name, help_text, labels)
+
+
+    def histogram(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None,
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get("histogram", Histogram, name, help_text, labels, buckets)
+
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            families = [(name, kind, help_text, list(series.items()))
+                        for name, (kind, help_text, series) in sorted(self._families.items())]
+        lines = []
+        for name, kind, help_text, series in families:
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series:
+                lines.extend(metric.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+
+METRICS = MetricsRegistry() # Shared by every module in this process
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+if __name__ == "__main__":
+    # Per-sample recording cost, the number that decides whether instrumentation can stay on
+    import time
+
+    registry = MetricsRegistry()
+    hist = registry.histogram("bench_seconds", "Benchmark histogram", {"stage": "inference"})
+    counter = registry.counter("bench_total", "Benchmark counter")
+    gauge = registry.gauge("bench_gauge", "Benchmark gauge")
+    n = 1_000_000
+    values = [(i % 997) / 997 * 0.2 for i in range(1000)]
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        hist.observe(values[i % 1000])
+    print(f"Histogram.observe {(time.perf_counter() - t0) / n * 1e9:6.0f} ns per sample")
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        counter.inc()
+    print(f"Counter.inc       {(time.perf_counter() - t0) / n * 1e9:6.0f} ns per sample")
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        gauge.set(values[i % 1000])
+    print(f"Gauge.set         {(time.perf_counter() - t0) / n * 1e9:6.0f} ns per sample")
+
+    perf = time.perf_counter
+    t0 = perf()
+    for i in range(n):
+        start = perf()
+        hist.observe(perf() - start)
+    print(f"timed observe     {(perf() - t0) / n * 1e9:6.0f} ns per sample (incl. two perf_counter calls)")
+    print("(all figures include the Python loop itself)")
+
+    t0 = perf()
+    text = registry.render()
+    print(f"render: {len(text.splitlines())} lines in {(perf() - t0) * 1e6:.0f} us")
@@ -0,0 +1,415 @@
+"""
+Model Export for NaviGlass
+Builds the model the glasses ship. It cuts YOLO's classification head down to
+the classes the app detects (DETECT_CLASSES), or fine-tunes a 10-class model on
+our own data. It exports that model to ONNX and ncnn and adds int8 variants
+calibrated on frames recorded from the glasses. Each variant is scored for mAP
+on labeled clips and for latency on this CPU.
+
+Everything goes into a versioned artifact directory:
+
+    models/naviglass-yolo11n-10c-416-v3/
+        manifest.json       classes, input size, per-variant mAP / latency, the default variant
+        pruned.pt           the 10-class PyTorch model the exports came from
+        model-fp32.onnx     model-int8.onnx
+        ncnn-fp32/          ncnn-int8/
+
+Point the "model_artifact" setting at the directory (or at models/ for the
+newest version) and the detector loads its default variant instead of the
+stock yolo11n_ncnn_model. Pruned heads keep COCO class ids in their results,
+through the manifest's class map.
+
+Labeled clips are images with YOLO-format .txt labels (COCO class ids, "cls cx
+cy w h" normalized), next to the image or in a sibling labels/ directory.
+
+    python ModelExport.py build --weights yolo11n.pt --frames session.nglog --clips clips/ --imgsz 416
+    python ModelExport.py evaluate models/ --clips clips/
+
+Needs ultralytics (and torch) for pruning and export, onnxruntime for the ONNX
+int8 variant, and ncnn's ncnn2table / ncnn2int8 tools for the ncnn one. An int8
+variant whose tool is missing is skipped with a message.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from DetectorBackend import COCO_NAMES, RawYoloBackend, cpu_fingerprint, create_backend, resolve_artifact
+from FastDetector import FastDetector
+
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10) # COCO mAP@0.5:0.95
+MAX_ACCURACY_DROP = 0.02 # mAP50-95 an int8 variant may lose against fp32 and still be the default
+FORMATS = {"onnx": "onnxruntime", "ncnn": "ncnn"}
+
+
+# --- Pruning and export (ultralytics) ---
+
+def prune_head(weights: str, classes: Sequence[int], output: str) -> str:
+    """Keep only the class channels of YOLO's Detect head. Box regression is untouched and the kept classes
+    score exactly as before, so no retraining is needed; row i of the new head is COCO class classes[i]."""
+    import torch
+    from ultralytics import YOLO
+    yolo = YOLO(weights)
+    detect = yolo.model.model[-1]
+    index = torch.tensor(list(classes))
+    for branch in ("cv3", "one2one_cv3"): # one2one_cv3 only exists on end-to-end heads
+        for seq in getattr(detect, branch, []):
+            conv = seq[-1] # nn.Conv2d(c3, nc, 1), the per-scale class logits
+            pruned = torch.nn.Conv2d(conv.in_channels, len(classes), 1, bias=True)
+            pruned.weight.data = conv.weight.data[index].clone()
+            pruned.bias.data = conv.bias.data[index].clone()
+            seq[-1] = pruned
+    detect.nc = len(classes)
+    detect.no = detect.nc + detect.reg_max * 4
+    yolo.model.nc = len(classes)
+    yolo.model.yaml["nc"] = len(classes)
+    yolo.model.names = {i: COCO_NAMES[c] for i, c in enumerate(classes)}
+    yolo.save(output)
+    return output
+
+
+def finetune(weights: str, data: str, epochs: int, imgsz: int, output: str) -> str:
+    """Train the pruned model further on our own dataset. The dataset yaml lists the classes in head order."""
+    from ultralytics import YOLO
+    results = YOLO(weights).train(data=data, epochs=epochs, imgsz=imgsz, project=os.path.dirname(output) or ".",
+                                  name="finetune", exist_ok=True, verbose=False)
+    best = os.path.join(str(results.save_dir), "weights", "best.pt")
+    shutil.copyfile(best, output)
+    return output
+
+
+def export(weights: str, fmt: str, imgsz: int, destination: str) -> str:
+    """fp32 ONNX file or ncnn directory at a fixed input size, moved to destination."""
+    from ultralytics import YOLO
+    exported = YOLO(weights).export(format=fmt, imgsz=imgsz, dynamic=False, simplify=True, verbose=False)
+    if os.path.exists(destination):
+        shutil.rmtree(destination) if os.path.isdir(destination) else os.remove(destination)
+    shutil.move(str(exported), destination)
+    return destination
+
+
+# --- int8 quantization ---
+
+def calibration_blobs(frames: List[np.ndarray], imgsz: int) -> List[np.ndarray]:
+    """Frames letterboxed exactly as RawYoloBackend feeds the model."""
+    letterbox = RawYoloBackend("", None, imgsz)
+    return [letterbox.preprocess(frame)[0] for frame in frames]
+
+
+def quantize_onnx(model: str, frames: List[np.ndarray], imgsz: int, output: str) -> str:
+    """Static int8 (QDQ, per-channel weights) calibrated on recorded frames. The Detect head's box
+    decoding stays in float, quantizing it costs accuracy for almost no speed."""
+    import onnx
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                          quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    graph = onnx.load(model).graph
+    input_name = graph.input[0].name
+    layers = [int(m.group(1)) for n in graph.node for m in [re.match(r"/model\.(\d+)/", n.name)] if m]
+    head = f"/model.{max(layers)}/" if layers else None
+    exclude = [n.name for n in graph.node if head and n.name.startswith(head) and n.op_type != "Conv"]
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._blobs = iter(calibration_blobs(frames, imgsz))
+
+        def get_next(self):
+            blob = next(self._blobs, None)
+            return None if blob is None else {input_name: blob}
+
+    prepared = output + ".prep.onnx"
+    quant_pre_process(model, prepared)
+    try:
+        quantize_static(prepared, output, FrameReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                        calibrate_method=CalibrationMethod.Percentile, nodes_to_exclude=exclude)
+    finally:
+        os.remove(prepared)
+    return output
+
+
+def quantize_ncnn(model_dir: str, frames: List[np.ndarray], imgsz: int, output_dir: str, threads: int = 4) -> str:
+    """ncnn int8 through ncnn's own tools: a KL calibration table from the frames, then ncnn2int8."""
+    for tool in ("ncnn2table", "ncnn2int8"):
+        if shutil.which(tool) is None:
+            raise FileNotFoundError(f"{tool} not found; build ncnn with NCNN_BUILD_TOOLS=ON")
+    os.makedirs(output_dir, exist_ok=True)
+    param, weights = os.path.join(model_dir, "model.ncnn.param"), os.path.join(model_dir, "model.ncnn.bin")
+    table = os.path.join(output_dir, "model.table")
+    with tempfile.TemporaryDirectory() as tmp:
+        letterbox = RawYoloBackend("", None, imgsz)
+        paths = []
+        for i, frame in enumerate(frames): # Letterboxed already, so ncnn2table's resize is a no-op
+            blob = letterbox.preprocess(frame)[0][0]
+            path = os.path.join(tmp, f"{i:05d}.png")
+            cv2.imwrite(path, cv2.cvtColor((blob.transpose(1, 2, 0) * 255).round().astype(np.uint8), cv2.COLOR_RGB2BGR))
+            paths.append(path)
+        listing = os.path.join(tmp, "images.txt")
+        with open(listing, "w") as f:
+            f.write("\n".join(paths) + "\n")
+        norm = 1 / 255.0
+        _run(["ncnn2table", param, weights, listing, table, "mean=[0,0,0]", f"norm=[{norm},{norm},{norm}]",
+              f"shape=[{imgsz},{imgsz},3]", "pixel=RGB", f"thread={threads}", "method=kl"])
+    _run(["ncnn2int8", param, weights, os.path.join(output_dir, "model.ncnn.param"),
+          os.path.join(output_dir, "model.ncnn.bin"), table])
+    meta = os.path.join(model_dir, "metadata.yaml")
+    if os.path.exists(meta):
+        shutil.copy(meta, output_dir)
+    return output_dir
+
+
+def _run(cmd: List[str]):
+    import subprocess
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{cmd[0]} failed: {(result.stderr or result.stdout).strip()[-500:]}")
+
+
+# --- Evaluation ---
+
+def load_clips(path: str, limit: int = 2000) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """(BGR image, (M, 5) rows of cls, x1, y1, x2, y2 normalized) for every labeled image under path."""
+    files = sorted(f for ext in ("jpg", "jpeg", "png")
+                   for f in glob.glob(os.path.join(path, "**", f"*.{ext}"), recursive=True))
+    out = []
+    for image_path in files[:limit]:
+        stem = os.path.splitext(image_path)[0]
+        candidates = (stem + ".txt", stem.replace(f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}") + ".txt")
+        label_path = next((p for p in candidates if os.path.exists(p)), None)
+        if label_path is None:
+            continue
+        image = cv2.imread(image_path)
+        if image is None:
+            continue
+        rows = np.loadtxt(label_path, ndmin=2, dtype=np.float64).reshape(-1, 5) if os.path.getsize(label_path) \
+            else np.empty((0, 5))
+        cx, cy, w, h = rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4]
+        out.append((image, np.stack([rows[:, 0], cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)))
+    return out
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """(N, M) IoU of xyxy boxes."""
+    w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    inter = np.maximum(w, 0) * np.maximum(h, 0)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _match(det: np.ndarray, truth: np.ndarray) -> np.ndarray:
+    """True positives per detection and IoU threshold, detections sorted by confidence, each truth used once."""
+    tp = np.zeros((len(det), len(IOU_THRESHOLDS)), bool)
+    if not len(det) or not len(truth):
+        return tp
+    iou = np.where(det[:, None, 0] == truth[None, :, 0], box_iou(det[:, 2:6], truth[:, 1:5]), 0.0)
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        taken = np.zeros(len(truth), bool)
+        for i in range(len(det)):
+            options = np.where(taken, -1.0, iou[i])
+            j = int(options.argmax())
+            if options[j] >= threshold:
+                taken[j] = True
+                tp[i, t] = True
+    return tp
+
+
+def _average_precision(tp: np.ndarray, count: int) -> np.ndarray:
+    """COCO 101-point AP per IoU threshold for one class; tp is sorted by confidence."""
+    ctp = np.cumsum(tp, axis=0)
+    cfp = np.cumsum(~tp, axis=0)
+    recall = ctp / max(count, 1)
+    precision = ctp / np.maximum(ctp + cfp, 1)
+    points = np.linspace(0, 1, 101)
+    ap = np.zeros(tp.shape[1])
+    for t in range(tp.shape[1]):
+        envelope = np.maximum.accumulate(precision[::-1, t])[::-1] # Best precision at this recall or beyond
+        idx = np.searchsorted(recall[:, t], points, side="left")
+        ap[t] = np.where(idx < len(envelope), envelope[np.minimum(idx, len(envelope) - 1)], 0).mean()
+    return ap
+
+
+def mean_average_precision(detections: List[np.ndarray], truths: List[np.ndarray], classes: Sequence[int]) -> Dict:
+    """mAP over classes from per-image (N, 6) detection rows (cls, conf, xyxy) and (M, 5) truth rows."""
+    tps, confs, clss = [], [], []
+    counts = {c: 0 for c in classes}
+    for det, truth in zip(detections, truths):
+        truth = truth[np.isin(truth[:, 0], classes)]
+        det = det[np.isin(det[:, 0], classes)]
+        det = det[np.argsort(-det[:, 1])]
+        for c in truth[:, 0].astype(int):
+            counts[c] += 1
+        tps.append(_match(det, truth))
+        confs.append(det[:, 1])
+        clss.append(det[:, 0])
+    tp, conf, cls = np.concatenate(tps), np.concatenate(confs), np.concatenate(clss)
+    per_class = {}
+    for c, count in counts.items():
+        if count == 0:
+            continue
+        mask = cls == c
+        order = np.argsort(-conf[mask], kind="stable")
+        per_class[COCO_NAMES[c]] = _average_precision(tp[mask][order], count) if mask.any() else np.zeros(len(IOU_THRESHOLDS))
+    if not per_class:
+        return {"map50": None, "map50_95": None, "classes": {}}
+    aps = np.stack(list(per_class.values()))
+    return {"map50": round(float(aps[:, 0].mean()), 4), "map50_95": round(float(aps.mean()), 4),
+            "classes": {name: round(float(ap[0]), 4) for name, ap in per_class.items()}}
+
+
+def evaluate(spec: Dict, classes: Sequence[int], clips: List[Tuple[np.ndarray, np.ndarray]],
+             frames: List[np.ndarray], runs: int = 100, threads: Optional[int] = None) -> Dict:
+    """mAP of the raw detections on labeled clips, and per-frame latency of the app's path (FastDetector) on frames."""
+    options = spec.get("options", {})
+    result: Dict = {}
+    if clips:
+        backend = create_backend(spec["backend"], spec["model"], threads, spec["imgsz"], conf=0.001, **options)
+        detections = [backend(image, classes=classes)[0].rows for image, _ in clips]
+        result.update(mean_average_precision(detections, [truth for _, truth in clips], classes))
+    fast = FastDetector(create_backend(spec["backend"], spec["model"], threads, spec["imgsz"], **options), classes)
+    for frame in frames[:3]: # Warm-up
+        fast.detect(frame)
+    latencies = []
+    for i in range(runs):
+        t0 = time.perf_counter()
+        fast.detect(frames[i % len(frames)])
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    result.update(p50_ms=round(statistics.median(latencies), 2),
+                  p95_ms=round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2))
+    return result
+
+
+def choose_default(variants: Dict[str, Dict], max_drop: float = MAX_ACCURACY_DROP) -> str:
+    """Fastest variant within max_drop mAP50-95 of the best fp32 one; without labels only fp32 qualifies."""
+    measured = {n: v for n, v in variants.items() if v.get("p50_ms") is not None}
+    fp32 = [v.get("map50_95") for v in measured.values() if v["precision"] == "fp32" and v.get("map50_95") is not None]
+    if fp32:
+        floor = max(fp32) - max_drop
+        ok = [n for n, v in measured.items() if v.get("map50_95") is not None and v["map50_95"] >= floor]
+    else:
+        ok = [n for n, v in measured.items() if v["precision"] == "fp32"]
+    pool = ok or list(measured) or list(variants)
+    return min(pool, key=lambda n: variants[n].get("p50_ms") or float("inf"))
+
+
+# --- Artifact ---
+
+def next_version(root: str, name: str) -> int:
+    taken = [int(m.group(1)) for d in (os.listdir(root) if os.path.isdir(root) else [])
+             for m in [re.fullmatch(re.escape(name) + r"-v(\d+)", d)] if m]
+    return max(taken, default=0) + 1
+
+
+def build(weights: str, classes: Sequence[int], imgsz: int, frames: List[np.ndarray], clips, root: str = "models",
+          formats: Sequence[str] = ("onnx", "ncnn"), finetune_data: str = "", epochs: int = 30,
+          threads: Optional[int] = None, runs: int = 100, source_frames: str = "") -> str:
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    name = f"naviglass-{stem}-{len(classes)}c-{imgsz}"
+    version = next_version(root, name)
+    directory = os.path.join(root, f"{name}-v{version}")
+    os.makedirs(directory)
+    print(f"Building {directory}")
+
+    pruned = prune_head(weights, classes, os.path.join(directory, "pruned.pt"))
+    method = "pruned"
+    if finetune_data:
+        print(f"Fine-tuning on {finetune_data} for {epochs} epochs")
+        pruned = finetune(pruned, finetune_data, epochs, imgsz, pruned)
+        method = "finetuned"
+
+    variants: Dict[str, Dict] = {}
+    for fmt in formats:
+        fp32 = export(pruned, fmt, imgsz, os.path.join(directory, "model-fp32.onnx" if fmt == "onnx" else "ncnn-fp32"))
+        variants[f"{fmt}-fp32"] = {"backend": FORMATS[fmt], "file": os.path.basename(fp32), "precision": "fp32"}
+        try:
+            if fmt == "onnx":
+                int8 = quantize_onnx(fp32, frames, imgsz, os.path.join(directory, "model-int8.onnx"))
+            else:
+                int8 = quantize_ncnn(fp32, frames, imgsz, os.path.join(directory, "ncnn-int8"))
+            variants[f"{fmt}-int8"] = {"backend": FORMATS[fmt], "file": os.path.basename(int8), "precision": "int8"}
+        except Exception as e:
+            print(f"  {fmt} int8 skipped: {e}")
+
+    for variant, entry in variants.items():
+        spec = {"backend": entry["backend"], "model": os.path.join(directory, entry["file"]), "imgsz": imgsz,
+                "options": {"class_map": list(classes)}}
+        try:
+            entry.update(evaluate(spec, classes, clips, frames, runs, threads))
+        except Exception as e:
+            entry["error"] = str(e)
+            print(f"  {variant} evaluation failed: {e}")
+            continue
+        print(f"  {variant:10s} mAP50 {entry.get('map50')}  mAP50-95 {entry.get('map50_95')}  "
+              f"p50 {entry['p50_ms']} ms  p95 {entry['p95_ms']} ms")
+
+    manifest = {"name": name, "version": version, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "source": weights, "method": method, "classes": list(classes),
+                "names": {str(c): COCO_NAMES[c] for c in classes}, "imgsz": imgsz, "cpu": cpu_fingerprint(),
+                "calibration": {"frames": len(frames), "source": source_frames or "simulated"},
+                "eval": {"images": len(clips), "threads": threads},
+                "variants": variants, "default": choose_default(variants)}
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Default variant: {manifest['default']}")
+    return directory
+
+
+
+if __name__ == "__main__":
+    from DetectionConfig import DETECT_CLASSES
+
+    parser = argparse.ArgumentParser(description="Export class-pruned and int8 NaviGlass models.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="Prune, export, quantize and evaluate into a new artifact version")
+    b.add_argument("--weights", default="yolo11n.pt")
+    b.add_argument("--frames", default="", help="Image directory or session log for int8 calibration and latency")
+    b.add_argument("--clips", default="", help="Labeled images (YOLO .txt, COCO ids) for mAP")
+    b.add_argument("--imgsz", type=int, default=640)
+    b.add_argument("--formats", nargs="*", default=list(FORMATS), choices=list(FORMATS))
+    b.add_argument("--finetune", default="", help="Dataset yaml (classes in DETECT_CLASSES order) to fine-tune on")
+    b.add_argument("--epochs", type=int, default=30)
+    b.add_argument("--output", default="models", help="Directory holding the artifact versions")
+    b.add_argument("--threads", type=int, default=None)
+    b.add_argument("--runs", type=int, default=100, help="Timed inferences per variant")
+    e = sub.add_parser("evaluate", help="Re-measure the variants of an artifact on this CPU")
+    e.add_argument("artifact")
+    e.add_argument("--frames", default="")
+    e.add_argument("--clips", default="")
+    e.add_argument("--threads", type=int, default=None)
+    e.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+
+    from Hardware import load_frames
+    frames = load_frames(args.frames, limit=300) if args.frames else []
+    clips = load_clips(args.clips) if args.clips else []
+    if not frames:
+        frames = [image for image, _ in clips[:300]]
+    if not frames:
+        raise SystemExit("Give --frames (recorded with record_frames) or --clips for calibration and timing")
+
+    if args.command == "build":
+        directory = build(args.weights, DETECT_CLASSES, args.imgsz, frames, clips, args.output, args.formats,
+                          args.finetune, args.epochs, args.threads, args.runs, args.frames)
+        print(f"Set \"model_artifact\": \"{directory}\" (or \"{args.output}\" for the newest) to use it")
+    else:
+        directory = resolve_artifact(args.artifact)
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+        for variant, entry in manifest["variants"].items():
+            spec = {"backend": entry["backend"], "model": os.path.join(directory, entry["file"]),
+                    "imgsz": manifest["imgsz"], "options": {"class_map": manifest["classes"]}}
+            print(variant, json.dumps(evaluate(spec, manifest["classes"], clips, frames, args.runs, args.threads)))
@@ -0,0 +1,92 @@
+"""
+Motion Scheduler for NaviGlass
+Decides per captured frame whether YOLO needs to run. A tiny grayscale
+thumbnail is compared with the one from the last inference, cell by cell so a
+person moving in one part of the frame is not averaged away by a static
+background. While the scene is static the inference interval backs off, and it snaps back to every frame as
+soon as there is motion or something is close to the sensors. Skipped frames are
+covered by the tracker's predictions.
+"""
+
+import time
+import cv2
+from typing import Dict, Optional
+
+
+class MotionScheduler:
+
+    THUMB_SIZE = (32, 24)
+    GRID = (8, 6) # Cells of 4x4 thumbnail pixels; the score is the most changed cell
+
+    def __init__(self, motion_threshold: float = 6.0, near_distance_cm: float = 150,
+                 min_interval: float = 0.0, max_interval: float = 1.0, backoff: float = 1.5):
+        self.motion_threshold = motion_threshold # Mean absolute pixel difference (0-255) in one cell that counts as motion
+        self.near_distance_cm = near_distance_cm # Anything closer always gets full rate
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+
+        self._reference = None # Thumbnail of the last frame we ran inference on
+        self._thumb = None
+        self._last_inference = 0.0
+        self._inference_ms = 0.0
+
+        self.frames = 0
+        self.inferred = 0
+        self.skipped = 0
+        self.saved_ms = 0.0
+        self.last_score = 0.0
+
+
+    def motion_score(self, frame) -> float:
+        thumb = cv2.resize(frame, self.THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+        self._thumb = thumb
+        if self._reference is None:
+            return float("inf")
+        diff = cv2.resize(cv2.absdiff(thumb, self._reference), self.GRID, interpolation=cv2.INTER_AREA)
+        return float(diff.max())
+
+
+    def should_infer(self, frame, now: Optional[float] = None, distance_cm: float = 999) -> bool:
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+        score = self.motion_score(frame)
+        self.last_score = score
+
+        if score >= self.motion_threshold or distance_cm < self.near_distance_cm:
+            self.interval = self.min_interval # Something is happening, back to max rate
+            run = True
+        elif now - self._last_inference >= self.interval:
+            self.interval = min(self.max_interval, max(self.interval, 0.1) * self.backoff)
+            run = True # Static scene, still refresh now and then at a slowing rate
+        else:
+            run = False
+
+        if run:
+            self._reference = self._thumb
+            self._last_inference = now
+            self.inferred += 1
+        else:
+            self.skipped += 1
+            self.saved_ms += self._inference_ms
+        return run
+
+
+    def record_inference(self, elapsed_ms: float):
+        """Feed back measured inference time so saved latency can be estimated for skipped frames."""
+        self._inference_ms = 0.8 * self._inference_ms + 0.2 * elapsed_ms if self._inference_ms else elapsed_ms
+
+
+    def stats(self) -> Dict:
+        return {
+            "frames": self.frames,
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "skip_ratio": round(self.skipped / self.frames, 3) if self.frames else 0.0,
+            "saved_ms": round(self.saved_ms, 1),
+            "interval": round(self.interval, 3),
+            "motion_score": round(self.last_score, 2) if self.last_score != float("inf") else None,
+        }
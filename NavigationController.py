@@ -0,0 +1,208 @@
+"""
+Navigation Controller for NaviGlass
+The decision logic of main_loop with no hardware attached: given the latest
+detection snapshot and a distance, decide the motor duty cycles, whether to
+narrate and what state to publish. main_loop applies the decisions to the
+motors, TTS and web server; the replay harness runs the same code against a
+recorded session.
+"""
+
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from ObjectTracker import select_primary
+
+
+def calculate_duty_cycle(distance):
+    if distance > 400:
+        return 10
+    else:
+        return 45 - distance / 400 * 25  # Linearly map distance to duty cycle
+
+
+def calculate_spatial_ratio(x_coordinate, duty_cycle):
+    left_dc = min(90, 2 * duty_cycle * (1-x_coordinate))
+    right_dc = min(90, 2 * duty_cycle * x_coordinate)
+    return left_dc, right_dc
+
+
+def select_biggest_label(labels): # Select the label with the highest area
+    if not labels:
+        return None
+    best = max(labels, key=lambda x: x.get('area', 0.0))
+    return best
+
+
+MIN_AREA = 0.0625 # Objects covering less than 1/16 of the frame are ignored
+
+
+def labels_from_result(result, conf_min: float = 0.70):
+    rows = getattr(result, "rows", None)
+    if rows is not None: # Columnar detections from DetectorBackend / FastDetector
+        return labels_from_rows(rows, result.names, conf_min)
+    return labels_from_boxes(result, conf_min)
+
+
+def labels_from_boxes(result, conf_min: float = 0.70):
+    """Per-box path for ultralytics Results (and anything else exposing .boxes)."""
+    out = []
+    if getattr(result, "boxes", None) is None or len(result.boxes) == 0:
+        return out
+    names = result.names
+    for cls_tensor, conf_tensor, box_tensor in zip(result.boxes.cls, result.boxes.conf, result.boxes.xyxyn):
+        conf = float(conf_tensor.item())
+        if conf >= conf_min: # Check the confidence is higher than the threshold
+            x1, y1, x2, y2 = box_tensor.tolist() # Get the coordinates of the center of the bounding box
+            width = x2 - x1
+            height = y2 - y1
+            area = width * height
+            if area < MIN_AREA: # Skip the objects that cover less than 1/16 of the frame
+                continue
+            cls_id = int(cls_tensor.item())
+            label = names.get(cls_id, str(cls_id)) # Get the label
+            center_x = x1 + width / 2
+            center_y = y1 + height / 2
+            out.append({'label': label, 'class_id': cls_id, 'confidence': conf, 'coordinates': (center_x, center_y), 'area': area,
+                        'box': (x1, y1, x2, y2)})
+    return out
+
+
+def labels_from_rows(rows: np.ndarray, names: Dict[int, str], conf_min: float = 0.70):
+    """Same labels from (N, 6) rows of cls, conf, x1, y1, x2, y2 (normalized), filtered with array masks."""
+    if len(rows) == 0:
+        return []
+    rows = np.asarray(rows, dtype=np.float64) # Double arithmetic like the per-box path, so both agree at the thresholds
+    width = rows[:, 4] - rows[:, 2]
+    height = rows[:, 5] - rows[:, 3]
+    area = width * height
+    keep = (rows[:, 1] >= conf_min) & (area >= MIN_AREA)
+    if not keep.any():
+        return []
+    out = []
+    for (cls, conf, x1, y1, x2, y2), w, h, a in zip(rows[keep].tolist(), width[keep].tolist(),
+                                                   height[keep].tolist(), area[keep].tolist()):
+        cls_id = int(cls)
+        out.append({'label': names.get(cls_id, str(cls_id)), 'class_id': cls_id, 'confidence': conf,
+                    'coordinates': (x1 + w / 2, y1 + h / 2), 'area': a, 'box': (x1, y1, x2, y2)})
+    return out
+
+
+
+class Decision(NamedTuple):
+    frame_id: int
+    now: float                  # time.time() the decision was taken at
+    target: Optional[Dict]      # Label dict of the object in focus, None if nothing was detected
+    distance_cm: float          # Distance used for the decision, 999 when nothing was measured
+    left_dc: float
+    right_dc: float
+    narrate: bool               # New object: speak about target
+
+    @property
+    def label(self) -> Optional[str]:
+        return self.target['label'] if self.target else None
+
+    @property
+    def track_id(self) -> int:
+        return self.target['track_id'] if self.target else -1
+
+
+class NavigationController:
+
+    MAX_MISSES = 10
+    VIB_PULSE_TIME = 3
+    APPROACH_SENSITIVITY = 10
+    OBSTACLE_CM = 100 # Ranging-only warning distance while the detector is not running
+    DUTY_STEP = 0.5 # Smallest duty change worth a range_step decision
+
+    def __init__(self):
+        self.last_track_id = None
+        self.announced_tracks = set() # Track ids already narrated and pulsed
+        self.consecutive_misses = 0
+        self.vib_deadline = 0
+        self.ref_distance = 999
+        self.last_decision: Optional[Decision] = None # Object in focus and motor duty, for range_step
+
+
+    def step(self, snapshot, distance_fn: Callable[[], float], now: float,
+             alive_ids: Optional[Iterable[int]] = None) -> Decision:
+        """One main_loop decision for a new snapshot. distance_fn is only called when an object is in focus."""
+        i = select_primary(snapshot, self.last_track_id) # Sticks to the current object unless another is clearly bigger
+        best = snapshot.item(i) if i is not None else None
+
+        if not best:
+            self.consecutive_misses += 1
+            if self.consecutive_misses >= self.MAX_MISSES:
+                self.last_track_id = None
+                self.announced_tracks.clear()
+                self.ref_distance = 999
+            self.last_decision = Decision(snapshot.frame_id, now, None, 999, 0, 0, False)
+            return self.last_decision
+
+        self.consecutive_misses = 0
+        track_id = best['track_id']
+        x, _ = best['coordinates']
+        distance_cm = distance_fn()
+
+        should_vibrate = False
+        new_object = track_id not in self.announced_tracks
+
+        if new_object:
+            self.vib_deadline = now + self.VIB_PULSE_TIME
+            self.ref_distance = distance_cm
+            should_vibrate = True
+        else:
+            if track_id != self.last_track_id: # Focus moved back to a known object, no new pulse
+                self.ref_distance = distance_cm
+            if distance_cm <= 400 and distance_cm < self.ref_distance - self.APPROACH_SENSITIVITY:
+                self.vib_deadline = now + self.VIB_PULSE_TIME
+                self.ref_distance = distance_cm
+                should_vibrate = True
+            elif now < self.vib_deadline:
+                should_vibrate = True
+            else:
+                self.vib_deadline = 0
+
+        if should_vibrate:
+            duty_cycle = calculate_duty_cycle(distance_cm)
+            left_dc, right_dc = calculate_spatial_ratio(x, duty_cycle)
+        else:
+            left_dc, right_dc = 0, 0
+
+        if new_object:
+            self.announced_tracks.add(track_id)
+            if alive_ids is not None:
+                self.announced_tracks.intersection_update(alive_ids) # Forget tracks that have ended
+        self.last_track_id = track_id
+        self.last_decision = Decision(snapshot.frame_id, now, best, distance_cm, left_dc, right_dc, new_object)
+        return self.last_decision
+
+
+    def range_step(self, distance_cm: float, now: float) -> Optional[Decision]:
+        """Decision for a distance sample between frames, about the object in focus: an approach starts a pulse
+        at once and the duty follows the distance. None, with no state changed, when the motors would not change."""
+        last = self.last_decision
+        if last is None or last.target is None:
+            return None
+        approaching = distance_cm <= 400 and distance_cm < self.ref_distance - self.APPROACH_SENSITIVITY
+        if approaching or now < self.vib_deadline:
+            left_dc, right_dc = calculate_spatial_ratio(last.target['coordinates'][0], calculate_duty_cycle(distance_cm))
+        else:
+            left_dc, right_dc = 0, 0
+        if abs(left_dc - last.left_dc) < self.DUTY_STEP and abs(right_dc - last.right_dc) < self.DUTY_STEP:
+            return None
+        if approaching:
+            self.vib_deadline = now + self.VIB_PULSE_TIME
+            self.ref_distance = distance_cm
+        elif left_dc == 0:
+            self.vib_deadline = 0
+        self.last_decision = Decision(last.frame_id, now, last.target, distance_cm, left_dc, right_dc, False)
+        return self.last_decision
+
+
+    def obstacle_step(self, distance_cm: float, now: float) -> Decision:
+        """Decision from the ultrasonic sensors alone, used until the detector is up: buzz both motors when close."""
+        if distance_cm < self.OBSTACLE_CM:
+            duty_cycle = calculate_duty_cycle(distance_cm)
+            return Decision(-1, now, None, distance_cm, duty_cycle, duty_cycle, False)
+        return Decision(-1, now, None, distance_cm, 0, 0, False)
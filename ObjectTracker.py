@@ -0,0 +1,225 @@
+"""
+Object Tracker for NaviGlass
+Lightweight SORT-style tracker over labels_from_result() output. Each object
+keeps a stable track id across frames, with its age and a smoothed velocity,
+so narration and haptics can follow objects instead of whatever box happens to
+be biggest this frame. Pure Python: ~10 objects cost well under a millisecond.
+"""
+
+import itertools
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+Box = Tuple[float, float, float, float] # x1, y1, x2, y2 normalized
+
+
+class Track:
+
+    __slots__ = ("track_id", "class_id", "label", "box", "confidence", "vx", "vy",
+                 "first_seen", "last_seen", "hits", "misses")
+
+    def __init__(self, track_id: int, class_id: int, label: str, box: Box, confidence: float, timestamp: float):
+        self.track_id = track_id
+        self.class_id = class_id
+        self.label = label
+        self.box = box
+        self.confidence = confidence
+        self.vx = 0.0 # Center velocity in frame widths / heights per second
+        self.vy = 0.0
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.hits = 1
+        self.misses = 0
+
+
+    @property
+    def center(self) -> Tuple[float, float]:
+        x1, y1, x2, y2 = self.box
+        return (x1 + x2) / 2, (y1 + y2) / 2
+
+
+    @property
+    def area(self) -> float:
+        x1, y1, x2, y2 = self.box
+        return (x2 - x1) * (y2 - y1)
+
+
+    def age(self, now: float) -> float:
+        return now - self.first_seen
+
+
+    def predicted_box(self, timestamp: float) -> Box:
+        dt = timestamp - self.last_seen
+        dx, dy = self.vx * dt, self.vy * dt
+        x1, y1, x2, y2 = self.box
+        return (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+
+
+    def to_dict(self, now: float) -> Dict:
+        cx, cy = self.center
+        return {"track_id": self.track_id, "label": self.label, "confidence": self.confidence,
+                "coordinates": (cx, cy), "area": self.area, "velocity": (self.vx, self.vy),
+                "age": self.age(now), "hits": self.hits, "misses": self.misses}
+
+
+
+def iou(a: Box, b: Box) -> float:
+    ix = min(a[2], b[2]) - max(a[0], b[0])
+    iy = min(a[3], b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class ObjectTracker:
+
+    def __init__(self, iou_threshold: float = 0.3, max_center_distance: float = 0.15,
+                 max_misses: int = 5, velocity_smoothing: float = 0.5, max_speed: float = 0.4):
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance # Fallback match for fast movers with no overlap
+        self.max_speed = max_speed # Frame sizes per second; widens that gate when inference was skipped for a while
+        self.max_misses = max_misses # Frames a track survives without a detection (brief occlusion)
+        self.velocity_smoothing = velocity_smoothing
+        self.tracks: List[Track] = []
+        self._ids = itertools.count(1)
+
+
+    def update(self, labels: List[Dict], timestamp: float) -> List[Dict]:
+        """Match this frame's labels to tracks. Adds 'track_id' to each label dict and returns them."""
+        tracks = self.tracks
+        predicted = [t.predicted_box(timestamp) for t in tracks]
+
+        # Candidate pairs of the same class, best IoU first (greedy assignment, fine for ~10 objects)
+        pairs = []
+        for di, det in enumerate(labels):
+            box = det['box']
+            label = det['label']
+            for ti, t in enumerate(tracks):
+                if t.label != label: # Never hand a person's track to a car
+                    continue
+                score = iou(box, predicted[ti])
+                if score >= self.iou_threshold:
+                    pairs.append((score, di, ti))
+                else:
+                    px, py = (predicted[ti][0] + predicted[ti][2]) / 2, (predicted[ti][1] + predicted[ti][3]) / 2
+                    cx, cy = det['coordinates']
+                    dist = ((px - cx) ** 2 + (py - cy) ** 2) ** 0.5
+                    gate = max(self.max_center_distance, self.max_speed * (timestamp - t.last_seen))
+                    if dist <= gate:
+                        pairs.append((-dist, di, ti)) # Always ranks below any IoU match
+        pairs.sort(reverse=True)
+
+        matched_dets = set()
+        matched_tracks = set()
+        for _, di, ti in pairs:
+            if di in matched_dets or ti in matched_tracks:
+                continue
+            matched_dets.add(di)
+            matched_tracks.add(ti)
+            self._update_track(tracks[ti], labels[di], timestamp)
+            labels[di]['track_id'] = tracks[ti].track_id
+
+        survivors = []
+        for ti, t in enumerate(tracks):
+            if ti not in matched_tracks:
+                t.misses += 1
+                if t.misses > self.max_misses:
+                    continue
+            survivors.append(t)
+
+        for di, det in enumerate(labels):
+            if di in matched_dets:
+                continue
+            t = Track(next(self._ids), det.get('class_id', -1), det['label'], det['box'],
+                      det['confidence'], timestamp)
+            survivors.append(t)
+            det['track_id'] = t.track_id
+
+        self.tracks = survivors
+        return labels
+
+
+    def _update_track(self, t: Track, det: Dict, timestamp: float):
+        dt = timestamp - t.last_seen
+        old_cx, old_cy = t.center
+        t.box = det['box']
+        if dt > 0:
+            cx, cy = t.center
+            a = self.velocity_smoothing
+            t.vx = a * (cx - old_cx) / dt + (1 - a) * t.vx
+            t.vy = a * (cy - old_cy) / dt + (1 - a) * t.vy
+        t.confidence = det['confidence']
+        t.last_seen = timestamp
+        t.hits += 1
+        t.misses = 0
+
+
+    def predict(self, timestamp: float, visible_only: bool = True) -> List[Dict]:
+        """Where the live tracks should be now, without a new detection. Label-dict shape."""
+        out = []
+        for t in self.tracks:
+            if visible_only and t.misses: # Not seen in the last inferred frame
+                continue
+            x1, y1, x2, y2 = t.predicted_box(timestamp)
+            out.append({'label': t.label, 'class_id': t.class_id, 'confidence': t.confidence,
+                        'coordinates': ((x1 + x2) / 2, (y1 + y2) / 2), 'area': (x2 - x1) * (y2 - y1),
+                        'box': (x1, y1, x2, y2), 'track_id': t.track_id})
+        return out
+
+
+    def alive_ids(self) -> Iterable[int]:
+        return (t.track_id for t in self.tracks)
+
+
+    def stats(self, now: float) -> List[Dict]:
+        return [t.to_dict(now) for t in self.tracks]
+
+
+
+def select_primary(snapshot, current_track_id: Optional[int], switch_ratio: float = 1.5) -> Optional[int]:
+    """
+    Index of the object to narrate / vibrate for. Stays on the current track while it
+    is visible unless another object is clearly bigger, so two similar-sized objects
+    trading places in the area ranking do not flip the focus every frame.
+    """
+    best = snapshot.biggest()
+    if best is None or current_track_id is None:
+        return best
+    track_ids = snapshot.track_ids
+    for i in range(len(track_ids)):
+        if track_ids[i] == current_track_id:
+            if snapshot.area[best] > snapshot.area[i] * switch_ratio:
+                return best
+            return i
+    return best
+
+
+if __name__ == "__main__":
+    # Per-frame tracker cost with ~10 objects drifting across the frame
+    import random
+    import time
+
+    random.seed(0)
+    objects = [[random.random() * 0.7, random.random() * 0.7, random.uniform(-0.01, 0.01), random.uniform(-0.01, 0.01),
+                random.choice([0, 2, 5])] for _ in range(10)]
+    tracker = ObjectTracker()
+    frames = 2000
+    elapsed = 0.0
+    for f in range(frames):
+        labels = []
+        for o in objects:
+            o[0] = min(max(o[0] + o[2], 0.0), 0.7)
+            o[1] = min(max(o[1] + o[3], 0.0), 0.7)
+            x1, y1 = o[0] + random.gauss(0, 0.003), o[1] + random.gauss(0, 0.003)
+            box = (x1, y1, x1 + 0.25, y1 + 0.25)
+            labels.append({'label': str(o[4]), 'class_id': o[4], 'confidence': 0.9,
+                           'coordinates': (x1 + 0.125, y1 + 0.125), 'area': 0.0625, 'box': box})
+        random.shuffle(labels)
+        t0 = time.perf_counter()
+        tracker.update(labels, f / 10.0)
+        elapsed += time.perf_counter() - t0
+
+    print(f"{len(objects)} objects, {frames} frames: {elapsed / frames * 1e6:.1f} us per update, "
+          f"{next(tracker._ids) - 1} track ids issued")
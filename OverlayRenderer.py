@@ -0,0 +1,108 @@
+"""
+Overlay Renderer for NaviGlass
+Minimal replacement for ultralytics' Results.plot(). Draws only the objects
+that survived labels_from_result() filtering, straight into the frame that is
+about to be encoded (no copy), and reuses pre-rendered label tags so text is
+rasterised once per track instead of once per frame.
+"""
+
+import cv2
+import numpy as np
+from typing import Dict, List, Tuple
+
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.5
+THICKNESS = 2
+PALETTE = [(56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+           (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0)]
+
+
+class OverlayRenderer:
+
+    def __init__(self, max_cached: int = 256):
+        self.max_cached = max_cached
+        self._glyphs: Dict[Tuple[str, Tuple[int, int, int]], np.ndarray] = {}
+
+
+    @staticmethod
+    def color_for(class_id: int) -> Tuple[int, int, int]:
+        return PALETTE[class_id % len(PALETTE)] if class_id >= 0 else PALETTE[0]
+
+
+    def _glyph(self, text: str, color: Tuple[int, int, int]) -> np.ndarray:
+        key = (text, color)
+        patch = self._glyphs.get(key)
+        if patch is None:
+            (w, h), baseline = cv2.getTextSize(text, FONT, FONT_SCALE, 1)
+            patch = np.empty((h + baseline + 4, w + 4, 3), np.uint8)
+            patch[:] = color
+            cv2.putText(patch, text, (2, h + 2), FONT, FONT_SCALE, (255, 255, 255), 1, cv2.LINE_AA)
+            if len(self._glyphs) >= self.max_cached: # Old track ids never come back, start over
+                self._glyphs.clear()
+            self._glyphs[key] = patch
+        return patch
+
+
+    def draw(self, image: np.ndarray, labels: List[Dict]) -> np.ndarray:
+        """Draw boxes and tags for label dicts (normalized 'box') onto image in place."""
+        h, w = image.shape[:2]
+        for l in labels:
+            x1, y1, x2, y2 = l['box']
+            p1 = (max(int(x1 * w), 0), max(int(y1 * h), 0))
+            p2 = (min(int(x2 * w), w - 1), min(int(y2 * h), h - 1))
+            color = self.color_for(l.get('class_id', -1))
+            cv2.rectangle(image, p1, p2, color, THICKNESS)
+
+            track_id = l.get('track_id', -1)
+            text = f"{l['label']} #{track_id}" if track_id >= 0 else l['label']
+            patch = self._glyph(text, color)
+            ph, pw = patch.shape[:2]
+            tx = min(p1[0], w - pw)
+            ty = p1[1] - ph if p1[1] >= ph else p1[1] # Above the box, or inside it at the top edge
+            if tx >= 0 and ty + ph <= h:
+                image[ty:ty + ph, tx:tx + pw] = patch
+        return image
+
+
+
+def _benchmark(frames: int = 200):
+    """Compare against Results.plot() on the same detections when ultralytics is installed."""
+    import time
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    labels = []
+    for i in range(6):
+        x1, y1 = rng.uniform(0, 0.6), rng.uniform(0, 0.6)
+        labels.append({'label': 'person', 'class_id': 0, 'confidence': 0.9, 'track_id': i + 1,
+                       'box': (x1, y1, x1 + 0.3, y1 + 0.3)})
+
+    renderer = OverlayRenderer()
+    frame = image.copy()
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        renderer.draw(frame, labels)
+    ours = (time.perf_counter() - t0) / frames * 1000
+    print(f"OverlayRenderer.draw: {ours:.3f} ms / frame ({len(labels)} objects)")
+
+    try:
+        import torch
+        from ultralytics.engine.results import Results
+    except ImportError:
+        print("ultralytics not installed, skipping Results.plot() comparison")
+        return
+
+    # Same boxes plus low-confidence ones plot() would also draw but labels_from_result rejects
+    rows = [[l['box'][0] * 640, l['box'][1] * 480, l['box'][2] * 640, l['box'][3] * 480, 0.9, 0] for l in labels]
+    rows += [[10 * i, 10 * i, 10 * i + 40, 10 * i + 40, 0.4, 2] for i in range(6)]
+    result = Results(image, path="bench.jpg", names={0: "person", 2: "car"}, boxes=torch.tensor(rows))
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        result.plot()
+    theirs = (time.perf_counter() - t0) / frames * 1000
+    print(f"Results.plot():       {theirs:.3f} ms / frame ({len(rows)} boxes), {theirs / ours:.1f}x slower")
+
+
+if __name__ == "__main__":
+    _benchmark()
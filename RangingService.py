@@ -0,0 +1,155 @@
+"""
+Ranging Service for NaviGlass
+Pings every ultrasonic sensor in turn from a background thread and keeps a
+small ring buffer per sensor. The filtered (median) distance is computed when a
+sample lands, so readers get the current value, its age and the sensor's update
+rate in O(1) without waiting for a measurement.
+"""
+
+import threading
+import time
+import statistics
+from collections import deque
+from typing import Callable, List, NamedTuple, Optional, Dict
+from MetricsRegistry import METRICS
+from AsyncLogger import LOG
+
+
+# Pings take from ~1 ms (close object) up to the 60 ms echo timeout
+RANGING_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.015, 0.02, 0.03, 0.045, 0.06, 0.1)
+
+LOG.set_rate_limit("ranging_error", 1.0)
+
+
+class RangeReading(NamedTuple):
+    distance: float   # Median of the ring buffer in cm (999 = out of range)
+    raw: float        # Most recent single ping
+    timestamp: float  # time.monotonic() of the most recent ping
+    rate: float       # Smoothed pings per second for this sensor
+
+
+class RangingService:
+
+    SETTLE_TIME = 0.03 # Quiet gap after each echo ends so it dies out before the next sensor fires
+    CYCLE_TIME = 0.06 # HC-SR04 datasheet: at least 60 ms from one trigger to the next
+
+    def __init__(self, rangers: List, window: int = 3, max_age: float = 0.5, recorder=None,
+                 on_sample: Optional[Callable[[int, float], None]] = None):
+        self.rangers = rangers
+        self.window = window
+        self.max_age = max_age
+        self.recorder = recorder # Optional SessionRecorder for offline replay
+        self.on_sample = on_sample # Called with (sensor, cm) after each sample is published, e.g. to wake main_loop
+        self._buffers = [deque(maxlen=window) for _ in rangers]
+        self._readings: List[Optional[RangeReading]] = [None] * len(rangers)
+        self._running = False
+        self._thread = None
+        self._m_ping = [METRICS.histogram("naviglass_ranging_seconds", "Duration of one ultrasonic ping",
+                                          {"sensor": str(i)}, RANGING_BUCKETS) for i in range(len(rangers))]
+        self._m_out_of_range = [METRICS.counter("naviglass_ranging_out_of_range_total",
+                                                "Pings that timed out or read out of range", {"sensor": str(i)})
+                                for i in range(len(rangers))]
+        METRICS.gauge("naviglass_distance_cm", "Closest filtered distance").set_function(self.distance)
+
+
+    def start(self):
+        if self._running or not self.rangers:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        print(f"Ranging service started with {len(self.rangers)} sensor(s).")
+
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+
+
+    def _run(self):
+        while self._running:
+            for i, ranger in enumerate(self.rangers): # Staggered: never two pings in flight at once
+                started = time.monotonic()
+                try:
+                    sample = ranger.measure()
+                except Exception as e:
+                    LOG.error("ranging_error", sensor=i, error=repr(e))
+                    sample = 999
+                now = time.monotonic()
+                self._m_ping[i].observe(now - started)
+                if sample >= 999:
+                    self._m_out_of_range[i].inc()
+                self._record(i, sample, now)
+                if self.on_sample:
+                    self.on_sample(i, sample)
+                if self.recorder:
+                    self.recorder.record_range(i, sample, time.monotonic_ns())
+                LOG.debug("ping", sensor=i, cm=sample)
+
+                # Counted from the end of the echo, not from the trigger: a 20-60 ms echo still gets its gap
+                remaining = max(self.SETTLE_TIME - (time.monotonic() - now),
+                                self.CYCLE_TIME - (time.monotonic() - started))
+                if remaining > 0:
+                    time.sleep(remaining)
+
+
+    def _record(self, index: int, sample: float, now: float):
+        buf = self._buffers[index]
+        buf.append(sample)
+        previous = self._readings[index]
+        rate = 0.0
+        if previous is not None and now > previous.timestamp:
+            instant = 1.0 / (now - previous.timestamp)
+            rate = 0.8 * previous.rate + 0.2 * instant if previous.rate else instant
+        # Publish by swapping in a new immutable reading, readers never see a partial update
+        self._readings[index] = RangeReading(statistics.median(buf), sample, now, rate)
+
+
+    def reading(self, index: int) -> Optional[RangeReading]:
+        return self._readings[index]
+
+
+    def distance(self) -> float:
+        """Closest filtered distance across fresh sensors, 999 if none is fresh."""
+        now = time.monotonic()
+        best = 999
+        for r in self._readings:
+            if r is not None and now - r.timestamp <= self.max_age and r.distance < best:
+                best = r.distance
+        return best
+
+
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        out = []
+        for i, r in enumerate(self._readings):
+            if r is None:
+                out.append({"sensor": i, "distance": None, "age": None, "rate": 0.0})
+            else:
+                out.append({"sensor": i, "distance": round(r.distance, 1), "raw": round(r.raw, 1),
+                            "age": round(now - r.timestamp, 3), "rate": round(r.rate, 1)})
+        return out
+
+
+if __name__ == "__main__":
+    # Simulated two-sensor run: update rate per sensor and cost of a read from the main loop
+    from FakeGPIO import FakeGPIO
+    from UltrasonicRanger import UltrasonicRanger
+
+    gpio = FakeGPIO()
+    gpio.attach_sensor(13, 11, 120.0)
+    gpio.attach_sensor(16, 18, 80.0)
+    service = RangingService([UltrasonicRanger(13, 11, gpio=gpio), UltrasonicRanger(16, 18, gpio=gpio)])
+    service.start()
+    time.sleep(2.0)
+
+    t0 = time.perf_counter()
+    for _ in range(100000):
+        service.distance()
+    read_us = (time.perf_counter() - t0) / 100000 * 1e6
+    service.stop()
+
+    for s in service.stats():
+        print(f"sensor {s['sensor']}: {s['distance']} cm, age {s['age'] * 1000:.1f} ms, {s['rate']} Hz")
+    print(f"distance() read: {read_us:.2f} us (vs ~250 ms for two generate_distance() calls)")
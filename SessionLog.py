@@ -0,0 +1,258 @@
+"""
+Session Log for NaviGlass
+Compact binary recording of a live session: raw detections with their capture
+timestamps, ultrasonic readings, main-loop decisions (motor duty cycles and
+narration) and optionally the frames themselves as JPEG. SessionRecorder
+appends from a background thread so the hot paths only enqueue a reference;
+SessionLog maps a finished file with mmap and hands out payloads as memoryview
+slices, so replaying never copies the log.
+
+File layout: 8-byte magic, then records of a 24-byte header
+(kind, flags, length, t_ns, frame_id) followed by the payload, padded to 8 bytes.
+t_ns is time.monotonic_ns(), the clock LatencyTracer uses.
+"""
+
+import json
+import mmap
+import struct
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+MAGIC = b"NGSLOG01"
+
+KIND_META = 0
+KIND_FRAME = 1
+KIND_RANGE = 2
+KIND_DETECTIONS = 3
+KIND_DECISION = 4
+KIND_TTS = 5
+
+FLAG_SKIPPED = 1 # Detections record for a frame the motion scheduler did not run inference on
+FLAG_RANGE_STEP = 2 # Decision record taken on a distance sample between frames (NavigationController.range_step)
+
+_HEADER = struct.Struct("<BBHIqq") # kind, flags, reserved, payload length, t_ns, frame_id
+_RANGE = struct.Struct("<if") # sensor, cm
+_DETECTIONS = struct.Struct("<dq") # capture time.time(), capture_ns; then float32 rows (cls, conf, x1, y1, x2, y2)
+_DECISION = struct.Struct("<dqfffiB") # now, capture_ns, distance, left, right, track_id, narrate; then label
+DETECTION_COLUMNS = 6
+
+
+class Record(NamedTuple):
+    kind: int
+    flags: int
+    t_ns: int
+    frame_id: int
+    payload: memoryview
+
+
+def _to_numpy(x) -> np.ndarray:
+    if hasattr(x, "cpu"): # torch tensor
+        x = x.cpu().numpy()
+    return np.asarray(x, dtype=np.float32)
+
+
+def detection_rows(result) -> np.ndarray:
+    """(N, 6) float32 rows of cls, conf, x1, y1, x2, y2 (normalized) from an ultralytics Results."""
+    boxes = getattr(result, "boxes", None)
+    if boxes is None or len(boxes) == 0:
+        return np.empty((0, DETECTION_COLUMNS), np.float32)
+    return np.column_stack([_to_numpy(boxes.cls), _to_numpy(boxes.conf), _to_numpy(boxes.xyxyn)]).astype(np.float32)
+
+
+class SessionRecorder:
+
+    def __init__(self, path: str, record_frames: bool = False, frame_quality: int = 70,
+                 meta: Optional[Dict] = None, queue_size: int = 4096):
+        self.path = path
+        self.record_frames = record_frames
+        self.frame_quality = frame_quality
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._queue = deque(maxlen=queue_size)
+        self._wake = threading.Event()
+        self._names_written = False
+        self.records = 0
+        self.bytes = len(MAGIC)
+        self.dropped = 0
+        self._running = True
+        self._write(KIND_META, 0, time.monotonic_ns(), -1,
+                    json.dumps({"started": time.time(), **(meta or {})}).encode("utf-8"))
+        self._thread = threading.Thread(target=self._run, daemon=True, name="session-recorder")
+        self._thread.start()
+
+
+    # --- Called from the live threads: enqueue references only ---
+
+    def _enqueue(self, item):
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(item)
+        self._wake.set()
+
+
+    def record_frame(self, frame_id: int, capture_ns: int, frame):
+        """frame is JPEG bytes or a BGR array, which is encoded on the writer thread."""
+        self._enqueue((KIND_FRAME, frame_id, capture_ns, frame))
+
+
+    def record_range(self, sensor: int, distance_cm: float, t_ns: int):
+        self._enqueue((KIND_RANGE, -1, t_ns, (sensor, distance_cm)))
+
+
+    def record_detections(self, frame_id: int, capture_ts: float, capture_ns: int, result, skipped: bool = False):
+        """result is the raw ultralytics Results (converted on the writer thread), None when skipped."""
+        self._enqueue((KIND_DETECTIONS, frame_id, capture_ns, (capture_ts, result, skipped)))
+
+
+    def record_decision(self, decision, capture_ns: int, t_ns: int, sentence: Optional[str] = None,
+                        range_step: bool = False):
+        self._enqueue((KIND_DECISION, decision.frame_id, t_ns, (decision, capture_ns, range_step)))
+        if sentence:
+            self._enqueue((KIND_TTS, decision.frame_id, t_ns, sentence))
+
+
+    # --- Writer thread ---
+
+    def _write(self, kind: int, flags: int, t_ns: int, frame_id: int, payload: bytes):
+        n = len(payload)
+        pad = -n % 8
+        self._file.write(_HEADER.pack(kind, flags, 0, n, t_ns, frame_id))
+        self._file.write(payload)
+        if pad:
+            self._file.write(b"\0" * pad)
+        self.records += 1
+        self.bytes += _HEADER.size + n + pad
+
+
+    def _encode(self, kind: int, frame_id: int, t_ns: int, data):
+        if kind == KIND_FRAME:
+            if not isinstance(data, (bytes, bytearray)):
+                import cv2
+                ok, buf = cv2.imencode(".jpg", data, [cv2.IMWRITE_JPEG_QUALITY, self.frame_quality])
+                if not ok:
+                    return
+                data = buf.tobytes()
+            self._write(KIND_FRAME, 0, t_ns, frame_id, data)
+        elif kind == KIND_RANGE:
+            self._write(KIND_RANGE, 0, t_ns, frame_id, _RANGE.pack(*data))
+        elif kind == KIND_DETECTIONS:
+            capture_ts, result, skipped = data
+            if result is not None and not self._names_written and getattr(result, "names", None):
+                self._write(KIND_META, 0, t_ns, -1, json.dumps({"names": result.names}).encode("utf-8"))
+                self._names_written = True
+            rows = detection_rows(result) if result is not None else np.empty((0, DETECTION_COLUMNS), np.float32)
+            self._write(KIND_DETECTIONS, FLAG_SKIPPED if skipped else 0, t_ns, frame_id,
+                        _DETECTIONS.pack(capture_ts, t_ns) + rows.tobytes())
+        elif kind == KIND_DECISION:
+            d, capture_ns, range_step = data
+            payload = _DECISION.pack(d.now, capture_ns, d.distance_cm, d.left_dc, d.right_dc, d.track_id,
+                                     1 if d.narrate else 0) + (d.label or "").encode("utf-8")
+            self._write(KIND_DECISION, FLAG_RANGE_STEP if range_step else 0, t_ns, frame_id, payload)
+        elif kind == KIND_TTS:
+            self._write(KIND_TTS, 0, t_ns, frame_id, data.encode("utf-8"))
+
+
+    def _drain(self):
+        while self._queue:
+            try:
+                kind, frame_id, t_ns, data = self._queue.popleft()
+            except IndexError:
+                break
+            try:
+                self._encode(kind, frame_id, t_ns, data)
+            except Exception as e:
+                print(f"Session recorder dropped a record: {e}")
+
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(timeout=0.5)
+            self._wake.clear()
+            self._drain()
+            self._file.flush()
+
+
+    def close(self):
+        if not self._running:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join(timeout=2)
+        self._drain()
+        self._file.close()
+
+
+    def stats(self) -> Dict:
+        return {"path": self.path, "records": self.records, "bytes": self.bytes,
+                "queued": len(self._queue), "dropped": self.dropped}
+
+
+
+class SessionLog:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        if self._view[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a NaviGlass session log")
+
+
+    def __iter__(self) -> Iterator[Record]:
+        view = self._view
+        offset = len(MAGIC)
+        end = len(view)
+        while offset + _HEADER.size <= end:
+            kind, flags, _, n, t_ns, frame_id = _HEADER.unpack_from(view, offset)
+            start = offset + _HEADER.size
+            if start + n > end: # Truncated tail from a session that did not shut down cleanly
+                break
+            yield Record(kind, flags, t_ns, frame_id, view[start:start + n])
+            offset = start + n + (-n % 8)
+
+
+    def meta(self) -> Dict:
+        out = {}
+        for rec in self:
+            if rec.kind == KIND_META:
+                out.update(json.loads(bytes(rec.payload)))
+        if "names" in out: # JSON turned the class ids into strings
+            out["names"] = {int(k): v for k, v in out["names"].items()}
+        return out
+
+
+    def close(self):
+        """Payloads and decoded rows handed out may still be alive; the mapping then goes with the last of them."""
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+
+
+def decode_range(rec: Record) -> Tuple[int, float]:
+    return _RANGE.unpack_from(rec.payload)
+
+
+def decode_detections(rec: Record) -> Tuple[float, int, np.ndarray]:
+    """(capture_ts, capture_ns, rows); rows is a zero-copy view into the mapped file."""
+    capture_ts, capture_ns = _DETECTIONS.unpack_from(rec.payload)
+    rows = np.frombuffer(rec.payload, dtype=np.float32, offset=_DETECTIONS.size).reshape(-1, DETECTION_COLUMNS)
+    return capture_ts, capture_ns, rows
+
+
+def decode_decision(rec: Record) -> Dict:
+    now, capture_ns, distance, left, right, track_id, narrate = _DECISION.unpack_from(rec.payload)
+    label = bytes(rec.payload[_DECISION.size:]).decode("utf-8") or None
+    return {"frame_id": rec.frame_id, "t_ns": rec.t_ns, "now": now, "capture_ns": capture_ns,
+            "distance_cm": distance, "left_dc": left, "right_dc": right, "track_id": track_id,
+            "narrate": bool(narrate), "label": label, "range_step": bool(rec.flags & FLAG_RANGE_STEP)}
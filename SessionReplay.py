@@ -0,0 +1,171 @@
+"""
+Session Replay for NaviGlass
+Feeds a recorded session log back through the same code the device runs:
+labels_from_result, the object tracker, the detection snapshot and the
+NavigationController decisions of main_loop. Runs at the recorded pace or as
+fast as possible, then reports throughput, decision latency and every decision
+that differs from what the device did in the field. No camera, GPIO or model
+is needed.
+
+    python SessionReplay.py session.nglog [--speed max|1.0|2.0] [--conf 0.70]
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from DetectionSnapshot import DetectionSnapshot
+from DetectorBackend import DetectionResult
+from NavigationController import NavigationController, labels_from_result
+from ObjectTracker import ObjectTracker
+from SessionLog import (SessionLog, KIND_DETECTIONS, KIND_DECISION, KIND_RANGE, KIND_FRAME, KIND_TTS,
+                        FLAG_SKIPPED, decode_detections, decode_decision)
+
+
+RecordedResult = DetectionResult # Recorded rows are exactly what the raw backends return
+
+
+def _percentiles(values: List[float]) -> Optional[Dict]:
+    if not values:
+        return None
+    values = sorted(values)
+    return {"p50": round(statistics.median(values), 3),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            "max": round(values[-1], 3)}
+
+
+class SessionReplay:
+
+    def __init__(self, path: str, conf_min: Optional[float] = None, max_diffs: int = 20):
+        self.log = SessionLog(path)
+        meta = self.log.meta()
+        self.names = meta.get("names", {})
+        self.conf_min = conf_min if conf_min is not None else meta.get("conf_min", 0.70)
+        self.max_diffs = max_diffs
+
+
+    @staticmethod
+    def _differs(recorded: Dict, decision) -> List[str]:
+        out = []
+        if recorded["label"] != decision.label:
+            out.append(f"label {recorded['label']} -> {decision.label}")
+        if recorded["track_id"] != decision.track_id:
+            out.append(f"track {recorded['track_id']} -> {decision.track_id}")
+        if recorded["narrate"] != decision.narrate:
+            out.append(f"narrate {recorded['narrate']} -> {decision.narrate}")
+        if abs(recorded["left_dc"] - decision.left_dc) > 0.01 or abs(recorded["right_dc"] - decision.right_dc) > 0.01:
+            out.append(f"motor ({recorded['left_dc']:.1f}, {recorded['right_dc']:.1f}) -> "
+                       f"({decision.left_dc:.1f}, {decision.right_dc:.1f})")
+        return out
+
+
+    def run(self, speed: float = 0.0) -> Dict:
+        """speed 0 replays as fast as possible, 1.0 at the recorded pace, 2.0 twice as fast."""
+        tracker = ObjectTracker()
+        controller = NavigationController()
+        snapshots: Dict[int, DetectionSnapshot] = {}
+        latest = DetectionSnapshot.empty()
+
+        frames = inferred = decisions = ranges = jpegs = tts = 0
+        pipeline_us: List[float] = [] # labels_from_result + tracker + snapshot per frame
+        decision_us: List[float] = [] # controller.step per decision
+        recorded_latency_ms: List[float] = [] # capture -> decision on the device
+        diffs: List[Dict] = []
+        diff_count = 0
+        first_t = last_t = None
+
+        wall_start = time.perf_counter()
+        for rec in self.log:
+            if rec.kind not in (KIND_DETECTIONS, KIND_DECISION, KIND_RANGE, KIND_FRAME, KIND_TTS):
+                continue
+            if first_t is None:
+                first_t = rec.t_ns
+            last_t = max(last_t or rec.t_ns, rec.t_ns)
+            if speed > 0: # Hold the recorded pacing
+                due = (rec.t_ns - first_t) / 1e9 / speed - (time.perf_counter() - wall_start)
+                if due > 0:
+                    time.sleep(due)
+
+            if rec.kind == KIND_DETECTIONS:
+                frames += 1
+                capture_ts, capture_ns, rows = decode_detections(rec)
+                t0 = time.perf_counter()
+                if rec.flags & FLAG_SKIPPED:
+                    labels = tracker.predict(capture_ts)
+                else:
+                    inferred += 1
+                    labels = tracker.update(labels_from_result(RecordedResult(rows, self.names), self.conf_min),
+                                            capture_ts)
+                latest = DetectionSnapshot.from_labels(labels, rec.frame_id, capture_ts, capture_ns=capture_ns)
+                pipeline_us.append((time.perf_counter() - t0) * 1e6)
+                snapshots[rec.frame_id] = latest
+                if len(snapshots) > 64: # Decisions only ever refer to recent frames
+                    snapshots.pop(next(iter(snapshots)))
+
+            elif rec.kind == KIND_DECISION:
+                decisions += 1
+                recorded = decode_decision(rec)
+                if recorded["capture_ns"]:
+                    recorded_latency_ms.append((recorded["t_ns"] - recorded["capture_ns"]) / 1e6)
+                snapshot = snapshots.get(rec.frame_id, latest)
+                t0 = time.perf_counter()
+                if recorded["range_step"]: # Taken on a distance sample between frames
+                    decision = controller.range_step(recorded["distance_cm"], recorded["now"])
+                else:
+                    decision = controller.step(snapshot, lambda: recorded["distance_cm"], recorded["now"],
+                                               tracker.alive_ids())
+                decision_us.append((time.perf_counter() - t0) * 1e6)
+                changes = self._differs(recorded, decision) if decision else ["no range_step decision"]
+                if changes:
+                    diff_count += 1
+                    if len(diffs) < self.max_diffs:
+                        diffs.append({"frame_id": rec.frame_id, "changes": changes})
+
+            elif rec.kind == KIND_RANGE:
+                ranges += 1
+            elif rec.kind == KIND_FRAME:
+                jpegs += 1
+            elif rec.kind == KIND_TTS:
+                tts += 1
+
+        wall = time.perf_counter() - wall_start
+        recorded_s = (last_t - first_t) / 1e9 if first_t is not None else 0.0
+        return {
+            "frames": frames,
+            "inferred": inferred,
+            "decisions": decisions,
+            "range_samples": ranges,
+            "jpeg_frames": jpegs,
+            "tts": tts,
+            "recorded_seconds": round(recorded_s, 2),
+            "recorded_fps": round(frames / recorded_s, 2) if recorded_s else None,
+            "replay_seconds": round(wall, 3),
+            "replay_fps": round(frames / wall, 1) if wall else None,
+            "frame_pipeline_us": _percentiles(pipeline_us),
+            "decision_us": _percentiles(decision_us),
+            "recorded_capture_to_decision_ms": _percentiles(recorded_latency_ms),
+            "differing_decisions": diff_count,
+            "diffs": diffs,
+        }
+
+
+    def close(self):
+        self.log.close()
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a NaviGlass session log without hardware.")
+    parser.add_argument("log")
+    parser.add_argument("--speed", default="max", help="'max' or a multiple of the recorded pace (1.0 = real time)")
+    parser.add_argument("--conf", type=float, default=None, help="Override the recorded confidence threshold")
+    args = parser.parse_args()
+
+    replay = SessionReplay(args.log, conf_min=args.conf)
+    try:
+        report = replay.run(0.0 if args.speed == "max" else float(args.speed))
+    finally:
+        replay.close()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,199 @@
+"""
+Shared State Channel for NaviGlass
+Shared-memory transport between the detector and web_server.py. The detector
+publishes the latest JPEG, the detection metadata for it and a fixed-layout
+state record; the web server maps the same block and only copies data out when
+a sequence number has changed.
+
+Each region is guarded by its own seqlock: the single writer makes the sequence
+odd, writes, then makes it even again. Readers retry if the sequence was odd or
+moved while they were copying, so they never see a torn record.
+"""
+
+import os
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+from typing import Optional, Tuple, Dict
+
+
+SHM_NAME = "naviglass_shm"
+MAX_META_BYTES = 16 * 1024 # JSON detection metadata for one frame
+MAX_FRAME_BYTES = 1024 * 1024 # Plenty for a 640x480 JPEG
+
+_SEQ = struct.Struct("<Q")
+_STATE = struct.Struct("<ddB31sQ") # timestamp, distance, urgent, label, frame_id
+_HEARTBEAT = struct.Struct("<d")
+_BLOB_HEADER = struct.Struct("<QI") # frame_id, length
+
+STATE_SEQ_OFFSET = 0
+STATE_OFFSET = 8
+HEARTBEAT_OFFSET = 64 # Written by the web server while it has viewers
+META_SEQ_OFFSET = 128 # Blob regions: seq, header, then data 32 bytes in
+FRAME_SEQ_OFFSET = META_SEQ_OFFSET + 32 + MAX_META_BYTES
+SHM_SIZE = FRAME_SEQ_OFFSET + 32 + MAX_FRAME_BYTES
+
+VIEWER_TIMEOUT = 2.0 # Seconds without a heartbeat before remote viewers count as gone
+READ_RETRIES = 100
+
+
+class SharedStateChannel:
+
+    def __init__(self, name: str = SHM_NAME, create: bool = False):
+        self.name = name
+        self.owner = create
+        self._shm = self._create(name) if create else self._attach(name)
+        self._buf = self._shm.buf
+
+
+    @staticmethod
+    def _create(name: str):
+        try:
+            return shared_memory.SharedMemory(name=name, create=True, size=SHM_SIZE)
+        except FileExistsError: # Left over from a crashed detector, start clean
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            return shared_memory.SharedMemory(name=name, create=True, size=SHM_SIZE)
+
+
+    @staticmethod
+    def _attach(name: str):
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError: # Python < 3.13 has no track flag
+            shm = shared_memory.SharedMemory(name=name)
+            # Stop the resource tracker unlinking the detector's block when we exit
+            resource_tracker.unregister(shm._name, "shared_memory")
+            return shm
+
+
+    def replaced(self) -> bool:
+        """True when the name now points at another block than the one mapped, i.e. the detector restarted."""
+        try:
+            current = os.stat(os.path.join("/dev/shm", self.name.lstrip("/")))
+            return current.st_ino != os.fstat(self._shm._fd).st_ino
+        except FileNotFoundError: # Detector gone, nothing newer to map
+            return False
+        except (OSError, AttributeError): # No /dev/shm on this platform, map again to find out
+            return True
+
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+    # --- Writer side (detector) ---
+
+    def _begin_write(self, offset: int) -> int:
+        seq = _SEQ.unpack_from(self._buf, offset)[0] + 1
+        _SEQ.pack_into(self._buf, offset, seq) # Odd: write in progress
+        return seq
+
+
+    def _end_write(self, offset: int, seq: int):
+        _SEQ.pack_into(self._buf, offset, seq + 1) # Even: record is consistent
+
+
+    def publish_state(self, distance: float, urgent: bool, label: Optional[str] = None,
+                      frame_id: int = 0, timestamp: Optional[float] = None):
+        if self._buf is None: # Closed at shutdown, late publishers are ignored
+            return
+        seq = self._begin_write(STATE_SEQ_OFFSET)
+        _STATE.pack_into(self._buf, STATE_OFFSET,
+                         timestamp if timestamp is not None else time.time(),
+                         float(distance), 1 if urgent else 0,
+                         (label or "").encode("utf-8")[:31], frame_id)
+        self._end_write(STATE_SEQ_OFFSET, seq)
+
+
+    def _publish_blob(self, seq_offset: int, data: bytes, frame_id: int, limit: int) -> bool:
+        n = len(data)
+        if n > limit or self._buf is None:
+            return False
+        seq = self._begin_write(seq_offset)
+        _BLOB_HEADER.pack_into(self._buf, seq_offset + 8, frame_id, n)
+        start = seq_offset + 32
+        self._buf[start:start + n] = data
+        self._end_write(seq_offset, seq)
+        return True
+
+
+    def publish_frame(self, frame_bytes: bytes, frame_id: int = 0) -> bool:
+        return self._publish_blob(FRAME_SEQ_OFFSET, frame_bytes, frame_id, MAX_FRAME_BYTES)
+
+
+    def publish_metadata(self, meta_json: bytes, frame_id: int = 0) -> bool:
+        return self._publish_blob(META_SEQ_OFFSET, meta_json, frame_id, MAX_META_BYTES)
+
+
+    def has_remote_viewers(self) -> bool:
+        if self._buf is None:
+            return False
+        last = _HEARTBEAT.unpack_from(self._buf, HEARTBEAT_OFFSET)[0]
+        return time.time() - last < VIEWER_TIMEOUT
+
+
+    # --- Reader side (web server) ---
+
+    def heartbeat(self):
+        _HEARTBEAT.pack_into(self._buf, HEARTBEAT_OFFSET, time.time())
+
+
+    def state_seq(self) -> int:
+        return _SEQ.unpack_from(self._buf, STATE_SEQ_OFFSET)[0]
+
+
+    def frame_seq(self) -> int:
+        return _SEQ.unpack_from(self._buf, FRAME_SEQ_OFFSET)[0]
+
+
+    def read_state(self, last_seq: int = -1) -> Tuple[int, Optional[Dict]]:
+        """Return (seq, state). state is None when nothing new has been published."""
+        for _ in range(READ_RETRIES):
+            seq = _SEQ.unpack_from(self._buf, STATE_SEQ_OFFSET)[0]
+            if seq == last_seq or seq == 0:
+                return seq, None
+            if seq & 1:
+                continue
+            timestamp, distance, urgent, label, frame_id = _STATE.unpack_from(self._buf, STATE_OFFSET)
+            if _SEQ.unpack_from(self._buf, STATE_SEQ_OFFSET)[0] == seq:
+                return seq, {
+                    "timestamp": timestamp,
+                    "distance": distance,
+                    "urgent": bool(urgent),
+                    "label": label.rstrip(b"\0").decode("utf-8", "replace") or None,
+                    "frame_id": frame_id,
+                }
+        return last_seq, None
+
+
+    def _read_blob(self, seq_offset: int, last_seq: int) -> Tuple[int, Optional[bytes]]:
+        for _ in range(READ_RETRIES):
+            seq = _SEQ.unpack_from(self._buf, seq_offset)[0]
+            if seq == last_seq or seq == 0:
+                return seq, None
+            if seq & 1:
+                continue
+            _, n = _BLOB_HEADER.unpack_from(self._buf, seq_offset + 8)
+            start = seq_offset + 32
+            data = bytes(self._buf[start:start + n]) # The only copy, made once per new version
+            if _SEQ.unpack_from(self._buf, seq_offset)[0] == seq:
+                return seq, data
+        return last_seq, None
+
+
+    def read_frame(self, last_seq: int = -1) -> Tuple[int, Optional[bytes]]:
+        """Return (seq, jpeg). jpeg is None when the frame has not changed since last_seq."""
+        return self._read_blob(FRAME_SEQ_OFFSET, last_seq)
+
+
+    def read_metadata(self, last_seq: int = -1) -> Tuple[int, Optional[bytes]]:
+        """Return (seq, json bytes) of the newest detection metadata, None if unchanged."""
+        return self._read_blob(META_SEQ_OFFSET, last_seq)
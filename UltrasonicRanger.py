@@ -0,0 +1,116 @@
+"""
+Ultrasonic Ranger for NaviGlass
+Edge-triggered HC-SR04 ranging. Instead of spinning on GPIO.input() until the
+echo line changes, rising and falling edges are timestamped from GPIO event
+callbacks and the caller blocks on an Event, so no Python code runs (and the
+GIL stays with inference) while the echo is in flight.
+
+Each edge is checked against the echo level and the time this ping was
+triggered. Some HC-SR04 clones hold the echo high for ~200 ms when nothing comes
+back, well past the timeout; the late fall of such a ping must not be taken
+for the rise of the next one.
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+SPEED_OF_SOUND_HALF_CM_S = 17150 # Round trip, so half the speed of sound in cm/s
+MIN_DISTANCE_CM = 2
+MAX_DISTANCE_CM = 400
+OUT_OF_RANGE = 999
+
+
+class UltrasonicRanger:
+
+    def __init__(self, trig: int, echo: int, gpio=None, timeout: float = 0.06):
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.trig = trig
+        self.echo = echo
+        self.timeout = timeout # A 400 cm echo takes ~23 ms; HC-SR04 gives up after ~38 ms
+        self._done = threading.Event()
+        self._trigger_ns = 0
+        self._rise_ns = None
+        self._fall_ns = None
+        self._lock = threading.Lock() # One ping in flight per sensor
+
+        gpio.setup(trig, gpio.OUT)
+        gpio.output(trig, gpio.LOW)
+        gpio.setup(echo, gpio.IN)
+        gpio.add_event_detect(echo, gpio.BOTH, callback=self._on_edge)
+
+
+    def _on_edge(self, channel):
+        now = time.perf_counter_ns() # Stamp first, before anything else can delay us
+        if now < self._trigger_ns or self._fall_ns is not None: # Left over from an earlier ping, or this one is done
+            return
+        if self.gpio.input(channel):
+            self._rise_ns = now
+        elif self._rise_ns is not None:
+            self._fall_ns = now
+            self._done.set()
+        # A fall without a rise is the tail of a timed-out ping that was still echoing when this one fired
+
+
+    def measure(self) -> float:
+        """One ping. Returns the distance in cm, or 999 when out of range or timed out."""
+        with self._lock:
+            self._rise_ns = None
+            self._fall_ns = None
+            self._done.clear()
+            self._trigger_ns = time.perf_counter_ns()
+
+            self.gpio.output(self.trig, self.gpio.HIGH) # Send a 10us pulse to trigger the sensor
+            time.sleep(0.00001)
+            self.gpio.output(self.trig, self.gpio.LOW)
+
+            if not self._done.wait(self.timeout): # Blocks without polling
+                return OUT_OF_RANGE
+            return distance_from_pulse((self._fall_ns - self._rise_ns) / 1e9)
+
+
+    def close(self):
+        try:
+            self.gpio.remove_event_detect(self.echo)
+        except Exception:
+            pass
+
+
+
+def distance_from_pulse(pulse_duration: float) -> float:
+    distance_cm = pulse_duration * SPEED_OF_SOUND_HALF_CM_S
+    if distance_cm < MIN_DISTANCE_CM or distance_cm > MAX_DISTANCE_CM:
+        return OUT_OF_RANGE
+    return distance_cm
+
+
+if __name__ == "__main__":
+    # Accuracy and CPU cost of edge-triggered ranging on fake GPIO. Every fifth ping a falling edge
+    # left over from a timed-out ping (a clone holding its echo ~200 ms) is delivered just after the
+    # trigger; it must not be taken for the rise, which would give a distance of a few cm.
+    from FakeGPIO import FakeGPIO
+    import statistics
+
+    gpio = FakeGPIO()
+    gpio.setmode(gpio.BOARD)
+    TRIG, ECHO = 13, 11
+    gpio.attach_sensor(TRIG, ECHO, 100.0)
+    ranger = UltrasonicRanger(TRIG, ECHO, gpio=gpio)
+
+    for true_cm in (30.0, 100.0, 250.0):
+        gpio.set_distance(ECHO, true_cm)
+        errors, wrong = [], 0
+        cpu0 = time.process_time()
+        for i in range(30):
+            if i % 5 == 0:
+                threading.Timer(0.0002, gpio._set_edge, (ECHO, gpio.LOW)).start()
+            errors.append(abs(ranger.measure() - true_cm))
+            wrong += errors[-1] > 5
+            time.sleep(0.01)
+        cpu = (time.process_time() - cpu0) / 30 * 1000
+        print(f"{true_cm:5.0f} cm: median error {statistics.median(errors):5.2f} cm, off by more than 5 cm {wrong}/30, "
+              f"CPU {cpu:6.3f} ms / ping")
+    ranger.close()
@@ -0,0 +1,163 @@
+"""
+Backend Calibration for NaviGlass
+Benchmarks every detector runtime that is installed here, at several thread
+counts and input sizes, on recorded frames, and saves the fastest configuration
+whose detections still agree with the reference (ultralytics at 640) to
+detector_backend.json. objectDetectionWithLocalWeb.py loads that choice at
+startup without benchmarking again.
+
+Agreement is measured the way the app sees detections: labels_from_result at
+the app's confidence threshold and minimum area, matched by class at IoU 0.5,
+scored as F1 against the reference.
+
+    python calibrate_backend.py --frames session.nglog [--floor 0.9] [--imgsz 640 512 416 320]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from CameraSource import SimulatedCamera, fit_size
+from DetectorBackend import DEFAULT_MODELS, available_backends, create_backend, save_backend_config
+from Hardware import load_frames
+from NavigationController import labels_from_result
+from DetectionConfig import DETECT_CLASSES, DETECTOR_CONFIG_FILE
+
+
+CONF_MIN = 0.70 # Same threshold DetectionService applies
+
+
+def _iou(a: Sequence[float], b: Sequence[float]) -> float:
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def agreement(reference: List[List[Dict]], candidate: List[List[Dict]], iou: float = 0.5) -> float:
+    """F1 of candidate labels against reference labels, per frame, same class and IoU >= iou."""
+    tp = fp = fn = 0
+    for ref, cand in zip(reference, candidate):
+        unmatched = list(ref)
+        for label in cand:
+            match = next((r for r in unmatched if r['class_id'] == label['class_id']
+                          and _iou(r['box'], label['box']) >= iou), None)
+            if match is None:
+                fp += 1
+            else:
+                unmatched.remove(match)
+                tp += 1
+        fn += len(unmatched)
+    return 1.0 if tp + fp + fn == 0 else 2 * tp / (2 * tp + fp + fn)
+
+
+def run_backend(backend, frames: List[np.ndarray], runs: int, warmup: int = 3):
+    """(labels per frame, per-call latencies in ms). Frames are scaled to the lores size the camera would deliver."""
+    size = fit_size(backend.imgsz)
+    inputs = [cv2.resize(f, size, interpolation=cv2.INTER_AREA) if (f.shape[1], f.shape[0]) != size else f
+              for f in frames]
+    for i in range(warmup):
+        backend(inputs[i % len(inputs)], verbose=False, classes=DETECT_CLASSES)
+    labels = [labels_from_result(backend(img, verbose=False, classes=DETECT_CLASSES)[0], CONF_MIN)
+              for img in inputs]
+    latencies = []
+    for i in range(runs):
+        img = inputs[i % len(inputs)]
+        t0 = time.perf_counter()
+        backend(img, verbose=False, classes=DETECT_CLASSES)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return labels, latencies
+
+
+def candidates(backends: Dict[str, str], threads: Sequence[int], sizes: Sequence[int]) -> List[Dict]:
+    out = []
+    for name, model in backends.items():
+        for imgsz in sizes:
+            # ultralytics picks its own thread count, the raw runtimes take an explicit one
+            for n in ([None] if name in ("ultralytics", "synthetic") else threads):
+                out.append({"backend": name, "model": model, "threads": n, "imgsz": imgsz})
+    return out
+
+
+def calibrate(frames: List[np.ndarray], backends: Dict[str, str], threads: Sequence[int], sizes: Sequence[int],
+              floor: float, runs: int, reference: Optional[Dict] = None) -> Dict:
+    if reference is None:
+        name = "ultralytics" if "ultralytics" in backends else next(iter(backends))
+        reference = {"backend": name, "model": backends[name], "threads": None, "imgsz": max(sizes)}
+    ref_backend = create_backend(**reference)
+    print(f"Reference: {ref_backend.describe()}")
+    ref_labels, _ = run_backend(ref_backend, frames, runs=0)
+    ref_objects = sum(len(l) for l in ref_labels)
+    if ref_objects == 0:
+        print("The reference detects nothing on these frames, agreement is meaningless; record frames with objects")
+
+    results = []
+    for config in candidates(backends, threads, sizes):
+        try:
+            backend = create_backend(**config)
+            labels, latencies = run_backend(backend, frames, runs)
+        except Exception as e:
+            print(f"  skip {config['backend']} threads={config['threads']} imgsz={config['imgsz']}: {e}")
+            continue
+        latencies.sort()
+        row = {**config,
+               "p50_ms": round(statistics.median(latencies), 2),
+               "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+               "agreement": round(agreement(ref_labels, labels), 3)}
+        row["accepted"] = row["agreement"] >= floor
+        results.append(row)
+        print(f"  {backend.describe():60s} p50 {row['p50_ms']:7.2f} ms  p95 {row['p95_ms']:7.2f} ms  "
+              f"agreement {row['agreement']:.3f}{'' if row['accepted'] else '  (below floor)'}")
+
+    accepted = [r for r in results if r["accepted"]]
+    best = min(accepted, key=lambda r: r["p50_ms"]) if accepted else None
+    return {"best": best, "reference": reference, "reference_objects": ref_objects, "floor": floor,
+            "frames": len(frames), "results": results}
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick the fastest accurate detector backend for this CPU.")
+    parser.add_argument("--frames", default="", help="Image directory or session log recorded with record_frames")
+    parser.add_argument("--model-dir", default=".", help="Where the exported models live")
+    parser.add_argument("--backends", nargs="*", default=None,
+                        help=f"Subset of {', '.join(DEFAULT_MODELS)} (default: every installed one)")
+    parser.add_argument("--threads", nargs="*", type=int, default=None)
+    parser.add_argument("--imgsz", nargs="*", type=int, default=[640, 512, 416, 320])
+    parser.add_argument("--floor", type=float, default=0.9, help="Minimum agreement with the reference (F1)")
+    parser.add_argument("--runs", type=int, default=50, help="Timed inferences per configuration")
+    parser.add_argument("--output", default=DETECTOR_CONFIG_FILE)
+    parser.add_argument("--dry-run", action="store_true", help="Benchmark only, do not save the choice")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames) if args.frames else []
+    if not frames:
+        print("No recorded frames given, using the simulated scene (timings are valid, agreement is not)")
+        camera = SimulatedCamera(fit_size(max(args.imgsz)), fit_size(max(args.imgsz)), fps=1000)
+        frames = [camera.capture(want_main=False).lores for _ in range(30)]
+
+    found = available_backends(args.model_dir)
+    if args.backends:
+        default_path = lambda name: os.path.join(args.model_dir, DEFAULT_MODELS[name]) if DEFAULT_MODELS.get(name) else ""
+        found = {name: found.get(name) or default_path(name) for name in args.backends}
+    if not found:
+        raise SystemExit("No detector runtime with a model found; install ncnn, onnxruntime, openvino or ultralytics")
+    cores = os.cpu_count() or 1
+    threads = args.threads or sorted({1, 2, max(1, cores // 2), cores})
+
+    report = calibrate(frames, found, threads, args.imgsz, args.floor, args.runs)
+    best = report["best"]
+    if best is None:
+        raise SystemExit(f"No configuration reached an agreement of {args.floor}")
+    print(json.dumps(best, indent=2))
+    if not args.dry_run:
+        save_backend_config(args.output, {k: best[k] for k in ("backend", "model", "threads", "imgsz",
+                                                              "p50_ms", "agreement")})
+        print(f"Saved to {args.output}, loaded at the next start")
@@ -0,0 +1,154 @@
+"""
+Load Test for NaviGlass
+Runs the whole detection stack on the simulated hardware backend, serves the
+Flask app from objectDetectionWithLocalWeb.py on a local port and hits it with
+concurrent MJPEG viewers, SSE overlay subscribers and JSON pollers. Needs no
+camera, GPIO or model, so it runs on any Linux machine.
+
+    python load_test.py [--viewers 4] [--sse 4] [--pollers 4] [--duration 20]
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+import urllib.request
+from typing import Dict, List
+
+os.environ.setdefault("NAVIGLASS_HARDWARE", "sim") # Before the app module reads its settings
+
+
+POLL_PATHS = ["/api/stream_stats", "/api/metrics", "/api/tracks", "/api/ranging", "/api/latency"]
+
+
+def _percentiles(values: List[float]) -> Dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {"count": len(values),
+            "p50_ms": round(statistics.median(values), 2),
+            "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+            "max_ms": round(values[-1], 2)}
+
+
+def mjpeg_viewer(base: str, deadline: float, out: Dict):
+    frames = 0
+    received = 0
+    try:
+        with urllib.request.urlopen(base + "/video_feed", timeout=5) as resp:
+            while time.monotonic() < deadline:
+                chunk = resp.read1(65536)
+                if not chunk:
+                    break
+                received += len(chunk)
+                frames += chunk.count(b"--frame\r\n")
+    except Exception as e:
+        out.setdefault("errors", []).append(repr(e))
+    out.setdefault("frames", []).append(frames)
+    out.setdefault("bytes", []).append(received)
+
+
+def sse_subscriber(base: str, deadline: float, out: Dict):
+    events = 0
+    try:
+        with urllib.request.urlopen(base + "/api/detections", timeout=20) as resp:
+            while time.monotonic() < deadline:
+                line = resp.readline()
+                if not line:
+                    break
+                if line.startswith(b"data:"):
+                    events += 1
+    except Exception as e:
+        out.setdefault("errors", []).append(repr(e))
+    out.setdefault("events", []).append(events)
+
+
+def poller(base: str, deadline: float, out: Dict, index: int):
+    latencies = out.setdefault("latency_ms", [])
+    i = index
+    while time.monotonic() < deadline:
+        path = POLL_PATHS[i % len(POLL_PATHS)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base + path, timeout=5) as resp:
+                resp.read()
+            latencies.append((time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            out.setdefault("errors", []).append(f"{path}: {e!r}")
+        time.sleep(0.05)
+
+
+def wait_ready(base: str, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(base + "/api/ready", timeout=2) as resp:
+                if resp.status == 200:
+                    return True
+        except Exception:
+            pass # 503 until the detector is up
+        time.sleep(0.1)
+    return False
+
+
+def run(viewers: int, sse: int, pollers: int, duration: float, warmup: float) -> Dict:
+    import objectDetectionWithLocalWeb as nav
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING) # No access log line per request
+    server = nav.serve("127.0.0.1", 0)
+    base = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    nav.start_services("sim")
+    if not wait_ready(base, timeout=30):
+        print("Stack did not report ready, testing anyway")
+    print(f"Serving {base}, warming up for {warmup:.0f} s")
+    time.sleep(warmup)
+
+    frames_before = nav.detection_service.stats().get("frames", 0) if nav.detection_service else 0
+    deadline = time.monotonic() + duration
+    results: Dict[str, Dict] = {"mjpeg": {}, "sse": {}, "poll": {}}
+    threads = [threading.Thread(target=mjpeg_viewer, args=(base, deadline, results["mjpeg"])) for _ in range(viewers)]
+    threads += [threading.Thread(target=sse_subscriber, args=(base, deadline, results["sse"])) for _ in range(sse)]
+    threads += [threading.Thread(target=poller, args=(base, deadline, results["poll"], i)) for i in range(pollers)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join(timeout=duration + 10)
+
+    detection = nav.detection_service.stats() if nav.detection_service else {}
+    hardware = nav.hardware
+    report = {
+        "duration_s": duration,
+        "detection_fps": round((detection.get("frames", 0) - frames_before) / duration, 2),
+        "mjpeg_viewers": viewers,
+        "mjpeg_fps_per_viewer": [round(n / duration, 2) for n in results["mjpeg"].get("frames", [])],
+        "mjpeg_mbytes": round(sum(results["mjpeg"].get("bytes", [])) / 1e6, 2),
+        "sse_subscribers": sse,
+        "sse_events_per_s": [round(n / duration, 2) for n in results["sse"].get("events", [])],
+        "poll_requests": _percentiles(results["poll"].get("latency_ms", [])),
+        "errors": [e for r in results.values() for e in r.get("errors", [])][:10],
+        "pwm_commands": len(hardware.haptics.commands()),
+        "utterances": [text for _, text, _ in getattr(hardware.audio, "spoken", [])][-5:],
+        "stream": nav.frame_broadcaster.stats(),
+        "boot": {"milestones": nav.BOOT.status()["milestones"], "timeline": nav.BOOT.timeline()},
+    }
+    server.shutdown()
+    nav.shutdown()
+    return report
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the NaviGlass web stack on simulated hardware.")
+    parser.add_argument("--viewers", type=int, default=4, help="Concurrent MJPEG viewers")
+    parser.add_argument("--sse", type=int, default=4, help="Concurrent /api/detections subscribers")
+    parser.add_argument("--pollers", type=int, default=4, help="Concurrent JSON endpoint pollers")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.viewers, args.sse, args.pollers, args.duration, args.warmup), indent=2, default=str))
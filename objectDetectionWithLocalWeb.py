@@ -1,22 +1,57 @@
 import time
 import cv2
-from picamera2 import Picamera2
 from flask import Flask, Response, jsonify, request # Used for web streaming
 from flask_cors import CORS
-from ultralytics import YOLO
 import threading
-import RPi.GPIO as GPIO
 import statistics
 from SmartNarrator import SmartNarrator
-from TTSEngine import TTSEngine
 from BluetoothAudioManager import BluetoothAudioManager
+from FrameBroadcaster import FrameBroadcaster
+from DetectionService import DetectionService
+from SharedStateChannel import SharedStateChannel
+from RangingService import RangingService
+from DetectionSnapshot import DetectionSnapshot
+from ObjectTracker import ObjectTracker
+from NavigationController import (NavigationController, labels_from_result, select_biggest_label,
+                                  calculate_duty_cycle, calculate_spatial_ratio)
+from MotionScheduler import MotionScheduler
+from CameraSource import fit_size
+from Hardware import choose_backend, create_hardware
+from DetectorBackend import load_artifact, load_backend_config
+from DetectionConfig import DETECT_CLASSES, DETECTOR_CONFIG_FILE
+from InferencePool import InferencePool
+from SessionLog import SessionRecorder
+from MetricsRegistry import METRICS, PROMETHEUS_CONTENT_TYPE
+from LatencyTracer import TRACER
+from AsyncLogger import LOG
+import json
 import os
-
-
-_left_pwm = None
-_right_pwm = None
-_latest_labels = []
-_latest_labels_lock = threading.Lock()
+import sys
+import numpy as np
+from werkzeug.serving import make_server
+from BootSequence import BootSequence
+from ControlSignal import ControlSignal, RANGE
+from HapticEngine import HapticEngine, OFF, Steady, distance_pulses
+
+# Boot is timed from process start; subsystems not in `optional` must be up for /api/ready
+BOOT = BootSequence(("web", "ranging", "haptics", "audio", "camera", "model", "detector", "bluetooth"),
+                    optional=("bluetooth",))
+_imports_done_ns = time.monotonic_ns()
+
+
+_latest_snapshot = DetectionSnapshot.empty() # Replaced wholesale on publish, never mutated
+_tracker = ObjectTracker() # Only touched from the detection thread
+_rangers = {} # (trig, echo) -> UltrasonicRanger
+_motor_duty = (0, 0) # Last duty cycles written, so only real changes count as a haptic reaction
+control_signal = ControlSignal() # Wakes main_loop on every new snapshot and range sample
+main_loop_stop = threading.Event() # Set by shutdown(), which then wakes the loop through control_signal
+main_loop_thread = None
+STALE_DETECTIONS_S = 0.5 # No new snapshot for this long: the motors fall back to ranging-only warnings
+
+_m_main_loop = METRICS.histogram("naviglass_main_loop_seconds", "Work done per main loop iteration, waiting excluded")
+_m_main_loop_errors = METRICS.counter("naviglass_main_loop_errors_total", "Exceptions caught in the main loop")
+_m_tts_speak_call = METRICS.histogram("naviglass_tts_speak_call_seconds", "Time tts.speak() blocked the main loop")
+_m_tts_utterances = METRICS.counter("naviglass_tts_utterances_total", "Sentences handed to the TTS engine")
 SENSOR_TRIG_PIN1 = 13
 SENSOR_ECHO_PIN1 = 11
 SENSOR_TRIG_PIN2 = 16
@@ -24,36 +59,65 @@ SENSOR_ECHO_PIN2 = 18
 VIB_MOTOR_PIN1 = 32
 VIB_MOTOR_PIN2 = 33
 CONFIG_FILE = "last_device.txt"
-DETECT_CLASSES = [
-    0,   # person
-    1,   # bicycle
-    2,   # car
-    3,   # motorcycle
-    5,   # bus
-    7,   # truck
-    9,   # traffic light
-    10,  # fire hydrant
-    11,  # stop sign
-    13,  # bench
-]
+SETTINGS_FILE = "naviglass_settings.json"
+DEFAULT_DETECTION_FPS = 10.0
+MODEL_IMGSZ = 640 # Input size yolo11n_ncnn_model was exported at, used until calibrate_backend.py picks another
 
 
 app = Flask(__name__)  # Initialize Flask app
 CORS(app)  # Enable CORS for GitHub Pages
 
-picam = Picamera2()  # Initialize the camera
-print("Camera initialized.")
-config = picam.create_preview_configuration(main={'size': (640, 480), 'format': 'RGB888'})
-picam.configure(config)
-picam.start()  # Start the camera
+def load_settings():
+    defaults = {"detection_fps": DEFAULT_DETECTION_FPS, "motion_gating": True,
+                "display_size": [640, 480], "headless": False, "pipelined": True,
+                "jpeg_quality": 80, "stream_scale": 1.0, "overlay_mode": "server", "hardware_jpeg": False,
+                "log_level": "INFO", "log_format": "text", "record_session": "", "record_frames": False,
+                "hardware": "auto", "sim_frames": "", "sim_fps": 15.0, "sim_model": "synthetic",
+                "sim_inference_ms": 0.0, "sim_distance_profile": None, "inference_workers": 1,
+                "fast_detector": True, "model_artifact": "",
+                "haptic_mode": "steady", "haptic_pwm": "software", "haptic_pwm_chip": 0}
+    if os.path.exists(SETTINGS_FILE):
+        try:
+            with open(SETTINGS_FILE, "r") as f:
+                return {**defaults, **json.load(f)}
+        except Exception as e:
+            print(f"Failed to read settings: {e}")
+    return defaults
+
+
+settings = load_settings()
+LOG.set_level(settings["log_level"])
+LOG.fmt = settings["log_format"]
+LOG.set_rate_limit("main_loop_error", 1.0)
 
-model = YOLO("yolo11n_ncnn_model")  # Load the model
-print("YOLO11n loaded.")
+hardware = None # Camera, GPIO, motors and audio, created in start_services() so importing touches no device
+
+picam = None
+
+model = None
+
+detector_config = None # Backend, threads and input size chosen by calibrate_backend.py
+
+inference_pool = None # Worker processes with model replicas when inference_workers > 1
 
 narrator = SmartNarrator() # Initialize the narrator
 
 bt_manager = BluetoothAudioManager()
 
+frame_broadcaster = FrameBroadcaster(quality=settings["jpeg_quality"], scale=settings["stream_scale"]) # Single shared slot every MJPEG viewer reads from
+METRICS.gauge("naviglass_stream_viewers", "Local MJPEG viewers").set_function(lambda: frame_broadcaster.subscribers)
+METRICS.gauge("naviglass_tracks", "Live tracks in the object tracker").set_function(lambda: len(_tracker.tracks))
+
+detection_service = None
+
+state_channel = None # Shared memory block read by web_server.py
+
+ranging_service = None # Background pinging of both sensors
+
+recorder = None # SessionRecorder when record_session is set, replay with SessionReplay.py
+
+haptic_engine = None # Owns the motors, main_loop only submits patterns
+
 tts = None
 
 
@@ -101,78 +165,44 @@ def setup_bluetooth_auto():
 
 
 def setup_vibration_motor(): # Pin set up
-    global _left_pwm, _right_pwm
-    GPIO.setmode(GPIO.BOARD)
-    GPIO.setup(VIB_MOTOR_PIN1, GPIO.OUT)
-    GPIO.setup(VIB_MOTOR_PIN2, GPIO.OUT)
+    global haptic_engine
+    engine = HapticEngine(hardware.haptics)
+    engine.start()
+    haptic_engine = engine
+    print(f"Vibration setup complete ({type(hardware.haptics).__name__}, {settings['haptic_mode']} mode).")
 
-    _left_pwm = GPIO.PWM(VIB_MOTOR_PIN1, 100)
-    _right_pwm = GPIO.PWM(VIB_MOTOR_PIN2, 100)
 
-    _left_pwm.start(0)
-    _right_pwm.start(0)
-    print("Vibration setup complete.")
+def haptic_pattern(left_dc, right_dc, distance_cm=None):
+    if not (left_dc or right_dc):
+        return OFF
+    if settings["haptic_mode"] == "pulse" and distance_cm is not None: # Faster pulses as the object gets closer
+        return distance_pulses(left_dc, right_dc, distance_cm)
+    return Steady(left_dc, right_dc)
 
 
-def set_motor_speed(left_dc, right_dc):
+def set_motor_speed(left_dc, right_dc, frame_id=-1, capture_ns=0, distance_cm=None):
+    global _motor_duty
     left_dc = max(0, min(100, left_dc))
     right_dc = max(0, min(100, right_dc))
-    if _left_pwm and _right_pwm:
-        _left_pwm.ChangeDutyCycle(left_dc)
-        _right_pwm.ChangeDutyCycle(right_dc)
-
-
-def calculate_duty_cycle(distance):
-    if distance > 400:
-        return 10
-    else:
-        return 45 - distance / 400 * 25  # Linearly map distance to duty cycle
-
-
-def calculate_spatial_ratio(x_coordinate, duty_cycle):
-    left_dc = min(90, 2 * duty_cycle * (1-x_coordinate))
-    right_dc = min(90, 2 * duty_cycle * x_coordinate)
-    return left_dc, right_dc
-
+    if haptic_engine: # Only writes GPIO when the output changes
+        haptic_engine.submit(haptic_pattern(left_dc, right_dc, distance_cm))
+    if left_dc or right_dc:
+        BOOT.milestone("first_haptic")
+    if (left_dc, right_dc) != _motor_duty: # Photons to a changed vibration, the latency the user feels
+        _motor_duty = (left_dc, right_dc)
+        TRACER.reaction("haptic", frame_id, capture_ns, {"left": left_dc, "right": right_dc})
 
 
 def setup_sensor(): # Pin set up
-    GPIO.setmode(GPIO.BOARD)
-    GPIO.setup(SENSOR_TRIG_PIN1, GPIO.OUT)
-    GPIO.output(SENSOR_TRIG_PIN1, GPIO.LOW)
-    GPIO.setup(SENSOR_ECHO_PIN1, GPIO.IN)
-    GPIO.setup(SENSOR_TRIG_PIN2, GPIO.OUT)
-    GPIO.output(SENSOR_TRIG_PIN2, GPIO.LOW)
-    GPIO.setup(SENSOR_ECHO_PIN2, GPIO.IN)
+    _rangers.update(hardware.attach_rangers([(SENSOR_TRIG_PIN1, SENSOR_ECHO_PIN1), (SENSOR_TRIG_PIN2, SENSOR_ECHO_PIN2)]))
     print("Distance sensor setup complete.")
 
 
-def measure_distance(TRIG, ECHO):
-    GPIO.output(TRIG, GPIO.HIGH) # Send a 10us pulse to trigger the sensor
-    time.sleep(0.00001)
-    GPIO.output(TRIG, GPIO.LOW)
-
-    MAX_TIMEOUT = 0.3 # 300 ms timeout
-    t_timeout = time.time()
-
-    while GPIO.input(ECHO) == 0: # Wait for the echo start
-        if time.time() - t_timeout > MAX_TIMEOUT:
-            return 999  # Timeout, return out of range
-        pulse_start = time.time()
-
-    t_timeout = time.time()
-    while GPIO.input(ECHO) == 1:
-        if time.time() - t_timeout > MAX_TIMEOUT:
-            return 999  # Timeout, return out of range
-        pulse_end = time.time()
-
-    pulse_duration = pulse_end - pulse_start # Calculate pulse duration and distance
-    distance_cm = pulse_duration * 17150
-
-    if distance_cm < 2 or distance_cm > 400:
-        return 999  # Out of range
-    
-    return distance_cm
+def measure_distance(TRIG, ECHO): # Edge-timestamped ping, blocks on an event instead of spinning
+    ranger = _rangers.get((TRIG, ECHO))
+    if ranger is None:
+        return 999  # Sensor not set up, treat as out of range
+    return ranger.measure()
 
 
 def generate_distance(TRIG, ECHO): # Make 3 distance measurements
@@ -184,150 +214,132 @@ def generate_distance(TRIG, ECHO): # Make 3 distance measurements
         t+=1
         time.sleep(0.04)
     median_distance = statistics.median(distances) # Return the median of the 3 measurements
-    print("Distance measured: " + str(median_distance)) # Print distance for debugging
+    LOG.debug("distance_measured", cm=median_distance)
     return median_distance
 
 
 
-def set_latest_labels(labels): # Safely set the labels
-    global _latest_labels
-    with _latest_labels_lock:
-        _latest_labels = list(labels) if labels is not None else []
+def get_distance(): # Closest filtered distance from the two sensors
+    if ranging_service:
+        return ranging_service.distance() # Served from the background ring buffers, no waiting
+    distance1 = generate_distance(SENSOR_TRIG_PIN1, SENSOR_ECHO_PIN1)
+    distance2 = generate_distance(SENSOR_TRIG_PIN2, SENSOR_ECHO_PIN2) # Measure from the two sensors
+    return min(distance1, distance2)
+
+
+
+def set_latest_labels(labels, frame_id=None, capture_ts=None, capture_ns=0): # Publish a new snapshot by reference swap
+    global _latest_snapshot
+    if frame_id is None:
+        frame_id = _latest_snapshot.frame_id + 1
+    if capture_ts is None:
+        capture_ts = time.time()
+    labels = _tracker.update(list(labels or []), capture_ts) # Attach stable track ids
+    _latest_snapshot = DetectionSnapshot.from_labels(labels, frame_id, capture_ts, capture_ns=capture_ns)
+    control_signal.notify_detection()
+    TRACER.instant("snapshot_published", frame_id, "postprocess")
+    if labels:
+        BOOT.milestone("first_detection")
+
+
+def publish_predicted(frame_id, capture_ts, capture_ns=0): # Inference skipped: carry tracks forward by their velocity
+    global _latest_snapshot
+    labels = _tracker.predict(capture_ts)
+    _latest_snapshot = DetectionSnapshot.from_labels(labels, frame_id, capture_ts, capture_ns=capture_ns)
+    control_signal.notify_detection()
+    TRACER.instant("snapshot_predicted", frame_id, "postprocess")
+    return labels
+
 
+def get_latest_snapshot(): # Lock-free: a single reference read
+    return _latest_snapshot
 
-def get_latest_labels(): # Safely get the labels
-    with _latest_labels_lock:
-        return list(_latest_labels)
+
+def get_latest_labels():
+    return _latest_snapshot.to_labels()
     
 
-def labels_from_result(result, conf_min: float = 0.70):
-    out = []
-    if getattr(result, "boxes", None) is None or len(result.boxes) == 0:
-        return out
-    names = result.names
-    for cls_tensor, conf_tensor, box_tensor in zip(result.boxes.cls, result.boxes.conf, result.boxes.xyxyn):
-        conf = float(conf_tensor.item())
-        if conf >= conf_min: # Check the confidence is higher than the threshold
-            x1, y1, x2, y2 = box_tensor.tolist() # Get the coordinates of the center of the bounding box
-            width = x2 - x1
-            height = y2 - y1
-            area = width * height
-            if area < 0.0625: # Skip the objects that cover less than 1/16 of the frame
-                continue
-            cls_id = int(cls_tensor.item())
-            label = names.get(cls_id, str(cls_id)) # Get the label
-            center_x = x1 + width / 2
-            center_y = y1 + height / 2
-            out.append({'label': label, 'confidence': conf, 'coordinates': (center_x, center_y), 'area': area})
-    return out
-
-
-def generate_frames():
-    while True:
-        frame = picam.capture_array() # Capture frame from Picamera2
-        t0 = time.perf_counter() # Start time for fps measurement
-
-        results = model(frame, verbose=False, classes=DETECT_CLASSES) # Run the YOLO model on a certain amount of classes
-        r = results[0] # Extract the Results object from the list
-        labels = labels_from_result(r, conf_min=0.70) # Get labels from the Results object with confidence filtering
-        set_latest_labels(labels) # Set the thread-safe variable
-
-        t1 = time.perf_counter() # End time for fps measurement
-        elpased_ms = (t1 - t0) * 1000
-        fps = 1000 / elpased_ms
-        print(f"Inference time: {elpased_ms:.2f} ms, FPS: {fps:.2f}") # Print time for observation
-
-        annotated_frame = r.plot() # Draw bounding boxes
-        ret, buffer = cv2.imencode('.jpg', annotated_frame) # Turn the frame into JPEG and send to stream through Flask
-        if not ret:
-            continue
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        time.sleep(0.05) # Rest the CPU
-
-
-def select_biggest_label(labels): # Select the label with the highest area
-    if not labels:
-        return None
-    best = max(labels, key=lambda x: x.get('area', 0.0))
-    return best
-
-
-
-def narrate_sentence(best_object, distance_cm): # Narrate sentences from the local SmartNarrator class
+def generate_frames(): # Viewers only read the shared slot, no extra inference
+    return frame_broadcaster.stream()
+
+
+def publish_state(distance_cm, label=None): # Hand the latest status to web_server.py
+    if state_channel:
+        state_channel.publish_state(distance_cm, distance_cm < 60, label=label)
+
+
+def narrate_sentence(best_object, distance_cm, frame_id=-1, capture_ns=0): # Narrate sentences from the local SmartNarrator class
     sentence = narrator.generate(best_object['label'], distance_cm, best_object['coordinates'][0])
-    print(sentence)
+    LOG.info("narration", label=best_object['label'], distance_cm=distance_cm, sentence=sentence)
 
     is_urgent = distance_cm < 60
     if tts:
-        tts.speak(sentence, interrupt=is_urgent)
+        t0 = time.perf_counter()
+        tts.speak(sentence, interrupt=is_urgent, frame_id=frame_id, capture_ns=capture_ns) # Reaction traced at playback
+        _m_tts_speak_call.observe(time.perf_counter() - t0)
+        _m_tts_utterances.inc()
+
     return sentence
     
 
 
 def main_loop():
-    last_label = None
-    consecutive_misses = 0
-    vib_deadline = 0
-    ref_distance = 999
-    MAX_MISSES = 10
-    VIB_PULSE_TIME = 3
-    APPROACH_SENSITIVITY = 10
+    controller = NavigationController() # Decision logic, kept free of hardware so it can be replayed
+    last_frame_id = -1
+    last_new_frame = time.monotonic()
+    detector_ready = was_stale = False
+    seen = (0, 0) # Snapshot and range sample sequence numbers already handled
 
     print ("Main loop started")
 
-    while True:
+    while not main_loop_stop.is_set():
+        # Sleeps until a new snapshot or range sample, waking anyway often enough to notice stale detections
+        seen, reason = control_signal.wait(seen, timeout=STALE_DETECTIONS_S / 2)
+        if main_loop_stop.is_set():
+            break
+        started = time.monotonic_ns()
+        acted = False
         try:
-            best = select_biggest_label(get_latest_labels())
-
-            if best:
-                consecutive_misses = 0
-                label = best['label']
-                x, _ = best['coordinates']
-
-                distance1 = generate_distance(SENSOR_TRIG_PIN1, SENSOR_ECHO_PIN1) 
-                distance2 = generate_distance(SENSOR_TRIG_PIN2, SENSOR_ECHO_PIN2) # Measure from the two sensors
-                distance_cm = min(distance1, distance2)
-
-                should_vibrate = False
-
-                if label != last_label:
-                    vib_deadline = time.time() + VIB_PULSE_TIME
-                    ref_distance = distance_cm
-                    should_vibrate = True
-                else:
-                    if distance_cm <= 400 and distance_cm < ref_distance - APPROACH_SENSITIVITY:
-                        vib_deadline = time.time() + VIB_PULSE_TIME
-                        ref_distance = distance_cm
-                        should_vibrate = True
-                    elif time.time() < vib_deadline:
-                        should_vibrate = True
-                    elif time.time() >= vib_deadline:
-                        vib_deadline = 0
-                        should_vibrate = False
-
-                if should_vibrate:
-                    duty_cycle = calculate_duty_cycle(distance_cm)
-                    left_dc, right_dc = calculate_spatial_ratio(x, duty_cycle)
-                    set_motor_speed(left_dc, right_dc)
-                else:
-                    set_motor_speed(0, 0)
-            
-                if label != last_label:
-                    narrate_sentence(best, distance_cm)
-                    last_label = label
-            else:
-                consecutive_misses += 1
-                set_motor_speed(0, 0)
-                if consecutive_misses >= MAX_MISSES:
-                    last_label = None
-                    ref_distance = 999
-        
+            snapshot = get_latest_snapshot()
+            if snapshot.frame_id != last_frame_id or not detector_ready: # The first frame gets the same grace
+                last_new_frame = time.monotonic()
+            detector_ready = BOOT.is_ready("detector")
+            stale = detector_ready and time.monotonic() - last_new_frame > STALE_DETECTIONS_S
+            if stale != was_stale:
+                was_stale = stale
+                LOG.warning("detections_stale" if stale else "detections_resumed", frame_id=snapshot.frame_id)
+            if not detector_ready or stale: # No fresh detections: warn about obstacles from the sensors alone
+                decision = controller.obstacle_step(get_distance(), time.time())
+                set_motor_speed(decision.left_dc, decision.right_dc, distance_cm=decision.distance_cm)
+                publish_state(decision.distance_cm)
+            elif snapshot.frame_id != last_frame_id: # Only act when a new frame has been detected
+                last_frame_id = snapshot.frame_id
+                acted = True
+                frame_id, capture_ns = snapshot.frame_id, snapshot.capture_ns # Carried on to the outputs for tracing
+                decision = controller.step(snapshot, get_distance, time.time(), _tracker.alive_ids())
+
+                set_motor_speed(decision.left_dc, decision.right_dc, frame_id, capture_ns, decision.distance_cm)
+                sentence = None
+                if decision.narrate:
+                    sentence = narrate_sentence(decision.target, decision.distance_cm, frame_id, capture_ns)
+                publish_state(decision.distance_cm, decision.label)
+                if recorder:
+                    recorder.record_decision(decision, capture_ns, time.monotonic_ns(), sentence)
+            elif reason == RANGE: # New distance between frames: the motors follow it for the object in focus
+                decision = controller.range_step(get_distance(), time.time())
+                if decision:
+                    set_motor_speed(decision.left_dc, decision.right_dc, distance_cm=decision.distance_cm)
+                    publish_state(decision.distance_cm, decision.label)
+                    if recorder:
+                        recorder.record_decision(decision, 0, time.monotonic_ns(), range_step=True)
+
         except Exception as e:
-            print(f"Error in main loop: {e}")
-        
-        time.sleep(0.1) # Main loop delay 
+            _m_main_loop_errors.inc()
+            LOG.error("main_loop_error", error=repr(e))
+        finished = time.monotonic_ns()
+        _m_main_loop.observe((finished - started) / 1e9)
+        if acted:
+            TRACER.span("main_loop", started, finished, last_frame_id, "main_loop")
 
 
 
@@ -413,6 +425,53 @@ def index():
 def video_feed():
     return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/api/detections')
+def api_detections(): # Per-frame boxes for the browser-side overlay, as Server-Sent Events
+    return Response(frame_broadcaster.metadata_stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/metrics')
+def api_metrics(): # Prometheus scrape target
+    return Response(METRICS.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/trace')
+def api_trace(): # Chrome trace-event JSON, open in chrome://tracing or ui.perfetto.dev
+    return jsonify(TRACER.chrome_trace())
+
+@app.route('/api/latency')
+def api_latency(): # p50 / p95 per span over the trace ring buffer
+    return jsonify(TRACER.summary())
+
+@app.route('/api/log_level', methods=['GET', 'POST'])
+def api_log_level(): # Switch verbosity at runtime, e.g. {"level": "DEBUG"}
+    if request.method == 'POST':
+        try:
+            LOG.set_level((request.json or {}).get('level'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        LOG.info("log_level_changed", level=LOG.level_name())
+    return jsonify(LOG.stats())
+
+@app.route('/api/ready')
+def api_ready(): # Per-subsystem boot state and timeline; 503 until everything required is up
+    status = BOOT.status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+@app.route('/api/tracks')
+def api_tracks():
+    return jsonify(_tracker.stats(time.time()))
+
+@app.route('/api/ranging')
+def api_ranging():
+    return jsonify(ranging_service.stats() if ranging_service else [])
+
+@app.route('/api/stream_stats')
+def api_stream_stats():
+    stats = frame_broadcaster.stats()
+    if detection_service:
+        stats["detection"] = detection_service.stats()
+    return jsonify(stats)
+
 # --- Bluetooth API Endpoints ---
 
 @app.route('/api/scan')
@@ -460,39 +519,186 @@ def api_disconnect():
 
 
 
-if __name__ == '__main__': # Main function
+def inference_imgsz():
+    return (detector_config or {}).get("imgsz", MODEL_IMGSZ)
+
+
+def warm_up_model(model, runs=2): # The first inference allocates and packs weights, pay for it before real frames
+    w, h = fit_size(inference_imgsz())
+    blank = np.zeros((h, w, 3), np.uint8)
+    for _ in range(runs):
+        model(blank, verbose=False, classes=DETECT_CLASSES)
+
+
+def open_camera():
+    global picam
+    with BOOT.phase("camera_open", subsystem="camera"):
+        camera = hardware.open_camera()
+        camera.start()  # Start the camera
+        picam = camera
+
+
+def load_model():
+    global model, inference_pool
+    workers = int(settings["inference_workers"])
+    if workers > 1: # Each replica loads and warms up in its own process
+        with BOOT.phase("model_load", subsystem="model"):
+            pool = InferencePool(hardware.detector, workers, fit_size(inference_imgsz()), DETECT_CLASSES)
+            pool.start()
+        inference_pool = pool
+        return
+    with BOOT.phase("model_load"): # Includes importing the model runtime
+        loaded = hardware.load_model()
+    with BOOT.phase("model_warmup", subsystem="model"):
+        warm_up_model(loaded)
+    model = loaded
+    print(f"Detector loaded: {model.describe()}")
+
+
+def start_detector(): # Camera opens while the model loads, the detector starts once both are up
+    global detection_service
+    camera_thread = BOOT.run_background("camera", open_camera)
     try:
-        setup_sensor()
+        load_model()
     except Exception as e:
-        print(f"Failed to setup distance sensor: {e}")
-        
+        BOOT.fail("model", e)
+        print(f"Failed to load model: {e}")
+    camera_thread.join()
+    if picam is None or (model is None and inference_pool is None):
+        BOOT.fail("detector", "camera or model unavailable")
+        return
+
+    try: # Start the headless capture + inference service, viewers are optional
+        with BOOT.phase("detector_start", subsystem="detector"):
+            service = DetectionService(picam, model, frame_broadcaster,
+                                       label_fn=labels_from_result, on_labels=set_latest_labels,
+                                       classes=DETECT_CLASSES, conf_min=0.70,
+                                       target_fps=float(settings["detection_fps"]),
+                                       scheduler=MotionScheduler() if settings["motion_gating"] else None,
+                                       on_skip=publish_predicted, distance_fn=get_distance,
+                                       pipelined=settings["pipelined"],
+                                       overlay_mode=settings["overlay_mode"], recorder=recorder,
+                                       pool=inference_pool)
+            service.start()
+            detection_service = service
+    except Exception as e:
+        print(f"Failed to start detection service: {e}")
+
+
+def start_bluetooth(): # connect_audio can block for tens of seconds, so it never holds up the rest of the boot
+    with BOOT.phase("bluetooth_connect", subsystem="bluetooth"):
+        setup_bluetooth_auto()
+
+
+def start_services(backend=None): # Fast path first: ranging, motors and audio, then camera and model in the background
+    global hardware, tts, recorder, ranging_service, state_channel, detector_config, main_loop_thread
+    BOOT.record("interpreter_imports", BOOT.start_ns, _imports_done_ns)
+    detector_config = load_backend_config(DETECTOR_CONFIG_FILE) # No benchmarking at startup, only the saved choice
+    if settings["model_artifact"]: # Versioned model from ModelExport.py instead of the stock one
+        try:
+            artifact = load_artifact(settings["model_artifact"])
+            if detector_config and detector_config.get("backend") == artifact["backend"]:
+                artifact["threads"] = detector_config.get("threads") # Calibrated thread count still applies
+            detector_config = artifact
+            print(f"Model artifact: {artifact['artifact']}")
+        except Exception as e:
+            print(f"Failed to load model artifact, using the default model: {e}")
+    backend = backend or choose_backend(settings["hardware"])
+    print(f"Hardware backend: {backend}")
+    with BOOT.phase("hardware_backend"): # Nothing is opened yet, the camera and model are created lazily
+        # lores stream at the model's input size for inference, main stream only for the MJPEG view
+        hardware = create_hardware(backend, settings, fit_size(inference_imgsz()), (VIB_MOTOR_PIN1, VIB_MOTOR_PIN2),
+                                   detector_config)
+        if settings["fast_detector"] and hardware.detector: # Raw runtimes then decode only DETECT_CLASSES, see FastDetector.py
+            hardware.detector = {**hardware.detector, "fast": {"classes": DETECT_CLASSES, "conf_min": 0.70}}
+
+    if settings["record_session"]:
+        try:
+            recorder = SessionRecorder(settings["record_session"], record_frames=settings["record_frames"],
+                                       meta={"conf_min": 0.70, "settings": settings, "hardware": backend})
+            print(f"Recording session to {settings['record_session']}")
+        except Exception as e:
+            print(f"Failed to start session recording: {e}")
+
     try:
-        setup_vibration_motor()
+        with BOOT.phase("ranging_start", subsystem="ranging"):
+            setup_sensor()
+            ranging_service = RangingService([_rangers[(SENSOR_TRIG_PIN1, SENSOR_ECHO_PIN1)],
+                                              _rangers[(SENSOR_TRIG_PIN2, SENSOR_ECHO_PIN2)]], recorder=recorder,
+                                             on_sample=control_signal.notify_range)
+            ranging_service.start()
+    except Exception as e:
+        print(f"Failed to start ranging: {e}")
+
+    try:
+        with BOOT.phase("haptics_start", subsystem="haptics"):
+            setup_vibration_motor()
     except Exception as e:
         print(f"Failed to setup vibration motor: {e}")
 
     try:
-        setup_bluetooth_auto()
+        with BOOT.phase("audio_start", subsystem="audio"):
+            tts = hardware.audio
+            tts.start()
     except Exception as e:
-        print(f"Bluetooth setup failed: {e}")
+        print(f"Failed to start audio: {e}")
 
-    tts = TTSEngine(volume=0.5)
-    tts.start()
+    try:
+        state_channel = SharedStateChannel(create=True)
+        frame_broadcaster.channel = state_channel
+    except Exception as e:
+        print(f"Failed to create shared state channel: {e}")
 
-    try: # Start the main loop
-        runner = main_loop
-        t = threading.Thread(target=runner, daemon=True)
-        t.start()
+    try: # Start the main loop, it gives obstacle warnings from the sensors until the detector is up
+        main_loop_stop.clear()
+        main_loop_thread = threading.Thread(target=main_loop, daemon=True, name="main-loop")
+        main_loop_thread.start()
     except Exception as e:
         print(f"Failed to start main loop: {e}")
 
+    BOOT.run_background("detector", start_detector)
+    if hardware.simulated:
+        BOOT.skip("bluetooth", "simulated hardware")
+    else:
+        BOOT.run_background("bluetooth", start_bluetooth)
+
+
+def serve(host='0.0.0.0', port=5000): # Bind first, so /api/ready is reachable while the model still loads
+    with BOOT.phase("web_bind", subsystem="web"):
+        server = make_server(host, port, app, threaded=True)
+    print(f"Web server on http://{host}:{server.server_port}")
+    return server
+
+
+def shutdown():
+    global state_channel
+    main_loop_stop.set() # Before anything it publishes to or drives goes away
+    control_signal.notify_range()
+    if main_loop_thread: main_loop_thread.join(timeout=2)
+    if ranging_service: ranging_service.stop()
+    if detection_service: detection_service.stop()
+    if inference_pool: inference_pool.stop()
+    if haptic_engine: haptic_engine.stop()
+    if picam: picam.stop()
+    if hardware: hardware.close()
+    _rangers.clear()
+
+    channel, state_channel = state_channel, None # Detach first, so nothing can publish into a closed block
+    frame_broadcaster.channel = None
+    if channel: channel.close()
+    if recorder: recorder.close()
+    if tts: tts.stop()
+    if hardware and not hardware.simulated:
+        bt_manager.disconnect_device()
+
+
+
+if __name__ == '__main__': # Main function
+    server = serve()
+    start_services("sim" if "--sim" in sys.argv[1:] else None)
+
     try:
-        app.run(host='0.0.0.0', port=5000) # Start the web server
+        server.serve_forever() # Start the web server
 
     finally:
-        if _left_pwm: _left_pwm.stop()
-        if _right_pwm: _right_pwm.stop()
-        GPIO.cleanup() # Cleans up all GPIO ports upon exit
-
-        tts.stop()
-        bt_manager.disconnect_device()
\ No newline at end of file
+        shutdown()
@@ -1,6 +1,6 @@
 """
 Separate Web Server for NaviGlass
-Reads state from objectDetection.py via JSON files
+Reads state and frames from objectDetection.py via shared memory (JSON files as fallback)
 Provides API and video streaming for static frontend
 """
 
@@ -10,6 +10,11 @@ import json
 import os
 import time
 import subprocess
+import threading
+from contextlib import contextmanager
+from SharedStateChannel import SharedStateChannel
+from MetricsRegistry import METRICS, PROMETHEUS_CONTENT_TYPE
+from AsyncLogger import LOG
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for GitHub Pages
@@ -19,10 +24,94 @@ STATE_FILE = "naviglass_state.json"
 SETTINGS_FILE = "naviglass_settings.json"
 FRAME_FILE = "current_frame.jpg"
 CONFIG_FILE = "last_device.txt"
+FRAME_POLL_INTERVAL = 0.02 # Only a sequence number read per poll, the frame is copied when it changes
+SSE_KEEPALIVE = 15.0
+REATTACH_INTERVAL = 1.0 # Seconds between checks for a restarted detector while the state is stale
+
+_channel = None
+_channel_lock = threading.Lock() # Guards _channel and _channel_users across request threads
+_channel_users = {} # id(channel) -> threads reading it right now; a replaced channel closes when this drops to 0
+_last_reattach = 0.0
+_last_state = (-1, None)
+
+LOG.set_rate_limit("frame_read_error", 5.0)
+LOG.set_rate_limit("state_read_error", 5.0)
+
+_m_frames_sent = METRICS.counter("naviglass_web_frames_sent_total", "MJPEG frames relayed to viewers")
+_m_frame_read = METRICS.histogram("naviglass_web_frame_read_seconds", "Copying a new frame out of shared memory")
+_m_detections_sent = METRICS.counter("naviglass_web_detection_events_total", "Detection SSE events relayed")
+_m_video_clients = METRICS.gauge("naviglass_web_video_clients", "Open /video_feed streams")
+_m_stale_state = METRICS.counter("naviglass_web_stale_state_total", "Status reads that found the detector state stale")
+METRICS.gauge("naviglass_web_detector_attached", "1 while the detector's shared memory is mapped").set_function(
+    lambda: 1 if _channel is not None else 0)
+
+
+def get_channel():
+    """Map the detector's shared memory block, retrying until it exists. Call with _channel_lock held."""
+    global _channel
+    if _channel is None:
+        try:
+            _channel = SharedStateChannel()
+            print("Attached to detector shared memory.")
+        except FileNotFoundError:
+            return None
+    return _channel
+
+
+@contextmanager
+def use_channel():
+    """The current channel, or None, held so that a reattach on another thread cannot close it mid-read."""
+    with _channel_lock:
+        channel = get_channel()
+        if channel:
+            _channel_users[id(channel)] = _channel_users.get(id(channel), 0) + 1
+    try:
+        yield channel
+    finally:
+        if channel:
+            with _channel_lock:
+                users = _channel_users.pop(id(channel)) - 1
+                if users:
+                    _channel_users[id(channel)] = users
+                elif channel is not _channel: # Replaced while we read it, we were the last user
+                    channel.close()
+
+
+def reattach(channel):
+    """Map the detector's block again if it was recreated since channel was attached, at most once a second."""
+    global _channel, _last_reattach, _last_state
+    with _channel_lock:
+        now = time.monotonic()
+        if channel is not _channel or now - _last_reattach < REATTACH_INTERVAL:
+            return
+        _last_reattach = now
+        if not channel.replaced():
+            return
+        try:
+            _channel = SharedStateChannel()
+        except FileNotFoundError:
+            return
+        _last_state = (-1, None)
+        print("Detector restarted, attached to its new shared memory.")
+        if not _channel_users.get(id(channel)):
+            channel.close()
 
 
 def read_state():
     """Read current state from object detection script."""
+    global _last_state
+    with use_channel() as channel:
+        if channel:
+            seq, state = channel.read_state(_last_state[0])
+            if state is not None: # Only unpacked when the detector published something new
+                _last_state = (seq, state)
+            state = _last_state[1]
+            if state is None or time.time() - state["timestamp"] > 5:
+                _m_stale_state.inc()
+                reattach(channel) # Detector may have restarted with a fresh block
+                return {"distance": 999, "urgent": False, "timestamp": 0, "stale": True}
+            return state
+
     if os.path.exists(STATE_FILE):
         try:
             with open(STATE_FILE, "r") as f:
@@ -32,7 +121,7 @@ def read_state():
                     return {"distance": 999, "urgent": False, "timestamp": 0, "stale": True}
                 return state
         except Exception as e:
-            print(f"Failed to read state: {e}")
+            LOG.error("state_read_error", error=repr(e))
     
     return {"distance": 999, "urgent": False, "timestamp": 0, "disconnected": True}
 
@@ -68,10 +157,36 @@ def write_settings(settings):
 
 def generate_frames():
     """Stream video frames."""
-    # Create a placeholder image if frame file doesn't exist
+    _m_video_clients.inc()
+    try:
+        yield from _frames()
+    finally:
+        _m_video_clients.dec()
+
+
+def _frames():
     placeholder_shown = False
-    
+    last_seq = -1
+    last_channel = None
+
     while True:
+        with use_channel() as channel:
+            if channel:
+                if channel is not last_channel: # New block, its sequence numbers start over
+                    last_seq, last_channel = -1, channel
+                channel.heartbeat() # Tells the detector someone is watching so it keeps encoding
+                t0 = time.perf_counter()
+                last_seq, frame_data = channel.read_frame(last_seq)
+        if channel:
+            if frame_data:
+                _m_frame_read.observe(time.perf_counter() - t0)
+                _m_frames_sent.inc()
+                placeholder_shown = False
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n')
+            time.sleep(FRAME_POLL_INTERVAL)
+            continue
+
         if os.path.exists(FRAME_FILE):
             try:
                 with open(FRAME_FILE, "rb") as f:
@@ -82,7 +197,7 @@ def generate_frames():
                     yield (b'--frame\r\n'
                            b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n')
             except Exception as e:
-                print(f"Frame read error: {e}")
+                LOG.error("frame_read_error", error=repr(e))
         else:
             # No frame available - just wait
             if not placeholder_shown:
@@ -92,6 +207,29 @@ def generate_frames():
         time.sleep(0.5)  # Slower polling when no frames
 
 
+def generate_detections():
+    """Stream per-frame detection metadata as Server-Sent Events."""
+    last_seq = -1
+    last_channel = None
+    last_sent = time.time()
+
+    while True:
+        with use_channel() as channel:
+            if channel:
+                if channel is not last_channel:
+                    last_seq, last_channel = -1, channel
+                last_seq, meta = channel.read_metadata(last_seq)
+        if channel:
+            if meta:
+                last_sent = time.time()
+                _m_detections_sent.inc()
+                yield b"data: " + meta + b"\n\n"
+        if time.time() - last_sent > SSE_KEEPALIVE:
+            last_sent = time.time()
+            yield b": keepalive\n\n"
+        time.sleep(FRAME_POLL_INTERVAL if channel else 0.5)
+
+
 @app.route('/')
 def index():
     return jsonify({
@@ -105,6 +243,29 @@ def video_feed():
     return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
+@app.route('/api/detections')
+def api_detections():
+    return Response(generate_detections(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/api/metrics')
+def api_metrics():
+    """Prometheus scrape target for the web server process."""
+    return Response(METRICS.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.route('/api/log_level', methods=['GET', 'POST'])
+def api_log_level():
+    """Get or set this process's log level, e.g. POST {"level": "DEBUG"}."""
+    if request.method == 'POST':
+        try:
+            LOG.set_level((request.json or {}).get('level'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        LOG.info("log_level_changed", level=LOG.level_name())
+    return jsonify(LOG.stats())
+
+
 @app.route('/api/status')
 def api_status():
     state = read_state()
@@ -113,6 +274,7 @@ def api_status():
     return jsonify({
         "distance": state.get("distance", 999),
         "urgent": state.get("urgent", False),
+        "label": state.get("label"),
         "vibration_intensity": settings.get("vibration_intensity", 1.0),
         "timestamp": state.get("timestamp", 0)
     })
@@ -131,7 +293,7 @@ def api_set_vibration():
                 settings['vibration_intensity'] = val
                 
                 if write_settings(settings):
-                    print(f"Vibration intensity set to {val}")
+                    LOG.info("vibration_intensity_set", intensity=val)
                     return jsonify({"status": "success", "intensity": val})
         except (ValueError, TypeError):
             pass